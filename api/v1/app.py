@@ -1,14 +1,33 @@
-from flask import Flask, request, jsonify, make_response
-from flask_cors import CORS
-from azure.storage.blob import BlobServiceClient
+import logging
 import os
-from api.v1.views import app_views
-from flask_swagger_ui import get_swaggerui_blueprint
+import time
+
+from api.v1.utils.lazy import PROFILE_STARTUP, profile_imports
+
+if PROFILE_STARTUP:
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+_startup = time.perf_counter()
+
+with profile_imports():
+    from flask import Flask, request, jsonify, make_response
+    from flask_cors import CORS
+    from api.v1.views import app_views
+    from api.v1.utils import admission, compression, telemetry
+    from api.v1.utils.serialization import FastJSONProvider
 
 app = Flask(__name__)
+app.json = FastJSONProvider(app)
 app.register_blueprint(app_views)
+telemetry.init_app(app)
+admission.init_app(app)
+compression.init_app(app)
 CORS(app, resources={r"/api/v1/*": {"origins": "*"}})
 
+if PROFILE_STARTUP:
+    logging.getLogger(__name__).info(
+        "app ready in %.1f ms", (time.perf_counter() - _startup) * 1000
+    )
+
 # add blueprint for API views
 
 
@@ -0,0 +1,283 @@
+"""Admission control: concurrency lanes for heavy endpoints
+
+PDF reports, /generate and the bootstrap and per-parity comparisons hold a
+worker (or the process pool) for seconds; a burst of them could take every
+worker of the host and stall cheap calls (/status, /profile, /submissions).
+Requests are therefore sorted into lanes before they run:
+
+    heavy   at most ICAR_ADMISSION_HEAVY_LIMIT together, and each route can
+            be held lower (ICAR_ADMISSION_ROUTE_LIMITS, e.g.
+            "pdf=1,generate=2,ci=1") so one cannot crowd out the others:
+                pdf       /compare/<id>?download=true
+                generate  /generate
+                ci        /compare/<id>?ci=true (bootstrap on the process pool)
+                parity    /compare/<id>/by-parity
+    light   everything else, never limited
+
+A heavy request that finds no free slot waits in a bounded queue
+(ICAR_ADMISSION_HEAVY_QUEUE) for up to ICAR_ADMISSION_TIMEOUT seconds. When
+the queue is full or the wait times out it is rejected at once with 503 and
+a Retry-After header, rather than piling up behind the others.
+
+Slots are lock files on /dev/shm held with flock, so the limits hold across
+all worker processes of the host, and a slot is freed even if the worker
+holding it is killed. Defaults are derived from the host's request capacity,
+workers x threads, which gunicorn.conf.py publishes as
+ICAR_ADMISSION_CAPACITY: half of it for heavy requests, and a queue small
+enough to always leave one worker for light requests. ICAR_ADMISSION=0
+turns admission control off.
+
+Admissions, rejections, waits, queue depth and requests in flight per lane
+are published on /api/v1/metrics.
+"""
+
+import hashlib
+import os
+import random
+import tempfile
+import threading
+import time
+
+from flask import g, jsonify, request
+
+from api.v1.utils.telemetry import registry
+
+try:
+    import fcntl
+except ImportError:  # Windows: no admission control
+    fcntl = None
+
+ENABLED = os.getenv("ICAR_ADMISSION", "1") != "0"
+HEAVY = "heavy"
+LIGHT = "light"
+# Routes of the heavy lane (see heavy_route)
+HEAVY_ROUTES = ("pdf", "generate", "ci", "parity")
+
+ADMITTED = registry.counter(
+    "icar_admission_admitted_total", "Requests admitted per lane", ("lane",),
+)
+REJECTED = registry.counter(
+    "icar_admission_rejected_total",
+    "Requests rejected with 503 per lane and reason (queue_full, timeout)", ("lane", "reason"),
+)
+WAIT = registry.histogram(
+    "icar_admission_wait_seconds", "Time admitted requests waited for a slot", ("lane",),
+    buckets=(0.001, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0),
+)
+QUEUE_DEPTH = registry.gauge(
+    "icar_admission_queue_depth", "Requests of this worker waiting for a slot", ("lane",),
+)
+IN_FLIGHT = registry.gauge(
+    "icar_admission_in_flight", "Requests of this worker running per lane", ("lane",),
+)
+
+
+def heavy_route(req):
+    """Name of the heavy route a request is for, or None"""
+    rule = req.url_rule.rule if req.url_rule is not None else None
+    if rule == "/api/v1/generate":
+        return "generate"
+    if rule == "/api/v1/compare/<submission_id>":
+        if req.args.get("download") == "true":
+            return "pdf"
+        if req.args.get("ci") == "true":
+            return "ci"
+    if rule == "/api/v1/compare/<submission_id>/by-parity":
+        return "parity"
+    return None
+
+
+class Rejected(Exception):
+    def __init__(self, reason):
+        super().__init__(reason)
+        self.reason = reason
+
+
+class Slots:
+    """`limit` slots shared by the processes of one host
+
+    Each slot is a lock file; holding its exclusive flock holds the slot.
+    The lock is dropped when the descriptor is closed, including by the
+    kernel when the process dies.
+    """
+
+    def __init__(self, directory, name, limit):
+        self.paths = [os.path.join(directory, f"{name}.{i}") for i in range(limit)]
+
+    def try_acquire(self):
+        """Descriptor of a slot now held, or None if all are taken"""
+        if not self.paths:
+            return None
+        # Start at a random slot so contending processes spread out
+        first = random.randrange(len(self.paths))
+        for path in self.paths[first:] + self.paths[:first]:
+            fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return fd
+            except BlockingIOError:
+                os.close(fd)
+        return None
+
+    @staticmethod
+    def release(fd):
+        os.close(fd)
+
+
+class Lane:
+    """Shared slots for a class of requests, optionally narrowed per route,
+    with a bounded queue of waiting requests"""
+
+    def __init__(self, directory, name, limit, queue, timeout, route_limits=None):
+        self.name = name
+        self.timeout = timeout
+        self.slots = Slots(directory, name, limit)
+        self.queue = Slots(directory, f"{name}.queue", queue)
+        self.routes = {route: Slots(directory, f"{name}.{route}", route_limit)
+                       for route, route_limit in (route_limits or {}).items()}
+
+    def _try_acquire(self, route):
+        """Descriptors held for a route slot and a lane slot, or None"""
+        held = []
+        route_slots = self.routes.get(route)
+        if route_slots is not None:
+            fd = route_slots.try_acquire()
+            if fd is None:
+                return None
+            held.append(fd)
+        fd = self.slots.try_acquire()
+        if fd is None:
+            for fd in held:
+                Slots.release(fd)
+            return None
+        held.append(fd)
+        return held
+
+    def acquire(self, route):
+        """Wait for a slot; returns the descriptors to release, or raises
+        Rejected when the queue is full or the wait times out"""
+        start = time.monotonic()
+        held = self._try_acquire(route)
+        if held is not None:
+            return held
+        ticket = self.queue.try_acquire()
+        if ticket is None:
+            raise Rejected("queue_full")
+        QUEUE_DEPTH.inc(lane=self.name)
+        try:
+            deadline = start + self.timeout
+            delay = 0.005
+            while True:
+                held = self._try_acquire(route)
+                if held is not None:
+                    return held
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise Rejected("timeout")
+                # flock cannot wait with a timeout; poll with jittered backoff
+                time.sleep(min(remaining, delay * random.uniform(0.5, 1.5)))
+                delay = min(delay * 2, 0.05)
+        finally:
+            Slots.release(ticket)
+            QUEUE_DEPTH.dec(lane=self.name)
+
+
+def _setting(name, default):
+    value = os.getenv(name)
+    return int(value) if value else default
+
+
+def _route_limits(default):
+    """Slots per heavy route: the default, or ICAR_ADMISSION_ROUTE_LIMITS"""
+    limits = {route: default for route in HEAVY_ROUTES}
+    for part in os.getenv("ICAR_ADMISSION_ROUTE_LIMITS", "").split(","):
+        route, _, limit = part.partition("=")
+        if route.strip() and limit.strip():
+            limits[route.strip()] = int(limit)
+    return limits
+
+
+def default_directory():
+    base = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+    key = hashlib.sha1(os.getcwd().encode()).hexdigest()[:16]
+    return os.path.join(base, f"icar-admission-{key}")
+
+
+_lane = None
+_lane_lock = threading.Lock()
+
+
+def heavy_lane():
+    """The heavy Lane, built on first use so that it sees the capacity
+    gunicorn publishes after the app was imported"""
+    global _lane
+    if _lane is None:
+        with _lane_lock:
+            if _lane is None:
+                capacity = _setting("ICAR_ADMISSION_CAPACITY", 4)
+                limit = _setting("ICAR_ADMISSION_HEAVY_LIMIT", max(1, capacity // 2))
+                queue = _setting("ICAR_ADMISSION_HEAVY_QUEUE", max(0, capacity - 1 - limit))
+                directory = os.getenv("ICAR_ADMISSION_DIR") or default_directory()
+                os.makedirs(directory, exist_ok=True)
+                _lane = Lane(
+                    directory, HEAVY, limit, queue,
+                    timeout=float(os.getenv("ICAR_ADMISSION_TIMEOUT", "5")),
+                    route_limits=_route_limits(limit),
+                )
+    return _lane
+
+
+def reset():
+    """Rebuild the lane from the environment on next use"""
+    global _lane
+    with _lane_lock:
+        _lane = None
+
+
+# =======================================
+# FLASK HOOKS
+# =======================================
+
+def _before_request():
+    if request.method == "OPTIONS":
+        return None
+    route = heavy_route(request)
+    if route is None:
+        g.admission = (LIGHT, None)
+        IN_FLIGHT.inc(lane=LIGHT)
+        return None
+
+    lane = heavy_lane()
+    start = time.monotonic()
+    try:
+        held = lane.acquire(route)
+    except Rejected as e:
+        REJECTED.inc(lane=lane.name, reason=e.reason)
+        response = jsonify({"success": False, "message": "Server busy, please retry later"})
+        response.status_code = 503
+        response.headers["Retry-After"] = os.getenv("ICAR_ADMISSION_RETRY_AFTER", "5")
+        return response
+    ADMITTED.inc(lane=lane.name)
+    WAIT.observe(time.monotonic() - start, lane=lane.name)
+    g.admission = (lane.name, held)
+    IN_FLIGHT.inc(lane=lane.name)
+    return None
+
+
+def _teardown_request(exc):
+    admission = g.pop("admission", None)
+    if admission is None:
+        return
+    lane, held = admission
+    IN_FLIGHT.dec(lane=lane)
+    for fd in held or ():
+        Slots.release(fd)
+
+
+def init_app(app):
+    """Install the admission hooks on a Flask app (after telemetry, so
+    rejected requests are timed and logged too)"""
+    if not ENABLED or fcntl is None:
+        return
+    app.before_request(_before_request)
+    app.teardown_request(_teardown_request)
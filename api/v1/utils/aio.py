@@ -0,0 +1,181 @@
+"""Async blob I/O, and a bridge for the synchronous Flask views
+
+Views stay synchronous; independent I/O inside a request is expressed as
+coroutines and run together on a per-process event loop:
+
+    link, reference, _ = aio.gather(
+        upload_excel_file_async(excel_bytes, filename),
+        aio.in_thread(select_reference_yields, selected_ids),
+        aio.in_thread(storage.reload),
+    )
+
+Blob calls go through azure.storage.blob.aio when aiohttp is installed
+(ICAR_ASYNC_BLOB=aio) and otherwise through the synchronous clients in
+worker threads (ICAR_ASYNC_BLOB=thread). Either way they overlap with each
+other and with in_thread() work. The caller's context, including Flask's
+request context, is carried into coroutines and threads, so span() timings
+still land in the request's Server-Timing header.
+
+A call that times out cancels the coroutines it was waiting for. shutdown()
+closes the async clients and stops the loop; it runs at interpreter exit
+and from gunicorn's worker_exit hook.
+"""
+
+import asyncio
+import atexit
+import concurrent.futures
+import importlib.util
+import os
+import threading
+
+from api.v1.utils import compression
+from api.v1.utils.lazy import lazy_from
+
+AsyncBlobServiceClient = lazy_from("azure.storage.blob.aio", "BlobServiceClient")
+
+BLOB_MODE = os.getenv(
+    "ICAR_ASYNC_BLOB",
+    "aio" if importlib.util.find_spec("aiohttp") is not None else "thread",
+)
+# Longest a view waits on the bridge before giving up
+TIMEOUT = float(os.getenv("ICAR_ASYNC_TIMEOUT", "300"))
+
+_loop = None
+_loop_pid = None
+_loop_thread = None
+_loop_lock = threading.Lock()
+_clients = {}
+
+
+# =======================================
+# EVENT LOOP
+# =======================================
+
+def get_loop():
+    """The per-process event loop, running in a daemon thread.
+
+    Keyed on the pid like the process pool: a forked gunicorn worker
+    inherits the parent's loop object but not its thread.
+    """
+    global _loop, _loop_pid, _loop_thread
+    if _loop is None or _loop_pid != os.getpid():
+        with _loop_lock:
+            if _loop is None or _loop_pid != os.getpid():
+                loop = asyncio.new_event_loop()
+                thread = threading.Thread(target=loop.run_forever, name="icar-aio", daemon=True)
+                thread.start()
+                _clients.clear()
+                _loop, _loop_pid, _loop_thread = loop, os.getpid(), thread
+    return _loop
+
+
+def run(coro, timeout=TIMEOUT):
+    """Run a coroutine on the background loop and wait for its result; on
+    timeout the coroutine is cancelled before TimeoutError is raised"""
+    # run_coroutine_threadsafe schedules from this thread, so the task starts
+    # with a copy of the caller's context (flask.g, request)
+    future = asyncio.run_coroutine_threadsafe(coro, get_loop())
+    try:
+        return future.result(timeout)
+    except concurrent.futures.TimeoutError:
+        # Cancels the task on the loop, and with it whatever it awaits
+        future.cancel()
+        raise
+
+
+def shutdown(timeout=5):
+    """Close this process's async blob clients and stop its event loop.
+
+    Tasks still running are cancelled first. A no-op in a process that
+    never started a loop, e.g. a worker forked after the master used one.
+    """
+    global _loop, _loop_pid, _loop_thread
+    with _loop_lock:
+        if _loop is None or _loop_pid != os.getpid():
+            return
+        loop, thread = _loop, _loop_thread
+        _loop = _loop_pid = _loop_thread = None
+        clients = list(_clients.values())
+        _clients.clear()
+
+    async def _close():
+        tasks = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await asyncio.gather(*(client.close() for client in clients), return_exceptions=True)
+
+    try:
+        asyncio.run_coroutine_threadsafe(_close(), loop).result(timeout)
+    except Exception:
+        pass
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join(timeout)
+    if not loop.is_running():
+        loop.close()
+
+
+atexit.register(shutdown)
+
+
+def gather(*aws, timeout=TIMEOUT):
+    """Run awaitables concurrently and return their results in order.
+
+    The first exception is raised once everything has finished, so no
+    half-done work is left running behind the request. On timeout every
+    awaitable still running is cancelled (see run()); work already handed
+    to a thread by in_thread() finishes there, unobserved.
+    """
+    async def _gather():
+        results = await asyncio.gather(*aws, return_exceptions=True)
+        for result in results:
+            if isinstance(result, BaseException):
+                raise result
+        return results
+    return run(_gather(), timeout)
+
+
+async def in_thread(func, *args, **kwargs):
+    """Await a blocking call made in a worker thread"""
+    return await asyncio.to_thread(func, *args, **kwargs)
+
+
+# =======================================
+# BLOBS
+# =======================================
+
+def _client(conn):
+    """aio BlobServiceClient for a connection string, created on (and only
+    used from) the background loop"""
+    client = _clients.get(conn)
+    if client is None:
+        client = _clients[conn] = AsyncBlobServiceClient.from_connection_string(conn)
+    return client
+
+
+def _sync_client(conn):
+    from api.v1.utils.datasets import blob_service_client
+    return blob_service_client(conn)
+
+
+async def download_blob(conn, container, blob):
+    """Bytes of a blob, decoded if it was stored gzip or zstd compressed"""
+    if BLOB_MODE == "aio":
+        blob_client = _client(conn).get_container_client(container).get_blob_client(blob)
+        download = await blob_client.download_blob(decompress=False)
+        data = await download.readall()
+    else:
+        blob_client = _sync_client(conn).get_container_client(container).get_blob_client(blob)
+        data = await in_thread(lambda: blob_client.download_blob(decompress=False).readall())
+    return compression.decode(data)
+
+
+async def upload_blob(conn, container, blob, data, **kwargs):
+    """Upload bytes (overwriting); kwargs go to upload_blob, e.g.
+    content_settings"""
+    kwargs.setdefault("overwrite", True)
+    if BLOB_MODE == "aio":
+        blob_client = _client(conn).get_container_client(container).get_blob_client(blob)
+        return await blob_client.upload_blob(data, **kwargs)
+    blob_client = _sync_client(conn).get_container_client(container).get_blob_client(blob)
+    return await in_thread(blob_client.upload_blob, data, **kwargs)
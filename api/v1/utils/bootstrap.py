@@ -0,0 +1,88 @@
+"""Bootstrap confidence intervals for submission metrics
+
+Resamples are drawn as index matrices (one row per resample) and every row
+is evaluated with the segmented metrics engine, so a chunk of resamples is a
+single vectorized call. Chunks are spread over the shared process pool.
+Each chunk draws from its own child of one SeedSequence, so results depend
+only on the seed, never on the number of workers.
+"""
+
+import os
+
+from api.v1.utils.cache import LRUCache
+from api.v1.utils.lazy import lazy_import
+from api.v1.utils.metrics import METRIC_KEYS, grouped_metrics
+from api.v1.utils.pool import pool_map
+from api.v1.utils.telemetry import register_cache, timed
+
+np = lazy_import("numpy")
+
+DEFAULT_RESAMPLES = 10000
+MAX_RESAMPLES = 100000
+DEFAULT_SEED = 0
+DEFAULT_CONFIDENCE = 0.95
+# Resamples evaluated per task; bounds each task's index matrix
+CHUNK_SIZE = int(os.getenv("ICAR_BOOTSTRAP_CHUNK_SIZE", "1000"))
+
+bootstrap_cache = LRUCache(maxsize=int(os.getenv("ICAR_BOOTSTRAP_CACHE_SIZE", "256")))
+register_cache("bootstrap", bootstrap_cache)
+
+
+def _bootstrap_chunk(task):
+    """Evaluate one chunk of resamples; returns a (metrics, resamples) array"""
+    true, pred, n_resamples, seed_seq = task
+    n = len(true)
+    rng = np.random.default_rng(seed_seq)
+    idx = rng.integers(0, n, size=(n_resamples, n))
+    groups = np.repeat(np.arange(n_resamples), n)
+    columns = grouped_metrics(true[idx].ravel(), pred[idx].ravel(), groups, n_resamples)
+    return np.vstack([columns[key] for key in METRIC_KEYS])
+
+
+@timed("metrics.bootstrap")
+def bootstrap_metrics(true, pred, n_resamples=DEFAULT_RESAMPLES, seed=DEFAULT_SEED,
+                      confidence=DEFAULT_CONFIDENCE):
+    """Percentile bootstrap intervals for every metric.
+
+    Args:
+        true: Reference values.
+        pred: Submitted values, paired with true.
+        n_resamples: Number of bootstrap resamples.
+        seed: Seed of the resampling RNG.
+        confidence: Two-sided confidence level, e.g. 0.95.
+
+    Returns:
+        dict: METRIC_KEYS mapped to {"lower", "upper", "std"}, or None when
+        fewer than two valid pairs are available.
+    """
+    true = np.asarray(true, dtype=float)
+    pred = np.asarray(pred, dtype=float)
+    valid = ~(np.isnan(true) | np.isnan(pred))
+    true, pred = true[valid], pred[valid]
+    if len(true) < 2:
+        return None
+
+    n_chunks = -(-n_resamples // CHUNK_SIZE)
+    sizes = [CHUNK_SIZE] * (n_chunks - 1) + [n_resamples - CHUNK_SIZE * (n_chunks - 1)]
+    seeds = np.random.SeedSequence(seed).spawn(n_chunks)
+    tasks = [(true, pred, size, seed_seq) for size, seed_seq in zip(sizes, seeds)]
+    samples = np.hstack(pool_map(_bootstrap_chunk, tasks))
+
+    tail = (1 - confidence) / 2 * 100
+    lower, upper = np.percentile(samples, [tail, 100 - tail], axis=1)
+    std = samples.std(axis=1, ddof=1)
+    return {
+        key: {"lower": float(lower[i]), "upper": float(upper[i]), "std": float(std[i])}
+        for i, key in enumerate(METRIC_KEYS)
+    }
+
+
+def submission_confidence_intervals(submission, true, pred, n_resamples=DEFAULT_RESAMPLES,
+                                    seed=DEFAULT_SEED, confidence=DEFAULT_CONFIDENCE):
+    """bootstrap_metrics() for a submission, cached per submission version"""
+    key = (submission.id, submission.updated_at.isoformat(), n_resamples, seed, confidence)
+    result = bootstrap_cache.get(key)
+    if result is None:
+        result = bootstrap_metrics(true, pred, n_resamples, seed, confidence)
+        bootstrap_cache.put(key, result)
+    return result
@@ -0,0 +1,233 @@
+"""Small thread-safe caches: in-process, and of files on local disk"""
+
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+_MISSING = object()
+
+
+class LRUCache:
+    """Bounded least-recently-used mapping with hit/miss counters"""
+
+    def __init__(self, maxsize=128):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key, default=None):
+        """Return the cached value and mark it as recently used"""
+        with self._lock:
+            value = self._data.get(key, _MISSING)
+            if value is _MISSING:
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        """Store a value, evicting the least recently used entries"""
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def pop(self, key, default=None):
+        with self._lock:
+            return self._data.pop(key, default)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        """Current size and counters"""
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+
+class DiskLRUCache:
+    """Files in one directory, capped at max_bytes by least recent access
+
+    Recency is the file's access time, set explicitly on every hit (mounts
+    with relatime or noatime would not), so worker processes sharing the
+    directory evict in one order. Files are written to a temporary name and
+    renamed into place; a reader never sees part of one. Eviction rescans
+    the directory and removes the least recently used files until the
+    total is back under `low_water` of the cap.
+    """
+
+    def __init__(self, directory, max_bytes, low_water=0.9):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.low_water = low_water
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._bytes = None  # total size, from the last scan plus own writes
+        self._files = 0
+        self._lock = threading.Lock()
+        self._fills = {}  # name -> [lock held while that file is filled, users]
+
+    def path(self, name):
+        return os.path.join(self.directory, name)
+
+    def valid_name(self, name):
+        """Whether name can be a cached file: a plain, non-hidden file name"""
+        return bool(name) and os.path.basename(name) == name and not name.startswith(".")
+
+    def get(self, name):
+        """Path of a cached file, marked as recently used; None on a miss"""
+        if not self.valid_name(name):
+            return None
+        path = self.path(name)
+        try:
+            st = os.stat(path)
+            os.utime(path, ns=(time.time_ns(), st.st_mtime_ns))
+        except OSError:
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return path
+
+    def put(self, name, data):
+        """Store bytes under name, evicting older files past the cap;
+        returns the file's path"""
+        if not self.valid_name(name):
+            raise ValueError(f"Invalid cache file name: {name!r}")
+        os.makedirs(self.directory, exist_ok=True)
+        path = self.path(name)
+        fd, temp = tempfile.mkstemp(dir=self.directory, prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            try:
+                replaced = os.stat(path).st_size
+            except FileNotFoundError:
+                replaced = None
+            os.replace(temp, path)
+        except BaseException:
+            try:
+                os.unlink(temp)
+            except OSError:
+                pass
+            raise
+        with self._lock:
+            if self._bytes is None:
+                self._scan()
+            elif replaced is None:
+                self._bytes += len(data)
+                self._files += 1
+            else:
+                self._bytes += len(data) - replaced
+            over = self._bytes > self.max_bytes
+        if over:
+            self.evict(keep=name)
+        return path
+
+    def fetch(self, name, loader):
+        """Path of a cached file, filling it with loader() -> bytes on a miss.
+        Concurrent misses on one name in this process call loader once;
+        loader returning None (nothing to fill with) gives None."""
+        path = self.get(name)
+        if path is not None or not self.valid_name(name):
+            return path
+        with self._lock:
+            # Counted, so the lock is only dropped once no one waits on it
+            fill = self._fills.setdefault(name, [threading.Lock(), 0])
+            fill[1] += 1
+        try:
+            with fill[0]:
+                if os.path.exists(self.path(name)):
+                    return self.path(name)  # filled while waiting
+                data = loader()
+                return None if data is None else self.put(name, data)
+        finally:
+            with self._lock:
+                fill[1] -= 1
+                if not fill[1]:
+                    del self._fills[name]
+
+    def _entries(self):
+        """(atime, size, name) of every cached file"""
+        entries = []
+        try:
+            scan = os.scandir(self.directory)
+        except FileNotFoundError:
+            return entries
+        with scan:
+            for entry in scan:
+                if entry.name.startswith("."):
+                    continue
+                try:
+                    st = entry.stat()
+                except OSError:
+                    continue  # evicted meanwhile
+                entries.append((st.st_atime_ns, st.st_size, entry.name))
+        return entries
+
+    def _scan(self):
+        entries = self._entries()
+        self._bytes = sum(size for _, size, _ in entries)
+        self._files = len(entries)
+        return entries
+
+    def evict(self, keep=None):
+        """Remove least recently used files until under the low-water mark"""
+        with self._lock:
+            entries = sorted(self._scan())
+            target = self.max_bytes * self.low_water
+            for _, size, name in entries:
+                if self._bytes <= target:
+                    break
+                if name == keep:
+                    continue
+                try:
+                    os.unlink(self.path(name))
+                except FileNotFoundError:
+                    continue  # another worker evicted it
+                self._bytes -= size
+                self._files -= 1
+                self.evictions += 1
+
+    def clear(self):
+        """Remove every cached file"""
+        with self._lock:
+            for _, _, name in self._entries():
+                try:
+                    os.unlink(self.path(name))
+                except FileNotFoundError:
+                    pass
+            self._bytes = self._files = 0
+
+    def stats(self):
+        """Current size and counters"""
+        with self._lock:
+            if self._bytes is None:
+                self._scan()
+            return {
+                "size": self._files,
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
@@ -0,0 +1,195 @@
+"""Grouped comparison of generated, submitted and actual yields
+
+Yields are aligned by integer TestId with sorted-array joins
+(argsort + searchsorted) instead of per-id dictionary lookups, and split
+into the parity groups 1, 2 and 3+ with a handful of NumPy operations.
+"""
+
+from api.v1.utils.lazy import lazy_import
+from api.v1.utils.metrics import PARITY_GROUPS, parity_group_codes, submission_metrics
+
+np = lazy_import("numpy")
+pd = lazy_import("pandas")
+
+
+class InvalidTestIds(ValueError):
+    """A submission's TestIds include no number at all"""
+
+
+def parse_ids(ids):
+    """(int64 array, valid mask) of TestIds given as ints, floats or numeric
+    strings; entries that are not numbers are masked out"""
+    numbers = np.asarray(pd.to_numeric(ids if ids is not None else [], errors="coerce"),
+                         dtype=float)
+    valid = np.isfinite(numbers)
+    return np.where(valid, numbers, 0).astype(np.int64), valid
+
+
+def int_ids(ids):
+    """Convert TestIds to an int64 array, dropping those that are not numbers"""
+    ids, valid = parse_ids(ids)
+    return ids[valid]
+
+
+class SortedLookup:
+    """Map integer keys to float values through a sorted key array"""
+
+    def __init__(self, keys, values):
+        keys, valid = parse_ids(keys)
+        values = np.asarray(values, dtype=float)
+        if len(keys) != len(values):
+            raise ValueError("Keys and values must have the same length")
+        keys, values = keys[valid], values[valid]
+        # Stable sort, then keep the last value of duplicated keys like a dict would
+        order = np.argsort(keys, kind="stable")
+        keys, values = keys[order], values[order]
+        last = np.ones(len(keys), dtype=bool)
+        last[:-1] = keys[1:] != keys[:-1]
+        self.keys = keys[last]
+        self.values = values[last]
+
+    def __len__(self):
+        return len(self.keys)
+
+    def positions(self, query):
+        """Return (index into keys, found mask) for every query key; keys
+        that are not numbers are never found"""
+        query, valid = parse_ids(query)
+        if not len(self.keys):
+            return np.zeros(len(query), dtype=np.intp), np.zeros(len(query), dtype=bool)
+        pos = np.searchsorted(self.keys, query)
+        pos = np.minimum(pos, len(self.keys) - 1)
+        return pos, valid & (self.keys[pos] == query)
+
+    def get(self, query):
+        """Look up query keys; missing keys give NaN"""
+        pos, found = self.positions(query)
+        if not len(self.keys):
+            return np.full(len(pos), np.nan)
+        return np.where(found, self.values[pos], np.nan)
+
+    @classmethod
+    def from_frame(cls, df, key_col="TestId", value_col="TotalActualProduction"):
+        """Build a lookup from a reference DataFrame (e.g. ActualMilkYields)"""
+        df = df.rename(columns=lambda c: c.strip())
+        return cls(df[key_col].to_numpy(), df[value_col].to_numpy())
+
+
+def aligned_yields(generate_obj, submission_obj):
+    """
+    Align generate/submission yields by shared TestId.
+    Returns (test_ids, internal_yields, external_yields) arrays in submission order.
+    TestIds that are not numbers are skipped; raises InvalidTestIds if the
+    submission has no numeric one.
+    """
+    generated = SortedLookup(
+        generate_obj.test_obj_ids or [], generate_obj.calculated_milk_yields or []
+    )
+    submitted = SortedLookup(
+        submission_obj.test_obj_ids or [], submission_obj.calculated_milk_yields or []
+    )
+    # Submission order, first occurrence of every id
+    sub_ids = submitted_ids(submission_obj)
+    _, first = np.unique(sub_ids, return_index=True)
+    sub_ids = sub_ids[np.sort(first)]
+
+    pos, found = generated.positions(sub_ids)
+    test_ids = sub_ids[found]
+    return test_ids, generated.values[pos[found]], submitted.get(test_ids)
+
+
+def submitted_ids(submission_obj):
+    """Numeric TestIds of a submission; InvalidTestIds if it has ids but no
+    numeric one"""
+    ids = int_ids(submission_obj.test_obj_ids or [])
+    if submission_obj.test_obj_ids and not len(ids):
+        raise InvalidTestIds("Submission contains no numeric Test IDs")
+    return ids
+
+
+class ParityComparison:
+    """Generated (RCALY), submitted (SCALY) and actual (ALY) yields of one
+    submission, aligned by TestId and labelled with their parity group.
+
+    Only animals present in both the generated test set and the submission
+    are kept, in test-set order. Animals without an actual yield carry NaN.
+    """
+
+    def __init__(self, test_ids, reference, submitted, actual, codes):
+        self.test_ids = test_ids
+        self.reference = reference
+        self.submitted = submitted
+        self.actual = actual
+        self.codes = codes
+
+    @classmethod
+    def from_objects(cls, generate_obj, submission_obj, actual_lookup):
+        """Join a Generate, its Submission and the actual-yield lookup;
+        TestIds that are not numbers are skipped (see aligned_yields)"""
+        submitted_ids(submission_obj)
+        gen_ids, valid = parse_ids(generate_obj.test_obj_ids or [])
+        reference = np.asarray(generate_obj.calculated_milk_yields or [], dtype=float)
+        n = min(len(gen_ids), len(reference))
+        parity = list(generate_obj.parity or [])
+        n = min(n, len(parity))
+        valid = valid[:n]
+        gen_ids, reference = gen_ids[:n][valid], reference[:n][valid]
+        codes = parity_group_codes(parity[:n])[valid]
+
+        submitted_lookup = SortedLookup(
+            submission_obj.test_obj_ids or [], submission_obj.calculated_milk_yields or []
+        )
+        pos, found = submitted_lookup.positions(gen_ids)
+        test_ids = gen_ids[found]
+        return cls(
+            test_ids=test_ids,
+            reference=reference[found],
+            submitted=submitted_lookup.values[pos[found]],
+            actual=actual_lookup.get(test_ids),
+            codes=codes[found],
+        )
+
+    def group(self, label):
+        """Arrays of one parity group"""
+        mask = self.codes == PARITY_GROUPS.index(label)
+        return {
+            "test_ids": self.test_ids[mask],
+            "reference": self.reference[mask],
+            "submitted": self.submitted[mask],
+            "actual": self.actual[mask],
+        }
+
+    def counts(self):
+        """Per-group (animals, animals with an actual yield) counts"""
+        n_groups = len(PARITY_GROUPS)
+        grouped = self.codes >= 0
+        total = np.bincount(self.codes[grouped], minlength=n_groups)
+        known = np.bincount(
+            self.codes[grouped & ~np.isnan(self.actual)], minlength=n_groups
+        )
+        return {label: (int(total[i]), int(known[i])) for i, label in enumerate(PARITY_GROUPS)}
+
+    def reportable_groups(self, min_size=2):
+        """Groups with enough animals to report, in PARITY_GROUPS order"""
+        return [
+            label for label, (total, known) in self.counts().items()
+            if total >= min_size and known >= min_size
+        ]
+
+    def metrics(self):
+        """Metrics of every group against the reference and actual yields.
+
+        Returns {"reference": {...}, "actual": {...}}, each holding the
+        "overall" and "by_parity" output of submission_metrics().
+        """
+        reference, actual = submission_metrics([
+            (self.reference, self.submitted, self.codes),
+            (self.actual, self.submitted, self.codes),
+        ])
+        return {"reference": reference, "actual": actual}
+
+
+def json_values(values):
+    """Float array to a JSON-safe list (NaN becomes None)"""
+    values = np.asarray(values, dtype=float)
+    return [None if v != v else v for v in values.tolist()]
@@ -0,0 +1,156 @@
+"""Compression of stored blobs and of API responses
+
+Blobs: the storage document (ICAR_STORAGE_ENCODING, default gzip) is
+uploaded compressed with a matching Content-Encoding, and reference datasets
+may be uploaded the same way. Downloads are decoded by their magic bytes, so
+compressed and plain blobs (including ones written before compression was
+enabled) load alike:
+
+    data = decode(blob_client.download_blob(decompress=False).readall())
+
+Responses: init_app() compresses compressible responses of at least
+ICAR_COMPRESS_MIN_BYTES (default 1024) with the best encoding the client
+accepts: br (needs the brotli package), gzip, or zstd (needs zstandard).
+ICAR_COMPRESS_RESPONSES=0 turns this off, e.g. behind a proxy that already
+compresses.
+
+Levels favour speed: everything is compressed on the request path.
+"""
+
+import gzip
+import os
+
+from flask import request
+
+from api.v1.utils.telemetry import registry, span
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - optional
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - optional
+    zstandard = None
+
+IDENTITY = "identity"
+LEVELS = {"gzip": 1, "br": 4, "zstd": 3}
+
+STORAGE_ENCODING = os.getenv("ICAR_STORAGE_ENCODING", "gzip")
+COMPRESS_RESPONSES = os.getenv("ICAR_COMPRESS_RESPONSES", "1") != "0"
+COMPRESS_MIN_BYTES = int(os.getenv("ICAR_COMPRESS_MIN_BYTES", "1024"))
+COMPRESSIBLE_TYPES = {
+    "application/json",
+    "application/javascript",
+    "application/xml",
+    "image/svg+xml",
+}
+
+_MAGIC = {
+    b"\x1f\x8b": "gzip",
+    b"\x28\xb5\x2f\xfd": "zstd",
+}
+
+RESPONSE_BYTES = registry.counter(
+    "icar_response_bytes_total", "Response body bytes before and after compression",
+    ("encoding", "stage"),
+)
+
+
+def available():
+    """Encodings this process can produce, best first"""
+    encodings = []
+    if brotli is not None:
+        encodings.append("br")
+    encodings.append("gzip")
+    if zstandard is not None:
+        encodings.append("zstd")
+    return encodings
+
+
+def compress(data, encoding):
+    """data encoded with `encoding` ("identity" returns it unchanged)"""
+    if encoding in (None, "", IDENTITY):
+        return data
+    if encoding == "gzip":
+        return gzip.compress(data, LEVELS["gzip"], mtime=0)
+    if encoding == "zstd" and zstandard is not None:
+        return zstandard.ZstdCompressor(level=LEVELS["zstd"]).compress(data)
+    if encoding == "br" and brotli is not None:
+        return brotli.compress(data, quality=LEVELS["br"])
+    raise ValueError(f"Unsupported or unavailable encoding: {encoding}")
+
+
+def sniff(data):
+    """Encoding of data judged by its magic bytes ("identity" if none)"""
+    for magic, encoding in _MAGIC.items():
+        if data[:len(magic)] == magic:
+            return encoding
+    return IDENTITY
+
+
+def decode(data):
+    """Plain bytes of a blob that may be gzip or zstd compressed"""
+    encoding = sniff(data)
+    if encoding == "gzip":
+        return gzip.decompress(data)
+    if encoding == "zstd":
+        if zstandard is None:
+            raise RuntimeError("Blob is zstd compressed; install zstandard to read it")
+        return zstandard.ZstdDecompressor().decompressobj().decompress(data)
+    return data
+
+
+def storage_encoding():
+    """Encoding for the storage document, falling back to gzip when the
+    configured one is not available here"""
+    if STORAGE_ENCODING == "zstd" and zstandard is None:
+        return "gzip"
+    return STORAGE_ENCODING
+
+
+# =======================================
+# RESPONSES
+# =======================================
+
+def _compressible(response):
+    if response.direct_passthrough or response.is_streamed:
+        return False
+    if response.status_code < 200 or response.status_code in (204, 206, 304):
+        return False
+    if "Content-Encoding" in response.headers:
+        return False
+    mimetype = response.mimetype or ""
+    return mimetype.startswith("text/") or mimetype in COMPRESSIBLE_TYPES
+
+
+def _after_request(response):
+    if request.method == "HEAD" or not _compressible(response):
+        return response
+    response.vary.add("Accept-Encoding")
+    if response.content_length is not None and response.content_length < COMPRESS_MIN_BYTES:
+        return response
+    encoding = request.accept_encodings.best_match(available())
+    if encoding is None:
+        return response
+    body = response.get_data()
+    if len(body) < COMPRESS_MIN_BYTES:
+        return response
+    with span("response.compress"):
+        compressed = compress(body, encoding)
+    RESPONSE_BYTES.inc(len(body), encoding=encoding, stage="raw")
+    RESPONSE_BYTES.inc(len(compressed), encoding=encoding, stage="sent")
+    response.set_data(compressed)
+    response.headers["Content-Encoding"] = encoding
+    if response.headers.get("ETag"):
+        # The representation changed; keep validators distinct per encoding
+        tag, weak = response.get_etag()
+        response.set_etag(f"{tag}-{encoding}", weak)
+    return response
+
+
+def init_app(app):
+    """Install negotiated response compression on a Flask app"""
+    if COMPRESS_RESPONSES:
+        app.after_request(_after_request)
@@ -0,0 +1,197 @@
+"""Read-only reference datasets, loaded once per process
+
+The test dataset (TestDataSet.csv), the actual yields (ActualMilkYields.csv)
+and the TIM reference yields derived from the test dataset never change while
+the app runs, so they are downloaded and parsed once and then shared. When
+they are loaded in the gunicorn master before forking (see warmup.py), every
+worker reads the same copy-on-write pages instead of keeping its own copy.
+
+Returned DataFrames are shared between requests and must not be modified.
+"""
+
+import os
+import threading
+from io import BytesIO
+
+from dotenv import load_dotenv
+
+from api.v1.utils import compression
+from api.v1.utils.comparison import SortedLookup
+from api.v1.utils.lazy import lazy_from, lazy_import
+from api.v1.utils.telemetry import timed
+
+load_dotenv()
+
+pd = lazy_import("pandas")
+BlobServiceClient = lazy_from("azure.storage.blob", "BlobServiceClient")
+lc_test_interval_method = lazy_from("lactationcurve.characteristics", "test_interval_method")
+
+# Dataset and Azure setup (datasets may live in a different container/account than the app JSON)
+AZURE_STORAGE_CONNECTION_STRING = os.getenv("AZURE_STORAGE_CONNECTION_STRING")
+AZURE_DATASET_STORAGE_CONNECTION_STRING = os.getenv("AZURE_DATASET_STORAGE_CONNECTION_STRING")
+AZURE_DATASET_CONTAINER_NAME = os.getenv("AZURE_DATASET_CONTAINER_NAME", "icarwebsite")
+# BLOB_DATASET_NAME / FULL_DATASET_PATH are filenames only; blob keys are dataset/<filename>
+TEST_DATASET_BLOB_PATH = os.getenv("AZURE_DATASET_BLOB_PATH") or (
+    f"dataset/{os.getenv('BLOB_DATASET_NAME', 'TestDataSet.csv').lstrip('/')}"
+)
+ACTUAL_DATASET_BLOB_PATH = os.getenv("AZURE_DATASET_BLOB_PATH") or (
+    f"dataset/{os.getenv('FULL_DATASET_PATH', 'ActualMilkYields.csv').lstrip('/')}"
+)
+
+_cache = {}
+_cache_lock = threading.RLock()
+_clients = {}
+_clients_pid = None
+
+
+# =======================================
+# BLOB CLIENTS
+# =======================================
+
+def blob_service_client(conn):
+    """Shared BlobServiceClient for a connection string.
+
+    Clients hold HTTP connection pools that must not be shared across a
+    fork, so they are cached per process id.
+    """
+    global _clients_pid
+    if _clients_pid != os.getpid():
+        _clients.clear()
+        _clients_pid = os.getpid()
+    client = _clients.get(conn)
+    if client is None:
+        client = _clients[conn] = BlobServiceClient.from_connection_string(conn)
+    return client
+
+
+def reset_clients():
+    """Forget every blob client (call in a freshly forked worker)"""
+    global _clients_pid
+    _clients.clear()
+    _clients_pid = None
+
+
+@timed("blob.download")
+def download_dataset(blob_path):
+    """Bytes of a dataset blob, decompressed if it was uploaded gzip or zstd
+    compressed"""
+    conn = AZURE_DATASET_STORAGE_CONNECTION_STRING or AZURE_STORAGE_CONNECTION_STRING
+    if not conn:
+        raise ValueError(
+            "AZURE_STORAGE_CONNECTION_STRING or AZURE_DATASET_STORAGE_CONNECTION_STRING must be set"
+        )
+    container_client = blob_service_client(conn).get_container_client(AZURE_DATASET_CONTAINER_NAME)
+    blob_client = container_client.get_blob_client(blob_path)
+    if not blob_client.exists():
+        raise FileNotFoundError(
+            f"Dataset blob not found: {AZURE_DATASET_CONTAINER_NAME}/{blob_path}"
+        )
+    return compression.decode(blob_client.download_blob(decompress=False).readall())
+
+
+# =======================================
+# CACHED DATASETS
+# =======================================
+
+def _cached(name, loader):
+    value = _cache.get(name)
+    if value is None:
+        with _cache_lock:
+            value = _cache.get(name)
+            if value is None:
+                value = _cache[name] = loader()
+    return value
+
+
+def loaded():
+    """Names of the datasets already held in memory"""
+    return sorted(_cache)
+
+
+def clear():
+    """Drop every cached dataset; the next access downloads it again"""
+    with _cache_lock:
+        _cache.clear()
+
+
+def test_dataset():
+    """Parsed TestDataSet.csv (test-day records of every animal)"""
+    return _cached(
+        "test_dataset", lambda: pd.read_csv(BytesIO(download_dataset(TEST_DATASET_BLOB_PATH)))
+    )
+
+
+def actual_yields():
+    """Parsed ActualMilkYields.csv with stripped column names"""
+    def load():
+        df = pd.read_csv(BytesIO(download_dataset(ACTUAL_DATASET_BLOB_PATH)))
+        df.columns = df.columns.str.strip()
+        return df
+    return _cached("actual_yields", load)
+
+
+def actual_lookup():
+    """TestId -> actual 305-day yield"""
+    return _cached("actual_lookup", lambda: SortedLookup.from_frame(actual_yields()))
+
+
+def reference_yields():
+    """TIM 305-day yields of every animal in the test dataset.
+
+    The method works per TestId, so the yields of any generated subset are
+    the matching rows of this table.
+    """
+    return _cached(
+        "reference_yields", lambda: estimate_yields_with_lactationcurve(test_dataset())
+    )
+
+
+@timed("tim.estimate")
+def estimate_yields_with_lactationcurve(df):
+    """
+    Calculate 305-day yields via the installed `lactationcurve` package and
+    normalize output to columns: TestId, Total305Yield.
+    """
+
+    required_cols = ["DaysInMilk", "DailyMilkingYield", "TestId"]
+    missing = [c for c in required_cols if c not in df.columns]
+    if missing:
+        raise ValueError(f"Missing required columns for lactationcurve: {missing}")
+
+    input_df = df[required_cols].copy()
+
+    result_df = lc_test_interval_method(
+        input_df,
+        days_in_milk_col="DaysInMilk",
+        milking_yield_col="DailyMilkingYield",
+        test_id_col="TestId",
+    )
+
+    if not isinstance(result_df, pd.DataFrame):
+        raise ValueError("lactationcurve test_interval_method did not return a DataFrame.")
+
+    if result_df.empty:
+        return pd.DataFrame(columns=["TestId", "Total305Yield"])
+
+    normalized_names = {c: c.lower().replace(" ", "").replace("_", "") for c in result_df.columns}
+    test_id_col = None
+    yield_col = None
+
+    for col, norm in normalized_names.items():
+        if norm in {"testid", "testids", "id"} and test_id_col is None:
+            test_id_col = col
+        if norm in {"total305yield", "totalyield", "total305", "predicted305yield"} and yield_col is None:
+            yield_col = col
+
+    if test_id_col is None or yield_col is None:
+        if len(result_df.columns) >= 2:
+            test_id_col = result_df.columns[0]
+            yield_col = result_df.columns[1]
+        else:
+            raise ValueError(
+                f"Unexpected lactationcurve output columns: {list(result_df.columns)}"
+            )
+
+    normalized_df = result_df[[test_id_col, yield_col]].copy()
+    normalized_df.columns = ["TestId", "Total305Yield"]
+    return normalized_df
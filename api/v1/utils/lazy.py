@@ -0,0 +1,177 @@
+"""Deferred imports and import-time profiling for fast worker start-up
+
+Heavy dependencies (pandas, NumPy, the Azure SDK, FPDF/matplotlib) are bound
+to proxies that import the real module on first attribute access, so a worker
+can answer /status without paying for them. Set ICAR_LAZY_IMPORTS=0 to import
+everything eagerly instead (e.g. when the app is preloaded before forking).
+
+With ICAR_PROFILE_STARTUP=1 (or `python -m api.v1.app --profile-startup`)
+the cost of every import made during start-up, and of every deferred import
+when it is finally resolved, is logged.
+"""
+
+import importlib
+import importlib.abc
+import logging
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+LAZY_IMPORTS = os.getenv("ICAR_LAZY_IMPORTS", "1") != "0"
+PROFILE_STARTUP = (
+    os.getenv("ICAR_PROFILE_STARTUP", "0") == "1" or "--profile-startup" in sys.argv
+)
+
+# Module name -> seconds spent importing it (cumulative, including submodules)
+import_timings = {}
+_import_lock = threading.RLock()
+
+
+def _import(name):
+    with _import_lock:
+        if name in sys.modules:
+            return sys.modules[name]
+        start = time.perf_counter()
+        module = importlib.import_module(name)
+        elapsed = time.perf_counter() - start
+    import_timings[name] = elapsed
+    if PROFILE_STARTUP:
+        logger.info("deferred import %s took %.1f ms", name, elapsed * 1000)
+    return module
+
+
+class LazyModule:
+    """Stand-in for a module that is imported on first attribute access"""
+
+    def __init__(self, name):
+        self.__dict__["_lazy_name"] = name
+
+    def _load(self):
+        module = _import(self._lazy_name)
+        # Later lookups become plain instance-dict hits
+        self.__dict__.update(module.__dict__)
+        self.__dict__["_lazy_module"] = module
+        return module
+
+    def __getattr__(self, attr):
+        module = self.__dict__.get("_lazy_module") or self._load()
+        return getattr(module, attr)
+
+    def __repr__(self):
+        return f"<lazy module {self._lazy_name!r}>"
+
+
+class LazyAttribute:
+    """Stand-in for `from module import name`, resolved on first use"""
+
+    def __init__(self, module_name, attr):
+        self._module_name = module_name
+        self._attr = attr
+        self._target = None
+
+    def _resolve(self):
+        if self._target is None:
+            self._target = getattr(_import(self._module_name), self._attr)
+        return self._target
+
+    def __call__(self, *args, **kwargs):
+        return self._resolve()(*args, **kwargs)
+
+    def __getattr__(self, attr):
+        if attr.startswith("_"):
+            raise AttributeError(attr)
+        return getattr(self._resolve(), attr)
+
+    def __repr__(self):
+        return f"<lazy {self._module_name}.{self._attr}>"
+
+
+def lazy_import(name):
+    """`import name`, deferred until first use unless ICAR_LAZY_IMPORTS=0"""
+    if not LAZY_IMPORTS or name in sys.modules:
+        return _import(name)
+    return LazyModule(name)
+
+
+def lazy_from(module_name, attr):
+    """`from module_name import attr`, deferred like lazy_import()"""
+    if not LAZY_IMPORTS or module_name in sys.modules:
+        return getattr(_import(module_name), attr)
+    return LazyAttribute(module_name, attr)
+
+
+class _TimedLoader:
+    """Wraps a module loader to time exec_module()"""
+
+    def __init__(self, loader, name, timings):
+        self._loader = loader
+        self._name = name
+        self._timings = timings
+
+    def create_module(self, spec):
+        return self._loader.create_module(spec)
+
+    def exec_module(self, module):
+        start = time.perf_counter()
+        try:
+            self._loader.exec_module(module)
+        finally:
+            self._timings.append((self._name, time.perf_counter() - start))
+
+    def __getattr__(self, attr):
+        return getattr(self._loader, attr)
+
+
+class _TimingFinder(importlib.abc.MetaPathFinder):
+    """Meta path hook that times every module imported while installed"""
+
+    def __init__(self):
+        self.timings = []
+        self._finding = threading.local()
+
+    def find_spec(self, name, path, target=None):
+        if getattr(self._finding, "active", False):
+            return None
+        self._finding.active = True
+        try:
+            spec = None
+            for finder in sys.meta_path:
+                if finder is self or not hasattr(finder, "find_spec"):
+                    continue
+                spec = finder.find_spec(name, path, target)
+                if spec is not None:
+                    break
+        finally:
+            self._finding.active = False
+        if spec is None or spec.loader is None or not hasattr(spec.loader, "exec_module"):
+            return spec
+        spec.loader = _TimedLoader(spec.loader, name, self.timings)
+        return spec
+
+
+@contextmanager
+def profile_imports(label="start-up", top=25):
+    """Log the slowest imports made inside the block when profiling is on.
+
+    Timings are cumulative (a package includes the submodules it pulls in),
+    like `python -X importtime`.
+    """
+    if not PROFILE_STARTUP:
+        yield
+        return
+    finder = _TimingFinder()
+    sys.meta_path.insert(0, finder)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        sys.meta_path.remove(finder)
+        total = time.perf_counter() - start
+        logger.info("%s imports took %.1f ms (%d modules)", label, total * 1000,
+                    len(finder.timings))
+        for name, elapsed in sorted(finder.timings, key=lambda t: -t[1])[:top]:
+            logger.info("  %8.1f ms  %s", elapsed * 1000, name)
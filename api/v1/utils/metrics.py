@@ -0,0 +1,197 @@
+"""Vectorized evaluation metrics for ICAR submissions
+
+Every metric (Pearson r, RMSE, MAE, MAPE) is computed with segmented NumPy
+reductions, so any number of (reference, submitted) vector pairs - several
+submissions, each split by parity - is evaluated in a single pass.
+"""
+
+from api.v1.utils.lazy import lazy_import
+
+from api.v1.utils.telemetry import timed
+
+np = lazy_import("numpy")
+
+METRIC_KEYS = (
+    "pearson_correlation",
+    "mean_absolute_error",
+    "mean_absolute_percentage_error",
+    "root_mean_squared_error",
+)
+
+# Parity buckets used throughout the reports; parity >= 3 is pooled as "3+"
+PARITY_GROUPS = ("1", "2", "3+")
+
+
+def parity_group_codes(parity):
+    """Map raw parity values to indexes into PARITY_GROUPS.
+
+    Missing, unparseable and zero parities map to -1 (no group).
+    """
+    try:
+        numeric = np.asarray(parity, dtype=float)
+    except (TypeError, ValueError):
+        numeric = np.array([_to_float(p) for p in parity], dtype=float)
+    numeric = np.where(np.isfinite(numeric), np.trunc(numeric), 0)
+    codes = np.minimum(numeric, len(PARITY_GROUPS)).astype(np.intp) - 1
+    codes[numeric < 1] = -1
+    return codes
+
+
+def _to_float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return np.nan
+
+
+def grouped_metrics(true, pred, groups, n_groups):
+    """Compute every metric for each segment of paired vectors.
+
+    Args:
+        true: Reference values.
+        pred: Submitted values, paired element-wise with true.
+        groups: Segment index of each pair in [0, n_groups); negative
+            indexes are ignored.
+        n_groups: Number of segments.
+
+    Returns:
+        dict: METRIC_KEYS mapped to float arrays of length n_groups. Pairs
+        with a NaN on either side are dropped; segments with fewer than two
+        pairs get zeros, and constant segments get a zero correlation.
+    """
+    true = np.asarray(true, dtype=float)
+    pred = np.asarray(pred, dtype=float)
+    groups = np.asarray(groups, dtype=np.intp)
+
+    valid = ~(np.isnan(true) | np.isnan(pred)) & (groups >= 0)
+    t, p, g = true[valid], pred[valid], groups[valid]
+
+    n = np.bincount(g, minlength=n_groups)
+    safe_n = np.maximum(n, 1)
+
+    # Pearson correlation from centered sums
+    mean_t = np.bincount(g, t, n_groups) / safe_n
+    mean_p = np.bincount(g, p, n_groups) / safe_n
+    dt = t - mean_t[g]
+    dp = p - mean_p[g]
+    sxy = np.bincount(g, dt * dp, n_groups)
+    denom = np.sqrt(np.bincount(g, dt * dt, n_groups) * np.bincount(g, dp * dp, n_groups))
+
+    # Rounding leaves constant vectors with tiny deviations, so test min == max
+    t_min = np.full(n_groups, np.inf)
+    t_max = np.full(n_groups, -np.inf)
+    p_min = np.full(n_groups, np.inf)
+    p_max = np.full(n_groups, -np.inf)
+    np.minimum.at(t_min, g, t)
+    np.maximum.at(t_max, g, t)
+    np.minimum.at(p_min, g, p)
+    np.maximum.at(p_max, g, p)
+    constant = (t_min == t_max) | (p_min == p_max) | (denom == 0)
+    pearson = np.clip(sxy / np.where(constant, 1.0, denom), -1.0, 1.0)
+    pearson[constant] = 0.0
+
+    diff = t - p
+    mae = np.bincount(g, np.abs(diff), n_groups) / safe_n
+    rmse = np.sqrt(np.bincount(g, diff * diff, n_groups) / safe_n)
+
+    # MAPE ignores pairs whose reference is zero
+    nonzero = t != 0
+    n_nonzero = np.bincount(g[nonzero], minlength=n_groups)
+    ape = np.abs(diff[nonzero] / t[nonzero])
+    mape = np.bincount(g[nonzero], ape, n_groups) / np.maximum(n_nonzero, 1) * 100
+
+    result = {
+        "pearson_correlation": pearson,
+        "mean_absolute_error": mae,
+        "mean_absolute_percentage_error": mape,
+        "root_mean_squared_error": rmse,
+    }
+    too_small = n < 2
+    for values in result.values():
+        values[too_small] = 0.0
+    return result
+
+
+def _rows(columns, index):
+    """Pick one segment out of grouped_metrics() output as a plain dict"""
+    return {key: float(columns[key][index]) for key in METRIC_KEYS}
+
+
+@timed("metrics.batch")
+def batch_metrics(pairs):
+    """Compute metrics for many (true, pred) pairs in one call.
+
+    Returns a list of metric dicts in the order of pairs.
+    """
+    pairs = list(pairs)
+    if not pairs:
+        return []
+    trues = [np.asarray(t, dtype=float).ravel() for t, _ in pairs]
+    preds = [np.asarray(p, dtype=float).ravel() for _, p in pairs]
+    for t, p in zip(trues, preds):
+        if len(t) != len(p):
+            raise ValueError("Reference and submitted vectors must have the same length")
+    lengths = [len(t) for t in trues]
+    groups = np.repeat(np.arange(len(pairs)), lengths)
+    columns = grouped_metrics(np.concatenate(trues), np.concatenate(preds), groups, len(pairs))
+    return [_rows(columns, i) for i in range(len(pairs))]
+
+
+@timed("metrics.calculate")
+def calculate_metrics(true, pred):
+    """
+    Calculate evaluation metrics between true and predicted values.
+
+    Args:
+        true (list): True values.
+        pred (list): Predicted values.
+
+    Returns:
+        dict: A dictionary containing the calculated metrics.
+    """
+    return batch_metrics([(true, pred)])[0]
+
+
+def submission_metrics(items):
+    """Overall and per-parity metrics for many submissions in one pass.
+
+    Args:
+        items: Iterable of (true, pred, parity_codes) triples with aligned
+            vectors; parity_codes come from parity_group_codes().
+
+    Returns:
+        list: One {"overall": {...}, "by_parity": {"1": {...}, ...}} dict
+        per item.
+    """
+    items = list(items)
+    if not items:
+        return []
+    stride = 1 + len(PARITY_GROUPS)
+    trues, preds, groups = [], [], []
+    for i, (true, pred, codes) in enumerate(items):
+        true = np.asarray(true, dtype=float).ravel()
+        pred = np.asarray(pred, dtype=float).ravel()
+        codes = np.asarray(codes, dtype=np.intp).ravel()
+        if not (len(true) == len(pred) == len(codes)):
+            raise ValueError("Reference, submitted and parity vectors must have the same length")
+        base = i * stride
+        trues += [true, true]
+        preds += [pred, pred]
+        groups += [
+            np.full(len(true), base, dtype=np.intp),
+            np.where(codes >= 0, base + 1 + codes, -1),
+        ]
+    columns = grouped_metrics(
+        np.concatenate(trues), np.concatenate(preds), np.concatenate(groups),
+        len(items) * stride,
+    )
+    return [
+        {
+            "overall": _rows(columns, i * stride),
+            "by_parity": {
+                label: _rows(columns, i * stride + 1 + j)
+                for j, label in enumerate(PARITY_GROUPS)
+            },
+        }
+        for i in range(len(items))
+    ]
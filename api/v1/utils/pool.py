@@ -0,0 +1,58 @@
+"""Process pool shared by CPU-bound helpers (plot rendering, resampling)"""
+
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+# ICAR_PROCESS_POOL_WORKERS=0 disables the pool; callers then run serially.
+POOL_WORKERS = int(os.getenv(
+    "ICAR_PROCESS_POOL_WORKERS", str(min(4, os.cpu_count() or 1))
+))
+POOL_START_METHOD = os.getenv("ICAR_PROCESS_POOL_START_METHOD", "spawn")
+
+_pool = None
+_pool_pid = None
+
+
+def get_process_pool():
+    """Return the per-process pool, creating it on first use.
+
+    The pool is keyed on the current pid so a forked gunicorn worker never
+    reuses an executor that belongs to its parent.
+    """
+    global _pool, _pool_pid
+    if POOL_WORKERS <= 0:
+        return None
+    if _pool is None or _pool_pid != os.getpid():
+        _pool = ProcessPoolExecutor(
+            max_workers=POOL_WORKERS,
+            mp_context=multiprocessing.get_context(POOL_START_METHOD),
+        )
+        _pool_pid = os.getpid()
+    return _pool
+
+
+def reset_process_pool():
+    """Drop the current pool so the next call starts a fresh one"""
+    global _pool, _pool_pid
+    if _pool is not None and _pool_pid == os.getpid():
+        _pool.shutdown(wait=False, cancel_futures=True)
+    _pool = None
+    _pool_pid = None
+
+
+def pool_map(func, items):
+    """Map func over items in the process pool, falling back to serial.
+
+    Results are returned in input order. Small batches and a disabled or
+    broken pool run in the calling process.
+    """
+    items = list(items)
+    pool = get_process_pool() if len(items) > 1 else None
+    if pool is not None:
+        try:
+            return list(pool.map(func, items))
+        except BrokenProcessPool:
+            reset_process_pool()
+    return [func(item) for item in items]
@@ -0,0 +1,414 @@
+"""PDF rendering pipeline for ICAR comparison reports
+
+Scatter plots are drawn on a single reused matplotlib figure per process,
+rendered in parallel through the shared process pool and handed to FPDF as
+pre-decoded image data, so no temporary files are written. The header logos
+are decoded once when this module is imported.
+"""
+
+import logging
+import os
+import zlib
+from io import BytesIO
+
+import numpy as np
+from fpdf import FPDF
+from PIL import Image
+
+from api.v1.utils.pool import pool_map
+
+logger = logging.getLogger(__name__)
+
+# Directories searched for the header logos, in order of preference
+_REPO_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(
+    os.path.dirname(os.path.abspath(__file__))
+)))
+LOGO_DIRS = [
+    os.path.join(os.getcwd(), "frontend", "public"),
+    os.path.join(os.getcwd(), "api", "v1", "views"),
+    os.getcwd(),
+    os.path.join(_REPO_ROOT, "frontend", "public"),
+    _REPO_ROOT,
+]
+LOGO_FILES = {
+    "icar": "icar-logo.png",
+    "bovi": "Bovi-Analytics-Transparent.png",
+}
+
+PLOT_DPI = 150
+PLOT_FIGSIZE = (5, 3)
+
+
+# =======================================
+# IMAGE DECODING
+# =======================================
+
+def _png_rows(pixels):
+    """Prefix every scanline with a PNG 'None' filter byte"""
+    h = pixels.shape[0]
+    rows = pixels.reshape(h, -1)
+    return np.hstack([np.zeros((h, 1), dtype=np.uint8), rows]).tobytes()
+
+
+def image_info(png_bytes, keep_alpha=True):
+    """Decode PNG bytes into the image dictionary FPDF embeds.
+
+    FPDF 1.7.2 only reads images from disk and splits alpha channels with a
+    per-row Python loop; building the dictionary with numpy avoids both.
+    """
+    with Image.open(BytesIO(png_bytes)) as img:
+        has_alpha = keep_alpha and (
+            img.mode in ("RGBA", "LA") or "transparency" in img.info
+        )
+        pixels = np.asarray(img.convert("RGBA" if has_alpha else "RGB"))
+
+    h, w = pixels.shape[:2]
+    info = {
+        'w': w,
+        'h': h,
+        'cs': 'DeviceRGB',
+        'bpc': 8,
+        'f': 'FlateDecode',
+        'dp': f'/Predictor 15 /Colors 3 /BitsPerComponent 8 /Columns {w}',
+        'pal': '',
+        'trns': '',
+        'data': zlib.compress(_png_rows(np.ascontiguousarray(pixels[..., :3]))),
+    }
+    if has_alpha:
+        info['smask'] = zlib.compress(_png_rows(np.ascontiguousarray(pixels[..., 3])))
+    return info
+
+
+def load_logos():
+    """Locate and decode the header logos. Missing files are skipped."""
+    logos = {}
+    for name, filename in LOGO_FILES.items():
+        for base in LOGO_DIRS:
+            path = os.path.join(base, filename)
+            if not os.path.exists(path):
+                continue
+            try:
+                with open(path, "rb") as f:
+                    logos[name] = image_info(f.read())
+            except Exception as e:
+                logger.warning("Could not load logo %s: %s", path, e)
+            break
+    return logos
+
+
+LOGOS = load_logos()
+
+
+class ReportPDF(FPDF):
+    """FPDF that accepts already-decoded images instead of file paths"""
+
+    def image_from_info(self, key, info, x=None, y=None, w=0, h=0):
+        """Place an image described by an image_info() dictionary"""
+        if key not in self.images:
+            # FPDF drops the image data after output(), so keep our own copy
+            info = dict(info)
+            info['i'] = len(self.images) + 1
+            self.images[key] = info
+        self.image(key, x=x, y=y, w=w, h=h)
+
+
+# =======================================
+# PLOTS
+# =======================================
+
+_figure = None
+
+
+def _scatter_axes():
+    """Return the process-wide figure and its cleared axes"""
+    global _figure
+    if _figure is None:
+        from matplotlib.figure import Figure
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+        _figure = Figure(figsize=PLOT_FIGSIZE)
+        FigureCanvasAgg(_figure)
+        _figure.add_subplot()
+    ax = _figure.axes[0]
+    ax.cla()
+    return _figure, ax
+
+
+def scatter_spec(x_vals, y_vals, title, xlabel, ylabel, color, add_45_line=False):
+    """Bundle everything needed to draw one scatter plot"""
+    return {
+        "x": np.asarray(x_vals, dtype=float),
+        "y": np.asarray(y_vals, dtype=float),
+        "title": title,
+        "xlabel": xlabel,
+        "ylabel": ylabel,
+        "color": color,
+        "add_45_line": add_45_line,
+    }
+
+
+def render_scatter(spec):
+    """Draw a scatter spec and return its FPDF image dictionary"""
+    fig, ax = _scatter_axes()
+    x_vals, y_vals = spec["x"], spec["y"]
+    ax.scatter(x_vals, y_vals, s=20, alpha=0.6, color=spec["color"],
+               edgecolors="white", linewidth=0.3)
+
+    # Add 45-degree line with high transparency if requested
+    if spec["add_45_line"] and np.isfinite(x_vals).any() and np.isfinite(y_vals).any():
+        min_val = min(np.nanmin(x_vals), np.nanmin(y_vals))
+        max_val = max(np.nanmax(x_vals), np.nanmax(y_vals))
+        ax.plot([min_val, max_val], [min_val, max_val], 'k--', alpha=0.25, linewidth=1.2)
+
+    ax.set_title(spec["title"], fontsize=10, fontweight='bold', pad=10)
+    ax.set_xlabel(spec["xlabel"], fontsize=9, fontweight='bold')
+    ax.set_ylabel(spec["ylabel"], fontsize=9, fontweight='bold')
+    ax.tick_params(axis='both', labelsize=8)
+    ax.grid(True, linestyle="--", linewidth=0.5, alpha=0.5, color='gray')
+    ax.spines['top'].set_visible(False)
+    ax.spines['right'].set_visible(False)
+    fig.tight_layout()
+
+    buf = BytesIO()
+    fig.savefig(buf, format="png", dpi=PLOT_DPI, bbox_inches="tight", facecolor='white')
+    # The figure background is opaque, so the alpha channel carries nothing
+    return image_info(buf.getvalue(), keep_alpha=False)
+
+
+def render_scatters(specs):
+    """Render scatter specs in parallel, preserving order"""
+    return pool_map(render_scatter, specs)
+
+
+# =======================================
+# REPORT LAYOUT
+# =======================================
+
+INTRO_TEXT = (
+    "This report compares the results of the calculation of cumulative milk yield per lactation "
+    "(calculated over 305 days) of the organization (SCALY) with the reference calculation of ICAR "
+    "for the chosen method (RCALY) and with the actual milk production of the cow for that lactation (ALY). "
+    "The reference calculations are coming from the ICAR guideline Procedure 2 of section 2 "
+    "(https://www.icar.org/Guidelines/02-Procedure-2-Computing-Lactation-Yield.pdf). "
+    "The actual milk production is obtained by measuring the cow's milk yield every day and summing "
+    "these daily values to determine the true 305-day milk yield.\n\n"
+    "We acknowledge that even when the same methods are applied, variability in results can occur due to "
+    "differences in standard lactation curves; therefore, complete agreement is not realistic.\n\n"
+    "The calculation of the organization is evaluated using four different metrics: R², root mean squared error (RMSE), "
+    "mean absolute error (MAE), and mean absolute percentage error (MAPE). The results are presented in a table with "
+    "two rows: the first compares the organization's calculation with the reference calculation, and the second compares "
+    "the organization's calculation with the actual cumulative milk yield.\n\n"
+    "To analyze the results further, the calculation is also evaluated by parity, using only the milk recordings of "
+    "cows in each category and applying the same evaluation metrics."
+)
+
+
+def build_comparison_pdf(details, user_name, overall, parity_sections):
+    """Lay out the comparison report and return it as a BytesIO.
+
+    overall and every entry of parity_sections are dicts with a "title",
+    the "primary" (RCALY) and "icar" (ALY) metrics, and a list of scatter
+    "plots" built with scatter_spec(). All plots are rendered up front in
+    one parallel batch before the layout starts.
+    """
+    sections = [overall] + list(parity_sections)
+    specs = [spec for section in sections for spec in section["plots"]]
+    images = iter(render_scatters(specs))
+
+    pdf = ReportPDF()
+    pdf.add_page()
+    pdf.set_auto_page_break(auto=True, margin=20)
+
+    # ===== HEADER WITH LOGOS =====
+    y_pos = 10
+    if "bovi" in LOGOS:
+        pdf.image_from_info("logo-bovi", LOGOS["bovi"], x=15, y=y_pos, w=25)
+    if "icar" in LOGOS:
+        pdf.image_from_info("logo-icar", LOGOS["icar"], x=170, y=y_pos, w=25)
+
+    # Title with better styling
+    pdf.set_font("Arial", 'B', 18)
+    pdf.set_text_color(0, 0, 128)
+    pdf.ln(8)
+    pdf.cell(0, 12, "Cumulative Milk Yield Calculation Report", ln=True, align="C")
+    pdf.ln(2)
+
+    # Add a decorative line
+    pdf.set_draw_color(0, 109, 132)
+    pdf.set_line_width(0.5)
+    pdf.line(20, pdf.get_y(), 190, pdf.get_y())
+    pdf.ln(8)
+
+    # Report details with better formatting
+    rows = [
+        ("Name of Organization:", details['organization']),
+        ("Report generated on:", details['date_reported']),
+        ("Report Requested By:", user_name.title()),
+        ("Method of Calculation Applied:", details['calculation_method']),
+        ("Test Set ID:", details['test_set_id']),
+        ("Country:", details['country'] if details['country'] else "N/A"),
+    ]
+    pdf.set_text_color(0, 0, 0)
+    for label, value in rows:
+        pdf.set_font("Arial", 'B', 11)
+        pdf.cell(60, 7, label, 0, 0)
+        pdf.set_font("Arial", '', 11)
+        pdf.cell(0, 7, value, ln=True)
+    pdf.ln(8)
+
+    # ===== Introduction Section =====
+    pdf.set_font("Arial", 'B', 13)
+    pdf.set_fill_color(201, 227, 242)
+    pdf.set_text_color(0, 0, 128)
+    pdf.cell(190, 9, "Introduction", ln=True, fill=True)
+    pdf.ln(5)
+
+    pdf.set_font("Arial", '', 10)
+    pdf.set_text_color(0, 0, 0)
+    pdf.multi_cell(0, 6, INTRO_TEXT)
+    pdf.ln(6)
+
+    # ===== TABLE STRUCTURE =====
+    # Make each column with the same width
+    col_widths = [38, 38, 38, 38, 38]
+    headers = ["Comparison", "R²", "RMSE", "MAE", "MAPE"]
+
+    def draw_metrics_table(section_name, primary_metrics, icar_metrics):
+        """Draws a 2-row metrics table with professional styling."""
+        # Section header with better styling
+        pdf.set_font("Arial", 'B', 13)
+        pdf.set_fill_color(201, 227, 242)
+        pdf.set_text_color(0, 0, 128)
+        pdf.cell(190, 9, section_name, ln=True, fill=True)
+        pdf.ln(4)
+
+        # Table header with bold styling
+        pdf.set_font("Arial", 'B', 10)
+        pdf.set_text_color(255, 255, 255)
+        pdf.set_fill_color(0, 109, 132)
+        for h, w in zip(headers, col_widths):
+            pdf.cell(w, 9, h, 1, 0, 'C', fill=True)
+        pdf.ln()
+
+        # Row 1 — Reference Calculation (RCALY)
+        pdf.set_font("Arial", 'B', 10)
+        pdf.set_text_color(0, 0, 0)
+        pdf.set_fill_color(245, 245, 245)
+        pdf.cell(col_widths[0], 9, "RCALY", 1, 0, 'L', fill=True)
+        pdf.set_font("Arial", '', 10)
+        pdf.set_fill_color(255, 255, 255)
+        pdf.cell(col_widths[1], 9, f"{primary_metrics['pearson_correlation']:.3f}", 1, 0, 'C', fill=True)
+        pdf.cell(col_widths[2], 9, f"{primary_metrics['root_mean_squared_error']:.2f}", 1, 0, 'C', fill=True)
+        pdf.cell(col_widths[3], 9, f"{primary_metrics['mean_absolute_error']:.2f}", 1, 0, 'C', fill=True)
+        pdf.cell(col_widths[4], 9, f"{primary_metrics['mean_absolute_percentage_error']:.2f}%", 1, 0, 'C', fill=True)
+        pdf.ln()
+
+        # Row 2 — Actual Accumulated (ALY)
+        pdf.set_fill_color(0, 109, 132)
+        pdf.set_text_color(255, 255, 255)
+        pdf.set_font("Arial", 'B', 10)
+        pdf.cell(col_widths[0], 9, "ALY", 1, 0, 'L', fill=True)
+        pdf.set_font("Arial", '', 10)
+        pdf.set_fill_color(230, 240, 245)
+        pdf.set_text_color(0, 0, 0)
+        pdf.cell(col_widths[1], 9, f"{icar_metrics['pearson_correlation']:.3f}", 1, 0, 'C', fill=True)
+        pdf.cell(col_widths[2], 9, f"{icar_metrics['root_mean_squared_error']:.2f}", 1, 0, 'C', fill=True)
+        pdf.cell(col_widths[3], 9, f"{icar_metrics['mean_absolute_error']:.2f}", 1, 0, 'C', fill=True)
+        pdf.cell(col_widths[4], 9, f"{icar_metrics['mean_absolute_percentage_error']:.2f}%", 1, 0, 'C', fill=True)
+        pdf.ln(12)
+
+    def add_plots(section):
+        """Insert the section's pre-rendered plots"""
+        for _ in section["plots"]:
+            if pdf.get_y() > 160:
+                pdf.add_page()
+            # Every plot is a distinct image, so key it by its resource index
+            pdf.image_from_info(f"plot-{len(pdf.images)}", next(images), x=15, w=180)
+            pdf.ln(8)
+
+    # ===== Overall Section =====
+    draw_metrics_table(overall["title"], overall["primary"], overall["icar"])
+
+    # Add Abbreviations Section with better styling
+    pdf.set_font("Arial", 'B', 9)
+    pdf.set_text_color(0, 0, 128)
+    pdf.cell(0, 6, "Abbreviations Used:", ln=True)
+    pdf.ln(2)
+    pdf.set_font("Arial", '', 9)
+    pdf.set_text_color(60, 60, 60)
+    pdf.multi_cell(0, 5,
+        "RCALY - Reference Calculated Accumulated Lactation Yield\n"
+        "SCALY - Submitted Calculated Accumulated Lactation Yield\n"
+        "ALY - Actual Accumulated Lactation Yield"
+    )
+    pdf.ln(6)
+    pdf.set_text_color(0, 0, 0)
+
+    add_plots(overall)
+
+    # ===== Parity-specific Sections with Header =====
+    if parity_sections:
+        if pdf.get_y() > 180:
+            pdf.add_page()
+
+        pdf.set_font("Arial", 'B', 13)
+        pdf.set_fill_color(201, 227, 242)
+        pdf.set_text_color(0, 0, 128)
+        pdf.cell(190, 9, "Calculation Evaluation per Parity", ln=True, fill=True)
+        pdf.ln(6)
+
+    for section in parity_sections:
+        draw_metrics_table(section["title"], section["primary"], section["icar"])
+        add_plots(section)
+
+    # ===== Appendix =====
+    if pdf.get_y() > 180:
+        pdf.add_page()
+
+    pdf.set_font("Arial", 'B', 13)
+    pdf.set_fill_color(201, 227, 242)
+    pdf.set_text_color(0, 0, 128)
+    pdf.cell(190, 9, "Appendix", ln=True, fill=True)
+    pdf.ln(5)
+
+    pdf.set_text_color(0, 0, 0)
+    pdf.set_font("Arial", 'B', 10)
+    pdf.cell(0, 7, "Data set we gave them + result that they gave back", ln=True)
+    pdf.ln(4)
+
+    # Download links with better styling
+    if 'dataset_link' in details:
+        pdf.set_text_color(0, 0, 255)
+        pdf.set_font("Arial", 'U', 10)
+        pdf.cell(0, 8, "Download TestSet used for the calculation", ln=True,
+                 link='http://localhost:5000/' + details['dataset_link'])
+        pdf.ln(4)
+
+    # Disclaimer with better styling
+    pdf.set_font("Arial", 'B', 10)
+    pdf.set_text_color(0, 0, 0)
+    pdf.cell(0, 7, "Disclaimer", ln=True)
+    pdf.ln(2)
+    pdf.set_font("Arial", '', 9)
+    pdf.set_text_color(60, 60, 60)
+    pdf.multi_cell(0, 5,
+        "All submitted data will be collected for research purposes by the Cornell Bovi-Analytics lab. "
+        "Any publications based on this data will be fully anonymized."
+    )
+    pdf.ln(6)
+
+    # Contact information with better styling
+    pdf.set_font("Arial", 'B', 10)
+    pdf.set_text_color(0, 0, 0)
+    pdf.cell(0, 7, "Contact Information", ln=True)
+    pdf.ln(2)
+    pdf.set_font("Arial", '', 9)
+    pdf.set_text_color(60, 60, 60)
+    pdf.multi_cell(0, 5,
+        "For questions or support, contact: mbv32@cornell.edu\n\n"
+        "Interested in what the Bovi-Analytics lab is doing? "
+        "See https://bovi-analytics.org/ and https://www.linkedin.com/company/bovi-analytics/"
+    )
+
+    pdf_bytes = pdf.output(dest='S').encode('latin-1')
+    return BytesIO(pdf_bytes)
@@ -0,0 +1,89 @@
+"""JSON encoding for API responses and the storage document
+
+orjson is used when it is installed; it is several times faster than the json
+module on documents the size of the storage blob or the admin /submissions
+list. Without it the json module does the work. Either way NumPy scalars and
+arrays are serialized as plain numbers and lists, so views and models can
+hand over NumPy results without converting them first. NaN becomes null with
+orjson (NaN is not valid JSON, and the frontend shows a missing metric for
+null) and stays NaN with the json module.
+"""
+
+import json
+
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional speedup
+    orjson = None
+
+if orjson is not None:
+    _OPTIONS = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+
+
+def _numpy_default(obj):
+    """Plain Python value of a NumPy scalar or array (anything with tolist())"""
+    tolist = getattr(obj, "tolist", None)
+    if tolist is None:
+        raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+    return tolist()
+
+
+def dumps(obj):
+    """Serialize obj to UTF-8 JSON bytes"""
+    if orjson is not None:
+        return orjson.dumps(obj, default=_numpy_default, option=_OPTIONS)
+    return json.dumps(obj, default=_numpy_default).encode("utf-8")
+
+
+def loads(data):
+    """Parse JSON from bytes or str"""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def _response_default(obj):
+    if hasattr(obj, "tolist"):
+        return obj.tolist()
+    return DefaultJSONProvider.default(obj)
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """Flask JSON provider backed by orjson, NumPy-aware either way.
+
+    Compact responses go straight to orjson as bytes. Pretty-printed output
+    (debug mode, compact=False) and calls with json.dumps() arguments are
+    left to the json module. Dates keep Flask's HTTP date format.
+    """
+
+    default = staticmethod(_response_default)
+
+    def _options(self):
+        options = _OPTIONS | orjson.OPT_PASSTHROUGH_DATETIME
+        if self.sort_keys:
+            options |= orjson.OPT_SORT_KEYS
+        return options
+
+    def dumps(self, obj, **kwargs):
+        if orjson is None or kwargs:
+            return super().dumps(obj, **kwargs)
+        return orjson.dumps(obj, default=self.default, option=self._options()).decode("utf-8")
+
+    def loads(self, s, **kwargs):
+        if orjson is None or kwargs:
+            return super().loads(s, **kwargs)
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        """Response of args or kwargs as JSON, like DefaultJSONProvider's"""
+        pretty = (self.compact is None and self._app.debug) or self.compact is False
+        if orjson is None or pretty:
+            return super().response(*args, **kwargs)
+        if args and kwargs:
+            raise TypeError("app.json.response() takes either args or kwargs, not both")
+        obj = (args[0] if len(args) == 1 else args) if args else (kwargs or None)
+        body = orjson.dumps(obj, default=self.default,
+                            option=self._options() | orjson.OPT_APPEND_NEWLINE)
+        return self._app.response_class(body, mimetype=self.mimetype)
@@ -0,0 +1,325 @@
+"""Request and stage timing: spans, Server-Timing, structured logs, Prometheus
+
+    with span("excel.encode"):
+        ...
+
+    @timed("blob.download")
+    def download(...):
+        ...
+
+Every span is observed in the `icar_stage_duration_seconds` histogram and,
+inside a request, added to that request's Server-Timing header and log line.
+Other modules publish their own series through `registry` (counters,
+histograms, or gauges read from a callback at scrape time); GET
+/api/v1/metrics renders them in the Prometheus text format.
+
+Metrics are kept per process: with several gunicorn workers each scrape
+sees the worker that answered it.
+"""
+
+import functools
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+from flask import g, has_request_context, request
+
+logger = logging.getLogger("api.requests")
+
+# Set ICAR_REQUEST_LOG=0 to silence the per-request JSON log lines
+REQUEST_LOG = os.getenv("ICAR_REQUEST_LOG", "1") != "0"
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _format_labels(names, values):
+    if not names:
+        return ""
+    pairs = ",".join(
+        '{}="{}"'.format(n, str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for n, v in zip(names, values)
+    )
+    return "{" + pairs + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        return tuple(labels.get(n, "") for n in self.labels)
+
+    def header(self):
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+
+class _Sampled(_Metric):
+    """Single value per label set, optionally read from a callback.
+
+    The callback returns a number (no labels) or a {label values tuple: number}
+    mapping, and is called at scrape time.
+    """
+
+    def __init__(self, name, help, labels=(), callback=None):
+        super().__init__(name, help, labels)
+        self.callback = callback
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(self._key(labels), 0)
+
+    def render(self):
+        with self._lock:
+            values = dict(self._values)
+        if self.callback is not None:
+            try:
+                result = self.callback()
+            except Exception as e:
+                logger.debug("Metric callback %s failed: %r", self.name, e)
+                result = {}
+            values.update(result if isinstance(result, dict) else {(): result})
+        lines = self.header()
+        for key, value in sorted(values.items()):
+            lines.append(f"{self.name}{_format_labels(self.labels, key)} {_format_value(value)}")
+        return lines
+
+
+class Counter(_Sampled):
+    """Monotonic count per label set"""
+
+    kind = "counter"
+
+
+class Gauge(_Sampled):
+    """Current value per label set"""
+
+    kind = "gauge"
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(_Metric):
+    """Cumulative-bucket latency histogram per label set"""
+
+    kind = "histogram"
+
+    def __init__(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[0][i] += 1
+                    break
+            state[1] += value
+            state[2] += 1
+
+    def render(self):
+        lines = self.header()
+        names = self.labels + ("le",)
+        with self._lock:
+            items = sorted((k, [list(v[0]), v[1], v[2]]) for k, v in self._values.items())
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, n in zip(self.buckets, counts):
+                cumulative += n
+                lines.append(
+                    f"{self.name}_bucket{_format_labels(names, key + (_format_value(bound),))} {cumulative}"
+                )
+            lines.append(f"{self.name}_bucket{_format_labels(names, key + ('+Inf',))} {count}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labels, key)} {total!r}")
+            lines.append(f"{self.name}_count{_format_labels(self.labels, key)} {count}")
+        return lines
+
+
+class Registry:
+    """Named metrics of this process, rendered in Prometheus text format"""
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _get_or_create(self, cls, name, *args, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, *args, **kwargs)
+            elif not isinstance(metric, cls):
+                raise ValueError(f"Metric {name} is already registered as a {metric.kind}")
+            return metric
+
+    def counter(self, name, help, labels=(), callback=None):
+        return self._get_or_create(Counter, name, help, labels, callback=callback)
+
+    def gauge(self, name, help, labels=(), callback=None):
+        return self._get_or_create(Gauge, name, help, labels, callback=callback)
+
+    def histogram(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        return self._get_or_create(Histogram, name, help, labels, buckets=buckets)
+
+    def render(self):
+        lines = []
+        for name in sorted(self._metrics):
+            lines.extend(self._metrics[name].render())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+REQUEST_DURATION = registry.histogram(
+    "icar_request_duration_seconds", "Request latency by route", ("method", "route", "status")
+)
+STAGE_DURATION = registry.histogram(
+    "icar_stage_duration_seconds", "Duration of instrumented stages", ("stage",)
+)
+REQUESTS_IN_PROGRESS = registry.gauge(
+    "icar_requests_in_progress", "Requests currently being handled"
+)
+
+_caches = {}
+
+
+def _cache_stat(stat):
+    return lambda: {(name,): cache.stats()[stat] for name, cache in list(_caches.items())}
+
+
+def register_cache(name, cache):
+    """Export an LRUCache's size, hits, misses and evictions"""
+    _caches[name] = cache
+    registry.gauge("icar_cache_entries", "Entries held per cache", ("cache",),
+                   callback=_cache_stat("size"))
+    for stat in ("hits", "misses", "evictions"):
+        registry.counter(f"icar_cache_{stat}_total", f"Cache {stat} per cache", ("cache",),
+                         callback=_cache_stat(stat))
+
+
+# =======================================
+# SPANS
+# =======================================
+
+@contextmanager
+def span(name):
+    """Time a block as stage `name`"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        STAGE_DURATION.observe(elapsed, stage=name)
+        if has_request_context():
+            spans = g.get("telemetry_spans")
+            if spans is not None:
+                spans.append((name, elapsed))
+
+
+def timed(name=None):
+    """Decorator form of span(); defaults to the function's qualified name"""
+    def decorator(func):
+        stage = name or f"{func.__module__.rsplit('.', 1)[-1]}.{func.__qualname__}"
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(stage):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def _span_totals(spans):
+    """Total seconds and call count per stage, in first-seen order"""
+    totals = {}
+    for name, elapsed in spans:
+        total, count = totals.get(name, (0.0, 0))
+        totals[name] = (total + elapsed, count + 1)
+    return totals
+
+
+def server_timing(totals, total):
+    """Server-Timing header value for the given stage totals"""
+    parts = []
+    for name, (elapsed, count) in totals.items():
+        entry = f"{name};dur={elapsed * 1000:.1f}"
+        if count > 1:
+            entry += f';desc="{count}x"'
+        parts.append(entry)
+    parts.append(f"total;dur={total * 1000:.1f}")
+    return ", ".join(parts)
+
+
+# =======================================
+# FLASK HOOKS
+# =======================================
+
+def _before_request():
+    g.telemetry_start = time.perf_counter()
+    g.telemetry_spans = []
+    REQUESTS_IN_PROGRESS.inc()
+
+
+def _after_request(response):
+    start = g.get("telemetry_start")
+    if start is None:
+        return response
+    total = time.perf_counter() - start
+    totals = _span_totals(g.pop("telemetry_spans", []))
+    route = request.url_rule.rule if request.url_rule is not None else "<unmatched>"
+    REQUEST_DURATION.observe(total, method=request.method, route=route, status=response.status_code)
+    response.headers["Server-Timing"] = server_timing(totals, total)
+    if REQUEST_LOG:
+        logger.info(json.dumps({
+            "method": request.method,
+            "path": request.path,
+            "route": route,
+            "status": response.status_code,
+            "duration_ms": round(total * 1000, 1),
+            "spans": {name: round(elapsed * 1000, 1) for name, (elapsed, _) in totals.items()},
+        }))
+    return response
+
+
+def _teardown_request(exc):
+    if g.pop("telemetry_start", None) is not None:
+        REQUESTS_IN_PROGRESS.dec()
+
+
+def init_app(app):
+    """Install the timing hooks on a Flask app"""
+    app.before_request(_before_request)
+    app.after_request(_after_request)
+    app.teardown_request(_teardown_request)
+    if REQUEST_LOG and not logger.handlers:
+        handler = logging.StreamHandler(sys.stderr)
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        logger.addHandler(handler)
+        logger.setLevel(logging.INFO)
+        logger.propagate = False
@@ -0,0 +1,144 @@
+"""Warm-up of shared read-only state and fork hygiene for gunicorn
+
+warm_up() loads everything workers only ever read - the heavy modules, the
+reference datasets and precomputed yields, the report logos and plotting
+stack, the JWKS and the storage snapshot - so that, when it runs in the
+gunicorn master (see gunicorn.conf.py), forked workers share those pages
+copy-on-write instead of each downloading and parsing their own copy.
+
+after_fork() drops the per-process resources a child must not inherit:
+blob clients (pooled HTTP connections), the process pool and locks that may
+have been held by a master thread at fork time.
+"""
+
+import gc
+import importlib
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Modules every worker ends up importing; loading them in the master shares
+# their code and data pages
+PRELOAD_MODULES = (
+    "numpy",
+    "pandas",
+    "openpyxl",
+    "azure.storage.blob",
+    "fpdf",
+    "PIL.Image",
+    "matplotlib.figure",
+    "matplotlib.backends.backend_agg",
+)
+
+state = {
+    "status": "pending",  # pending | running | ready | failed
+    "started_at": None,
+    "finished_at": None,
+    "steps": {},
+}
+_lock = threading.Lock()
+
+
+def _preload_modules():
+    for name in PRELOAD_MODULES:
+        importlib.import_module(name)
+
+
+def _load_datasets():
+    from api.v1.utils import datasets
+
+    datasets.test_dataset()
+    datasets.actual_lookup()
+    datasets.reference_yields()
+
+
+def _load_report():
+    from api.v1.utils import report
+
+    # Importing the module decodes the logos; also build the plot figure
+    report._scatter_axes()
+
+
+def _load_jwks():
+    from api.v1.views.validator import validator
+
+    validator.jwks.keys()
+
+
+def _load_storage():
+    from models import storage
+
+    storage.count()
+
+
+STEPS = (
+    ("modules", _preload_modules),
+    ("datasets", _load_datasets),
+    ("report", _load_report),
+    ("jwks", _load_jwks),
+    ("storage", _load_storage),
+)
+
+
+def warm_up(freeze=False):
+    """Run every warm-up step; returns True when all of them succeeded.
+
+    A failing step is recorded and skipped: whatever it should have loaded
+    is loaded lazily by the first request that needs it instead. With
+    freeze=True the loaded objects are moved out of the cyclic GC's reach
+    (gc.freeze) so collections in workers do not touch, and thereby copy,
+    the shared pages.
+    """
+    with _lock:
+        state.update(status="running", started_at=time.time(), finished_at=None, steps={})
+    ok = True
+    for name, step in STEPS:
+        start = time.perf_counter()
+        try:
+            step()
+            result = {"ok": True}
+        except Exception as e:
+            ok = False
+            result = {"ok": False, "error": str(e)}
+            logger.warning("Warm-up step %s failed: %s", name, e)
+        result["ms"] = round((time.perf_counter() - start) * 1000, 1)
+        state["steps"][name] = result
+    if freeze:
+        gc.collect()
+        gc.freeze()
+    with _lock:
+        state.update(status="ready" if ok else "failed", finished_at=time.time())
+    return ok
+
+
+def warm_up_in_background():
+    """Start warm_up() in a thread unless it already ran or is running"""
+    with _lock:
+        if state["status"] not in ("pending", "failed"):
+            return
+        state["status"] = "running"
+    threading.Thread(target=warm_up, name="warm-up", daemon=True).start()
+
+
+def is_ready():
+    return state["status"] == "ready"
+
+
+def after_fork():
+    """Reset per-process resources in a freshly forked worker"""
+    global _lock
+    from api.v1.utils import datasets
+    from api.v1.utils.pool import reset_process_pool
+
+    _lock = threading.Lock()
+    datasets.reset_clients()
+    reset_process_pool()
+
+    from models import storage
+    if storage.connected:
+        storage.reset_clients()
+
+    from api.v1.views.validator import validator
+    validator.jwks.reset_after_fork()
@@ -1,121 +1,133 @@
 from api.v1.views import app_views
-from flask import Blueprint, jsonify, request, send_from_directory
-import pandas as pd
+from flask import Blueprint, abort, jsonify, make_response, redirect, request, send_from_directory
+import hashlib
 import uuid
 import os
-from azure.storage.blob import BlobServiceClient, ContentSettings
 from io import BytesIO
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
 
 from models import storage
 from models.generate import Generate
 from dotenv import load_dotenv
 from models.user import User
-import pandas as pd
-from authlib.integrations.flask_oauth2 import ResourceProtector
-from api.v1.views.validator import Auth0JWTBearerTokenValidator
-from lactationcurve.characteristics import test_interval_method as lc_test_interval_method
+from api.v1.views.validator import require_auth
+from api.v1.utils import aio, datasets
+from api.v1.utils.cache import DiskLRUCache
+from api.v1.utils.datasets import blob_service_client
+from api.v1.utils.lazy import lazy_from, lazy_import
+from api.v1.utils.telemetry import register_cache, registry, span, timed
 
-
-load_dotenv()
+# Heavy dependencies are imported on first use
+pd = lazy_import("pandas")
+ContentSettings = lazy_from("azure.storage.blob", "ContentSettings")
+BlobSasPermissions = lazy_from("azure.storage.blob", "BlobSasPermissions")
+generate_blob_sas = lazy_from("azure.storage.blob", "generate_blob_sas")
 
 
+load_dotenv()
 
-# Authentication
-require_auth = ResourceProtector()
-validator = Auth0JWTBearerTokenValidator(
-    domain=os.getenv("AUTH0_DOMAIN"),
-    audience=os.getenv("AUTH0_AUDIENCE")
-)
-require_auth.register_token_validator(validator)
 
 
-# Dataset and Azure setup (test CSV may live in icarwebsite/dataset/ vs app JSON container)
+# Generated datasets are uploaded next to the app JSON
 AZURE_STORAGE_CONNECTION_STRING = os.getenv("AZURE_STORAGE_CONNECTION_STRING")
 AZURE_CONTAINER_NAME = os.getenv("AZURE_CONTAINER_NAME")
-AZURE_DATASET_STORAGE_CONNECTION_STRING = os.getenv("AZURE_DATASET_STORAGE_CONNECTION_STRING")
-AZURE_DATASET_CONTAINER_NAME = os.getenv("AZURE_DATASET_CONTAINER_NAME", "icarwebsite")
-# BLOB_DATASET_NAME is filename only (no "/"); blob key is dataset/<filename>
-_dataset_filename = os.getenv("BLOB_DATASET_NAME", "TestDataSet.csv").lstrip("/")
-DATASET_BLOB_PATH = os.getenv("AZURE_DATASET_BLOB_PATH") or f"dataset/{_dataset_filename}"
 # Virtual folder for generated Excel blobs when storage_mode is azure
 AZURE_GENERATED_DATASETS_PREFIX = "Generated_Datasets"
 
+# Local copies of generated files, an LRU cache in front of the blobs above:
+# downloads missing here are filled from Azure, so any instance can serve
+# any file, and the least recently downloaded are removed past the cap
+generated_cache = DiskLRUCache(
+    os.path.join(os.getcwd(), "data", "generated"),
+    max_bytes=int(os.getenv("ICAR_GENERATED_CACHE_BYTES", str(1024 * 1024 * 1024))),
+)
+register_cache("generated_files", generated_cache)
+registry.gauge("icar_generated_cache_bytes", "Bytes of generated files cached on local disk",
+               callback=lambda: generated_cache.stats()["bytes"])
 
+# "redirect" sends downloads to a short-lived SAS URL of the blob, so the
+# bytes do not pass through the app servers; "local" serves the cached copy
+DOWNLOAD_MODE = os.getenv("ICAR_DOWNLOAD_MODE", "local")
+DOWNLOAD_SAS_SECONDS = int(os.getenv("ICAR_DOWNLOAD_SAS_SECONDS", "300"))
+# Generated files never change once written (every test set has a new id),
+# so clients and proxies may keep them for as long as they like
+DOWNLOAD_MAX_AGE = int(os.getenv("ICAR_DOWNLOAD_MAX_AGE", str(365 * 24 * 3600)))
 
 
+@timed("dataset.test")
+def load_csv_from_blob():
+    """Test CSV (TestDataSet.csv), downloaded once per process; do not modify it."""
+    return datasets.test_dataset()
 
 
-# ======================================================
-# NEW FUNCTION: Load TestDataSet.csv from Azure Blob
-# ======================================================
-def load_csv_from_blob():
-    """Load test CSV from blob. BLOB_DATASET_NAME is filename only; blob key is dataset/<filename>."""
-    conn = AZURE_DATASET_STORAGE_CONNECTION_STRING or AZURE_STORAGE_CONNECTION_STRING
+def _generated_blob(filename):
+    """(connection string, container, blob name, public URL) of a generated file"""
+    conn = os.getenv("AZURE_STORAGE_CONNECTION_STRING")
+    container_name = os.getenv("AZURE_CONTAINER_NAME")
     if not conn:
-        raise ValueError(
-            "AZURE_STORAGE_CONNECTION_STRING or AZURE_DATASET_STORAGE_CONNECTION_STRING must be set"
-        )
-    blob_service = BlobServiceClient.from_connection_string(conn)
-    container_client = blob_service.get_container_client(AZURE_DATASET_CONTAINER_NAME)
-    blob_client = container_client.get_blob_client(DATASET_BLOB_PATH)
-    if not blob_client.exists():
-        raise FileNotFoundError(
-            f"Dataset blob not found: {AZURE_DATASET_CONTAINER_NAME}/{DATASET_BLOB_PATH}"
+        raise ValueError("AZURE_STORAGE_CONNECTION_STRING is not set")
+    blob_name = f"{AZURE_GENERATED_DATASETS_PREFIX}/{filename}"
+    account_name = blob_service_client(conn).account_name
+    url = f"https://{account_name}.blob.core.windows.net/{container_name}/{blob_name}"
+    return conn, container_name, blob_name, url
+
+
+async def upload_excel_file_async(excel_bytes, filename):
+    """Upload a generated Excel file to Azure Blob Storage; returns its URL"""
+    conn, container_name, blob_name, url = _generated_blob(filename)
+    with span("excel.upload"):
+        await aio.upload_blob(
+            conn, container_name, blob_name, excel_bytes,
+            content_settings=ContentSettings(
+                content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+            )
         )
-    csv_bytes = blob_client.download_blob().readall()
-    return pd.read_csv(BytesIO(csv_bytes))
-
+    return url
 
 
-def estimate_yields_with_lactationcurve(df):
-    """
-    Calculate 305-day yields via the installed `lactationcurve` package and
-    normalize output to columns: TestId, Total305Yield.
-    """
-
-    required_cols = ["DaysInMilk", "DailyMilkingYield", "TestId"]
-    missing = [c for c in required_cols if c not in df.columns]
-    if missing:
-        raise ValueError(f"Missing required columns for lactationcurve: {missing}")
+@timed("blob.download")
+def download_generated_file(filename):
+    """Bytes of a generated file from Azure, or None if there is none"""
+    from azure.core.exceptions import ResourceNotFoundError
 
-    input_df = df[required_cols].copy()
-
-    result_df = lc_test_interval_method(
-        input_df,
-        days_in_milk_col="DaysInMilk",
-        milking_yield_col="DailyMilkingYield",
-        test_id_col="TestId",
+    conn, container_name, blob_name, _ = _generated_blob(filename)
+    try:
+        return aio.run(aio.download_blob(conn, container_name, blob_name))
+    except ResourceNotFoundError:
+        return None
+
+
+def _connection_settings(conn):
+    """Key=value pairs of a storage connection string"""
+    return dict(part.split("=", 1) for part in conn.split(";") if "=" in part)
+
+
+def generated_sas_url(filename):
+    """URL of a generated file's blob with a read-only SAS valid for
+    DOWNLOAD_SAS_SECONDS, or None when the connection string holds no
+    account key to sign it with"""
+    conn, container_name, blob_name, url = _generated_blob(filename)
+    account_key = _connection_settings(conn).get("AccountKey")
+    if not account_key:
+        return None
+    now = datetime.now(timezone.utc)
+    token = generate_blob_sas(
+        account_name=blob_service_client(conn).account_name,
+        container_name=container_name,
+        blob_name=blob_name,
+        account_key=account_key,
+        permission=BlobSasPermissions(read=True),
+        start=now - timedelta(minutes=5),  # tolerate clock skew
+        expiry=now + timedelta(seconds=DOWNLOAD_SAS_SECONDS),
+        content_disposition=f'attachment; filename="{filename}"',
     )
+    return f"{url}?{token}"
 
-    if not isinstance(result_df, pd.DataFrame):
-        raise ValueError("lactationcurve test_interval_method did not return a DataFrame.")
-
-    if result_df.empty:
-        return pd.DataFrame(columns=["TestId", "Total305Yield"])
 
-    normalized_names = {c: c.lower().replace(" ", "").replace("_", "") for c in result_df.columns}
-    test_id_col = None
-    yield_col = None
-
-    for col, norm in normalized_names.items():
-        if norm in {"testid", "testids", "id"} and test_id_col is None:
-            test_id_col = col
-        if norm in {"total305yield", "totalyield", "total305", "predicted305yield"} and yield_col is None:
-            yield_col = col
-
-    if test_id_col is None or yield_col is None:
-        if len(result_df.columns) >= 2:
-            test_id_col = result_df.columns[0]
-            yield_col = result_df.columns[1]
-        else:
-            raise ValueError(
-                f"Unexpected lactationcurve output columns: {list(result_df.columns)}"
-            )
-
-    normalized_df = result_df[[test_id_col, yield_col]].copy()
-    normalized_df.columns = ["TestId", "Total305Yield"]
-    return normalized_df
+def _generated_etag(filename):
+    """ETag of a generated file: its name, which is never reused, so every
+    instance gives the same one without reading the file"""
+    return hashlib.sha1(filename.encode("utf-8")).hexdigest()[:20]
 
 
 def upload_excel_file(excel_stream, filename, storage_mode="local"):
@@ -124,106 +136,78 @@ def upload_excel_file(excel_stream, filename, storage_mode="local"):
     Returns a public URL (Azure) or route link (local).
     """
     if storage_mode == "azure":
-        conn = os.getenv("AZURE_STORAGE_CONNECTION_STRING")
-        container_name = os.getenv("AZURE_CONTAINER_NAME")
-        if not conn:
-            raise ValueError("AZURE_STORAGE_CONNECTION_STRING is not set")
-        blob_name = f"{AZURE_GENERATED_DATASETS_PREFIX}/{filename}"
-
-        blob_service_client = BlobServiceClient.from_connection_string(conn)
-        container_client = blob_service_client.get_container_client(container_name)
-        blob_client = container_client.get_blob_client(blob_name)
-
-        blob_client.upload_blob(
-            excel_stream,
-            overwrite=True,
-            content_settings=ContentSettings(
-                content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-            )
-        )
-
-        return (
-            f"https://{blob_service_client.account_name}.blob.core.windows.net/"
-            f"{container_name}/{AZURE_GENERATED_DATASETS_PREFIX}/{filename}"
-        )
+        return aio.run(upload_excel_file_async(excel_stream.read(), filename))
 
     elif storage_mode == "local":
-        local_dir = os.path.join(os.getcwd(), "data", "generated")
-        os.makedirs(local_dir, exist_ok=True)
-        file_path = os.path.join(local_dir, filename)
-
-        with open(file_path, "wb") as f:
-            f.write(excel_stream.read())
-
+        generated_cache.put(filename, excel_stream.read())
         return f"/api/v1/download/{filename}"
 
     else:
         raise ValueError("Invalid storage_mode. Must be 'azure' or 'local'.")
 
 
+@timed("excel.encode")
+def encode_excel(df):
+    """Bytes of an .xlsx file holding df"""
+    excel_stream = BytesIO()
+    df.to_excel(excel_stream, index=False)
+    return excel_stream.getvalue()
+
+
+@timed("tim.select")
+def select_reference_yields(selected_ids):
+    """Estimated yields (TIM is computed per animal, so the precomputed
+    reference yields of the selected animals are the same numbers)"""
+    reference = datasets.reference_yields()
+    return reference[reference['TestId'].isin(selected_ids)]
+
+
 @app_views.route('/generate', methods=['POST', 'GET'], strict_slashes=False)
 @require_auth()
 def generate_random_dataset():
     try:
         df = load_csv_from_blob()
 
-        unique_animals = df['TestId'].unique()
-        selected_ids = pd.Series(unique_animals).sample(n=300, random_state=42).tolist()
-        generated_df = df[df['TestId'].isin(selected_ids)]
+        with span("generate.sample"):
+            unique_animals = df['TestId'].unique()
+            selected_ids = pd.Series(unique_animals).sample(n=300, random_state=42).tolist()
+            generated_df = df[df['TestId'].isin(selected_ids)]
 
         generate_obj = Generate()
         test_set_id = generate_obj.id
-
-        # Convert DataFrame to Excel in memory
-        excel_stream = BytesIO()
-        generated_df.to_excel(excel_stream, index=False)
-        excel_stream.seek(0)
-
-        # ✅ FIX: Create two independent streams for upload
-        excel_bytes = excel_stream.getvalue()
-        excel_stream_local = BytesIO(excel_bytes)
-        excel_stream_azure = BytesIO(excel_bytes)
-
-        # Filename
-        timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
         filename = f"{test_set_id}.xlsx"
-
-        # Upload both copies
-        download_link_locally = upload_excel_file(excel_stream_local, filename, storage_mode="local")
-        download_link = upload_excel_file(excel_stream_azure, filename, storage_mode="azure")
-
-        # User handling - reload to get latest data
-        storage.reload()
-        
         user_email = request.args.get('email')
         user_name = request.args.get('name')
 
-        all_users = storage.all(User)
-        user = None
-        for u in all_users.values():
-            if u.email == user_email:
-                user = u
-                break
+        # Encode the Excel file while the user's storage is refreshed and
+        # the reference yields are looked up
+        excel_bytes, estimated_yields, _ = aio.gather(
+            aio.in_thread(encode_excel, generated_df),
+            aio.in_thread(select_reference_yields, selected_ids),
+            aio.in_thread(storage.reload_for, user_email),
+        )
+
+        # Write the local copy while the Azure copy is uploading
+        download_link_locally, download_link = aio.gather(
+            aio.in_thread(upload_excel_file, BytesIO(excel_bytes), filename, "local"),
+            upload_excel_file_async(excel_bytes, filename),
+        )
+
+        user = storage.query(User).where(email=user_email).first()
 
         if user:
             # Update existing user - preserve organization if it exists
             if user_name:
                 user.name = user_name
             # Don't overwrite organization - preserve existing value
-            user.save()
-            generate_obj.user_id = user.id
         else:
             # Create new user
             user = User()
             user.email = user_email
             user.name = user_name or ""
             # Organization will be empty for new users - they can set it in profile
-            user.save()
-            generate_obj.user_id = user.id
-        
-        generate_obj.save()
-        # Estimated yields
-        estimated_yields = estimate_yields_with_lactationcurve(generated_df)
+        generate_obj.user_id = user.id
+
         generate_obj.test_obj_ids = list(estimated_yields['TestId'])
         generate_obj.calculated_milk_yields = list(estimated_yields['Total305Yield'])
         generate_obj.download_url = download_link
@@ -235,7 +219,11 @@ def generate_random_dataset():
         else:
             generate_obj.parity = []
 
-        generate_obj.save()
+        # One upload of the storage document for both objects
+        user.updated_at = generate_obj.updated_at = datetime.now()
+        storage.new(user)
+        storage.new(generate_obj)
+        storage.save()
 
         return jsonify({
             "success": True,
@@ -254,7 +242,35 @@ def generate_random_dataset():
 @app_views.route('/download/<filename>', methods=['GET'])
 def download_file(filename):
     """
-    Serves generated Excel files from local storage directory.
+    Serves generated Excel files from the local cache, downloading them
+    from Azure on a miss, or redirects to the blob (ICAR_DOWNLOAD_MODE).
+    Supports Range and If-None-Match; revalidation is answered without
+    touching the file.
     """
-    file_dir = os.path.join(os.getcwd(), "data", "generated")
-    return send_from_directory(directory=file_dir, path=filename, as_attachment=True)
+    if not generated_cache.valid_name(filename):
+        abort(404)
+
+    if DOWNLOAD_MODE == "redirect":
+        url = generated_sas_url(filename)
+        if url is not None:
+            response = redirect(url, code=302)
+            # The SAS expires; never let a cache hand out a dead link
+            response.cache_control.no_store = True
+            return response
+
+    etag = _generated_etag(filename)
+    if request.if_none_match.contains(etag):
+        response = make_response("", 304)
+    else:
+        if generated_cache.fetch(filename, lambda: download_generated_file(filename)) is None:
+            abort(404)
+        response = send_from_directory(
+            directory=generated_cache.directory, path=filename, as_attachment=True,
+            etag=etag, max_age=DOWNLOAD_MAX_AGE,
+        )
+        response.accept_ranges = "bytes"
+    response.set_etag(etag)
+    response.cache_control.public = True
+    response.cache_control.max_age = DOWNLOAD_MAX_AGE
+    response.cache_control.immutable = True
+    return response
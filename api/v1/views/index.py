@@ -1,5 +1,6 @@
 from api.v1.views import app_views
-from flask import jsonify
+from flask import Response, jsonify
+from api.v1.utils import telemetry, warmup
 
 
 @app_views.route('/status', methods=['GET'], strict_slashes=False)
@@ -8,6 +9,30 @@ def status():
     return jsonify({'status': 'active'})
 
 
+@app_views.route('/ready', methods=['GET'], strict_slashes=False)
+def ready():
+    """return whether shared reference data has been warmed up
+
+    Starts the warm-up in the background when it has not run yet (or failed),
+    so the endpoint also works without the gunicorn hooks.
+    """
+    if not warmup.is_ready():
+        warmup.warm_up_in_background()
+    state = warmup.state
+    body = {
+        'ready': warmup.is_ready(),
+        'status': state['status'],
+        'steps': dict(state['steps']),
+    }
+    return jsonify(body), 200 if body['ready'] else 503
+
+
+@app_views.route('/metrics', methods=['GET'], strict_slashes=False)
+def metrics():
+    """return this worker's metrics in the Prometheus text format"""
+    return Response(telemetry.registry.render(), mimetype='text/plain; version=0.0.4')
+
+
 @app_views.route('/', methods=['GET'], strict_slashes=False)
 def index():
     """return the status of the API"""
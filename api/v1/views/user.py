@@ -1,22 +1,11 @@
 from api.v1.views import app_views
 from flask import Blueprint, jsonify, request, send_from_directory
-import pandas as pd
 from models import storage
 from models.user import User
-from authlib.integrations.flask_oauth2 import ResourceProtector
-from api.v1.views.validator import Auth0JWTBearerTokenValidator
+from api.v1.views.validator import require_auth
 import os
 
 
-# Authentication
-require_auth = ResourceProtector()
-validator = Auth0JWTBearerTokenValidator(
-    domain=os.getenv("AUTH0_DOMAIN"),
-    audience=os.getenv("AUTH0_AUDIENCE")
-)
-require_auth.register_token_validator(validator)
-
-
 @app_views.route('/profile', methods=['GET'], strict_slashes=False)
 @require_auth()
 def fetch_profile():
@@ -26,16 +15,15 @@ def fetch_profile():
         return jsonify({"success": False, "message": "Email is required"}), 400
 
     # Reload to get latest data
-    storage.reload()
+    storage.reload_for(email)
     
     # Check if user already exists
-    all_users = storage.all(User)
-    for user in all_users.values():
-        if user.email == email:
-            return jsonify({
-                "organization": user.organization or "",
-                "email": user.email
-            })
+    user = storage.query(User).where(email=email).first()
+    if user:
+        return jsonify({
+            "organization": user.organization or "",
+            "email": user.email
+        })
 
     return jsonify({
         "organization": "",
@@ -56,13 +44,8 @@ def update_profile():
         return jsonify({"success": False, "message": "Organization cannot be empty"}), 400
 
     # Check if user already exists
-    storage.reload()
-    all_users = storage.all(User)
-    user = None
-    for u in all_users.values():
-        if u.email == email:
-            user = u
-            break
+    storage.reload_for(email)
+    user = storage.query(User).where(email=email).first()
     
     if user:
         user.organization = organization.strip()
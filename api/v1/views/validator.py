@@ -1,24 +1,194 @@
+import hashlib
 import json
+import logging
+import os
+import threading
+import time
 from urllib.request import urlopen
 
+from authlib.integrations.flask_oauth2 import ResourceProtector
+from authlib.jose import JoseError, jwt
 from authlib.oauth2.rfc7523 import JWTBearerTokenValidator
+from authlib.jose.errors import InvalidTokenError
 from authlib.jose.rfc7517.jwk import JsonWebKey
+from dotenv import load_dotenv
+
+from api.v1.utils.cache import LRUCache
+from api.v1.utils.telemetry import register_cache
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Seconds before cached signing keys are refreshed in the background
+JWKS_TTL = float(os.getenv("AUTH0_JWKS_TTL", "3600"))
+# Minimum seconds between refetches triggered by an unknown kid
+JWKS_MIN_REFETCH = float(os.getenv("AUTH0_JWKS_MIN_REFETCH", "30"))
+JWKS_TIMEOUT = float(os.getenv("AUTH0_JWKS_TIMEOUT", "5"))
+# Verified tokens remembered per worker (0 disables the cache)
+TOKEN_CACHE_SIZE = int(os.getenv("AUTH0_TOKEN_CACHE_SIZE", "1024"))
+# Seconds of clock skew allowed when checking exp (and iat/nbf)
+TOKEN_LEEWAY = int(os.getenv("AUTH0_TOKEN_LEEWAY", "0"))
+
+
+class JWKSCache:
+    """Signing keys of an issuer, fetched lazily and refreshed in the background
+
+    Keys are loaded from `path` when given (offline/testing), otherwise from
+    `url`. Once loaded, stale keys keep being served while a single background
+    thread refreshes them, so requests never wait on the network after the
+    first fetch. A token signed with an unknown kid (key rotation) forces a
+    synchronous refetch, rate limited by `min_refetch`.
+    """
+
+    def __init__(self, url, path=None, ttl=JWKS_TTL, min_refetch=JWKS_MIN_REFETCH,
+                 timeout=JWKS_TIMEOUT):
+        self.url = url
+        self.path = path
+        self.ttl = ttl
+        self.min_refetch = min_refetch
+        self.timeout = timeout
+        self.key_set = None
+        self.fetched_at = 0.0
+        self.fetches = 0
+        self.failures = 0
+        self._lock = threading.Lock()
+        self._refreshing = False
+
+    def _read(self):
+        if self.path:
+            with open(self.path, "rb") as f:
+                return json.loads(f.read())
+        with urlopen(self.url, timeout=self.timeout) as response:
+            return json.loads(response.read())
+
+    def fetch(self):
+        """Load the key set now; keeps the previous keys on failure"""
+        try:
+            key_set = JsonWebKey.import_key_set(self._read())
+        except Exception as e:
+            self.failures += 1
+            logger.warning("Could not load JWKS from %s: %s", self.path or self.url, e)
+            if self.key_set is None:
+                raise
+            return self.key_set
+        with self._lock:
+            self.key_set = key_set
+            self.fetched_at = time.monotonic()
+            self.fetches += 1
+        return key_set
+
+    def _refresh(self):
+        try:
+            self.fetch()
+        except Exception:
+            pass
+        finally:
+            self._refreshing = False
+
+    def refresh_in_background(self):
+        """Start a refresh thread unless one is already running"""
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+        threading.Thread(target=self._refresh, name="jwks-refresh", daemon=True).start()
+
+    def reset_after_fork(self):
+        """Forget refresh state inherited from the parent process"""
+        self._lock = threading.Lock()
+        self._refreshing = False
+
+    def keys(self):
+        """Current key set; only blocks when nothing has been loaded yet"""
+        if self.key_set is None:
+            return self.fetch()
+        if time.monotonic() - self.fetched_at > self.ttl:
+            self.refresh_in_background()
+        return self.key_set
+
+    def find(self, kid):
+        """Key for kid, refetching once if the kid is not known yet"""
+        try:
+            return self.keys().find_by_kid(kid)
+        except ValueError:
+            pass
+        if time.monotonic() - self.fetched_at >= self.min_refetch:
+            try:
+                return self.fetch().find_by_kid(kid)
+            except ValueError:
+                pass
+        # Rejected as an invalid token (401) rather than a server error
+        raise InvalidTokenError(description=f"Unknown signing key {kid!r}")
+
+    def load_key(self, header, payload):
+        """Key resolver in the form authlib's jwt.decode() accepts"""
+        return self.find(header.get("kid"))
+
 
 class Auth0JWTBearerTokenValidator(JWTBearerTokenValidator):
-    def __init__(self, domain, audience):
+    def __init__(self, domain, audience, jwks_file=None, cache_size=TOKEN_CACHE_SIZE,
+                 leeway=TOKEN_LEEWAY):
         issuer = f"https://{domain}/"
-        jsonurl = urlopen(f"{issuer}.well-known/jwks.json")
-        # print("before")
-        public_key = JsonWebKey.import_key_set(
-            json.loads(jsonurl.read())
-        )
-        # print("after")
+        self.leeway = leeway
+        self.jwks = JWKSCache(f"{issuer}.well-known/jwks.json", path=jwks_file)
+        self.token_cache = LRUCache(maxsize=cache_size) if cache_size > 0 else None
+        # Keys are resolved per token, so nothing is fetched at import time
         super(Auth0JWTBearerTokenValidator, self).__init__(
-            public_key
+            self.jwks.load_key
         )
-        # print("after super")
         self.claims_options = {
             "exp": {"essential": True},
             "aud": {"essential": True, "value": audience},
             "iss": {"essential": True, "value": issuer},
-        }
\ No newline at end of file
+        }
+
+    def authenticate_token(self, token_string):
+        """Verify a bearer token, skipping the signature check for tokens
+        that were verified before.
+
+        The cache is keyed by the SHA-256 of the token and holds the decoded
+        header and payload until the token's exp. Claims (exp, aud, iss) are
+        validated again on every hit, with the same leeway as on a miss.
+        """
+        if self.token_cache is None:
+            return super().authenticate_token(token_string)
+
+        key = hashlib.sha256(token_string.encode()).hexdigest()
+        cached = self.token_cache.get(key)
+        if cached is not None:
+            header, payload = cached
+            claims = self.token_cls(payload, header, options=self.claims_options)
+            try:
+                claims.validate(leeway=self.leeway)
+                return claims
+            except JoseError as error:
+                self.token_cache.pop(key)
+                logger.debug("Cached token rejected. %r", error)
+                return None
+
+        try:
+            claims = jwt.decode(
+                token_string,
+                self.public_key,
+                claims_options=self.claims_options,
+                claims_cls=self.token_cls,
+            )
+            claims.validate(leeway=self.leeway)
+        except JoseError as error:
+            logger.debug("Authenticate token failed. %r", error)
+            return None
+        self.token_cache.put(key, (dict(claims.header), dict(claims)))
+        return claims
+
+
+# Authentication shared by every view module
+require_auth = ResourceProtector()
+validator = Auth0JWTBearerTokenValidator(
+    domain=os.getenv("AUTH0_DOMAIN"),
+    audience=os.getenv("AUTH0_AUDIENCE"),
+    jwks_file=os.getenv("AUTH0_JWKS_FILE")
+)
+require_auth.register_token_validator(validator)
+if validator.token_cache is not None:
+    register_cache("auth_tokens", validator.token_cache)
@@ -0,0 +1,366 @@
+#!/usr/bin/python3
+"""Benchmark the storage engine and API endpoints against a fake blob backend
+
+Each fixture size (see fixtures.py) is loaded into an in-memory fake of Azure
+Blob Storage (see fakes.py), JWT validation is stubbed out, and every scenario
+is driven through the Flask test client. Results, with the blob calls made
+per run, are printed and written to JSON for tracking regressions.
+
+    python -m benchmarks.bench_api --sizes 1k,10k --runs 5 --latency 0.02
+    python -m benchmarks.bench_api --scenarios storage.reload.blob,analytics
+    python -m benchmarks.bench_api --datasets /tmp/herd   # see benchmarks.herd
+    python -m benchmarks.bench_api --partitioned --scenarios storage.reload.user
+
+TIM yields come from the `lactationcurve` package, which /generate needs.
+With 300 animals per test set the 100k fixture is about 1 GB of JSON; use
+e.g. --animals 30 to run it on a small machine.
+"""
+
+import argparse
+import datetime
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import redirect_stdout
+from io import BytesIO, StringIO
+
+from benchmarks import fakes
+from benchmarks.fixtures import ANIMALS, REPO_ROOT, bench_email, build_document, size_count
+
+ADMIN_EMAIL = "admin@bench.example.com"
+AUTH_HEADERS = {"Authorization": "Bearer bench"}
+
+
+class Context:
+    """What the scenarios need: test client, storage engine and fixture ids"""
+
+    def __init__(self, client, engine, backend, document):
+        self.client = client
+        self.engine = engine
+        self.backend = backend
+        self.email = bench_email(0)
+        self.user_id = user_id = next(v["id"] for v in document.values()
+                                      if v["__class__"] == "User" and v["email"] == self.email)
+        self.generate = next(v for v in document.values()
+                             if v["__class__"] == "Generate" and v["user_id"] == user_id)
+        self.submission_id = next(v["id"] for v in document.values()
+                                  if v["__class__"] == "Submission"
+                                  and v["generate_id"] == self.generate["id"])
+        self.submit_file = submission_excel(self.generate)
+
+
+def submission_excel(generate):
+    import pandas as pd
+
+    stream = BytesIO()
+    pd.DataFrame({
+        "TestObjectID": generate["test_obj_ids"],
+        "CalculatedMilkYield (kg)": [y * 1.02 for y in generate["calculated_milk_yields"]],
+    }).to_excel(stream, index=False)
+    return stream.getvalue()
+
+
+# =======================================
+# SCENARIOS
+# =======================================
+
+def reload_from_blob(ctx):
+    """Download and parse every document (reload without a shared snapshot)"""
+    partitions = list(ctx.engine.partitions.values())
+    snapshots = [partition.snapshot for partition in partitions]
+    for partition in partitions:
+        # Without the ETag of the last load, revalidation has to download
+        partition.snapshot = None
+        partition.loaded_version = partition.base_etag = None
+    try:
+        ctx.engine.reload()
+    finally:
+        for partition, snapshot in zip(partitions, snapshots):
+            partition.snapshot = snapshot
+            partition.loaded_version = None
+
+
+def reload_from_snapshot(ctx):
+    """Parse the documents another worker published to the shared snapshot"""
+    for partition in ctx.engine.partitions.values():
+        partition.loaded_version = None
+    ctx.engine.reload()
+
+
+def reload_unchanged(ctx):
+    ctx.engine.reload()
+
+
+def reload_user(ctx):
+    """What one user's request loads: the directory and their partition,
+    parsed from the shared snapshot"""
+    from models.user import User
+
+    ctx.engine.directory.loaded_version = None
+    user = ctx.engine.get(User, ctx.user_id)
+    if user.partition:
+        ctx.engine.partition(user.partition).loaded_version = None
+    ctx.engine.reload_for(ctx.email)
+
+
+def save(ctx):
+    """Write one changed object (a journal append unless the journal is off)"""
+    from models.user import User
+
+    ctx.engine.new(ctx.engine.get(User, ctx.user_id))
+    ctx.engine.save()
+
+
+def compact(ctx):
+    """Fold the directory's journal into a new document"""
+    ctx.engine.directory.compact()
+
+
+def generate(ctx):
+    return ctx.client.get(f"/api/v1/generate?email={ctx.email}&name=Bench%20User%200",
+                          headers=AUTH_HEADERS)
+
+
+def submit(ctx):
+    return ctx.client.post(
+        f"/api/v1/submit?email={ctx.email}",
+        headers=AUTH_HEADERS,
+        data={
+            "file": (BytesIO(ctx.submit_file), "submission.xlsx"),
+            "test_set_id": ctx.generate["id"],
+            "calculation_method": "TIM",
+            "organization": "Bench Organization",
+            "country": "Netherlands",
+        },
+        content_type="multipart/form-data",
+    )
+
+
+def submissions_user(ctx):
+    return ctx.client.get(f"/api/v1/submissions?email={ctx.email}", headers=AUTH_HEADERS)
+
+
+def submissions_admin(ctx):
+    return ctx.client.get(f"/api/v1/submissions?email={ADMIN_EMAIL}&admin=yes",
+                          headers=AUTH_HEADERS)
+
+
+def compare_json(ctx):
+    return ctx.client.get(f"/api/v1/compare/{ctx.submission_id}")
+
+
+def compare_pdf(ctx):
+    return ctx.client.get(f"/api/v1/compare/{ctx.submission_id}?download=true")
+
+
+def analytics(ctx):
+    return ctx.client.get(f"/api/v1/analytics?email={ADMIN_EMAIL}&admin=yes",
+                          headers=AUTH_HEADERS)
+
+
+SCENARIOS = {
+    "storage.reload.blob": reload_from_blob,
+    "storage.reload.snapshot": reload_from_snapshot,
+    "storage.reload.unchanged": reload_unchanged,
+    "storage.reload.user": reload_user,
+    "storage.save": save,
+    "storage.compact": compact,
+    "generate": generate,
+    "submit": submit,
+    "submissions.user": submissions_user,
+    "submissions.admin": submissions_admin,
+    "compare.json": compare_json,
+    "compare.pdf": compare_pdf,
+    "analytics": analytics,
+}
+
+
+# =======================================
+# RUNNER
+# =======================================
+
+def percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, round(q * (len(ordered) - 1)))]
+
+
+def run_scenario(ctx, name, runs, warmup):
+    """Time `runs` calls of a scenario after `warmup` untimed ones"""
+    scenario = SCENARIOS[name]
+    quiet = StringIO()  # the views print() every submission
+    for _ in range(warmup):
+        with redirect_stdout(quiet):
+            scenario(ctx)
+    ctx.backend.reset_calls()
+    timings, statuses, error, sizes = [], {}, None, []
+    for _ in range(runs):
+        start = time.perf_counter()
+        with redirect_stdout(quiet):
+            response = scenario(ctx)
+        timings.append(time.perf_counter() - start)
+        quiet.seek(0)
+        quiet.truncate()
+        if response is not None:
+            statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+            sizes.append(len(response.get_data()))
+            if response.status_code >= 400 and error is None:
+                error = response.get_data(as_text=True)[:500]
+    ms = [t * 1000 for t in timings]
+    result = {
+        "scenario": name,
+        "runs": runs,
+        "timings_ms": [round(t, 3) for t in ms],
+        "min_ms": round(min(ms), 3),
+        "median_ms": round(statistics.median(ms), 3),
+        "mean_ms": round(statistics.fmean(ms), 3),
+        "p95_ms": round(percentile(ms, 0.95), 3),
+        "max_ms": round(max(ms), 3),
+        "blob_calls": {op: n / runs for op, n in sorted(ctx.backend.calls.items())},
+        "blob_bytes": {op: n / runs for op, n in sorted(ctx.backend.bytes.items())},
+    }
+    if sizes:
+        result["response_bytes"] = statistics.median(sizes)
+    if statuses:
+        result["statuses"] = {str(k): v for k, v in sorted(statuses.items())}
+    if error is not None:
+        result["error"] = error
+    return result
+
+
+def load_fixture(engine, backend, data, partitioned=False):
+    """Make `data` the stored document and load it into the engine, then
+    move it into partitions if asked to"""
+    from api.v1.utils import compression
+
+    stored = compression.compress(data, compression.storage_encoding())
+    backend.blobs.put(engine.container_name, engine.blob_name, stored)
+    directory = engine.directory
+    directory.loaded_version = directory.base_etag = directory.journal = None
+    if directory.snapshot is not None:
+        directory.snapshot.publish(data, fakes._etag(stored))
+    engine.reload()
+    if partitioned:
+        engine.move_to_partitions()
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=REPO_ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default="1k,10k",
+                        help="comma-separated fixture sizes (1k, 10k, 100k or a number)")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS),
+                        help="comma-separated subset of: " + ", ".join(SCENARIOS))
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--warmup", type=int, default=1)
+    parser.add_argument("--animals", type=int, default=ANIMALS)
+    parser.add_argument("--latency", type=float, default=0.0,
+                        help="simulated seconds per blob call")
+    parser.add_argument("--bandwidth", type=float, default=None,
+                        help="simulated blob transfer rate in MB/s")
+    parser.add_argument("--datasets", default=REPO_ROOT,
+                        help="directory with TestDataSet.csv and ActualMilkYields.csv "
+                             "(default: the repository's)")
+    parser.add_argument("--encoding", choices=["identity", "gzip", "zstd"], default=None,
+                        help="compression of the storage blob and the seeded datasets "
+                             "(default: the app's ICAR_STORAGE_ENCODING)")
+    parser.add_argument("--accept-encoding", default="",
+                        help="Accept-Encoding sent with every request, e.g. 'gzip, br'")
+    parser.add_argument("--partitioned", action="store_true",
+                        help="move the fixture into per-organization partitions "
+                             "(storage.move_to_partitions) before running the scenarios")
+    parser.add_argument("--output", default=None,
+                        help="JSON results file (default benchmarks/results/api-<time>.json)")
+    args = parser.parse_args()
+
+    names = [s.strip() for s in args.scenarios.split(",") if s.strip()]
+    unknown = [s for s in names if s not in SCENARIOS]
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(unknown)}")
+
+    started = datetime.datetime.now(datetime.timezone.utc)
+    output = os.path.abspath(args.output or os.path.join(
+        REPO_ROOT, "benchmarks", "results", f"api-{started.strftime('%Y%m%dT%H%M%SZ')}.json"
+    ))
+
+    datasets = os.path.abspath(args.datasets)
+
+    # Keep generated files and the shared snapshot out of the working tree
+    workdir = tempfile.mkdtemp(prefix="icar-bench-")
+    os.environ.setdefault("ICAR_SNAPSHOT_DIR", os.path.join(workdir, "snapshot"))
+    os.environ.setdefault("ICAR_REQUEST_LOG", "0")
+    if args.encoding:
+        os.environ["ICAR_STORAGE_ENCODING"] = args.encoding
+    os.chdir(workdir)
+
+    backend = fakes.install_fake_blob(
+        latency=args.latency,
+        bandwidth=args.bandwidth * 1e6 if args.bandwidth else None,
+    )
+    fakes.stub_auth()
+    from api.v1.app import app
+    from api.v1.utils import compression
+    from models import storage
+
+    fakes.seed_datasets(backend, datasets, compression.storage_encoding())
+    client = app.test_client()
+    if args.accept_encoding:
+        client.environ_base["HTTP_ACCEPT_ENCODING"] = args.accept_encoding
+    results = []
+    for size in [s.strip() for s in args.sizes.split(",") if s.strip()]:
+        start = time.perf_counter()
+        document = build_document(size, args.animals, dataset_dir=datasets)
+        data = json.dumps(document).encode("utf-8")
+        engine = storage._connect()
+        load_fixture(engine, backend, data, args.partitioned)
+        ctx = Context(client, engine, backend, document)
+        del document
+        print(f"== {size}: {size_count(size)} objects per class, {len(data) / 1e6:.1f} MB "
+              f"(built and loaded in {time.perf_counter() - start:.1f}s)")
+
+        for name in names:
+            result = run_scenario(ctx, name, args.runs, args.warmup)
+            result.update(size=size, objects_per_class=size_count(size), document_bytes=len(data))
+            results.append(result)
+            failed = f"  FAILED {result['statuses']}" if "error" in result else ""
+            print(f"   {name:<26} median {result['median_ms']:>10.1f} ms   "
+                  f"p95 {result['p95_ms']:>10.1f} ms{failed}")
+
+    report = {
+        "benchmark": "api",
+        "started_at": started.isoformat(),
+        "commit": git_commit(),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "settings": {
+            "runs": args.runs,
+            "warmup": args.warmup,
+            "animals": args.animals,
+            "latency_s": args.latency,
+            "bandwidth_mb_s": args.bandwidth,
+            "encoding": compression.storage_encoding(),
+            "accept_encoding": args.accept_encoding,
+            "partitioned": args.partitioned,
+        },
+        "results": results,
+    }
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"results written to {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,217 @@
+#!/usr/bin/python3
+"""Benchmark /download/<filename> under concurrent clients
+
+Seeds --files generated files of --size bytes into the fake blob backend's
+Generated_Datasets/ (see fakes.py) and lets --concurrency threads, each with
+its own test client, download them --requests times per scenario:
+
+    cold          each file once, with the local cache empty: filled from blob
+    warm          full downloads of locally cached files
+    range         the first --range-bytes of cached files (Range)
+    not-modified  revalidations with the file's ETag (If-None-Match -> 304)
+    redirect      ICAR_DOWNLOAD_MODE=redirect: the app answers with a SAS URL
+                  and the client fetches the blob itself
+
+"app" time is what a worker spends on a request; for redirect, "total"
+adds the client's blob download, which no longer passes through the app.
+
+    python -m benchmarks.bench_download --files 200 --size 2000000 --concurrency 16
+    python -m benchmarks.bench_download --latency 0.02 --bandwidth 50
+"""
+
+import argparse
+import datetime
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+from benchmarks import fakes
+from benchmarks.bench_api import git_commit, percentile
+from benchmarks.fixtures import REPO_ROOT
+
+SCENARIOS = ("cold", "warm", "range", "not-modified", "redirect")
+
+
+def seed_files(backend, count, size):
+    """Upload count generated files of size bytes; returns their names"""
+    from api.v1.views.generate import AZURE_GENERATED_DATASETS_PREFIX
+
+    container = os.environ["AZURE_CONTAINER_NAME"]
+    names = []
+    for i in range(count):
+        name = f"bench-{i:05d}.xlsx"
+        data = os.urandom(64) * (size // 64) + os.urandom(size % 64)
+        backend.blobs.put(container, f"{AZURE_GENERATED_DATASETS_PREFIX}/{name}", data)
+        names.append(name)
+    return names
+
+
+def download(client, backend, scenario, name, etags, range_bytes):
+    """One client request; returns (app seconds, total seconds, body bytes, status)"""
+    headers = {}
+    if scenario == "range":
+        headers["Range"] = f"bytes=0-{range_bytes - 1}"
+    elif scenario == "not-modified":
+        headers["If-None-Match"] = etags[name]
+    start = time.perf_counter()
+    response = client.get(f"/api/v1/download/{name}", headers=headers)
+    body = response.get_data()
+    app_s = time.perf_counter() - start
+    if scenario == "redirect" and response.status_code == 302:
+        # What the browser does next, straight from the blob service
+        location = response.headers["Location"].split("?")[0]
+        container, blob = location.split("/", 4)[3:]
+        body = fakes.FakeBlobClient(backend, container, blob).download_blob().readall()
+    return app_s, time.perf_counter() - start, len(body), response.status_code
+
+
+def run_scenario(app, backend, scenario, names, requests, concurrency, range_bytes):
+    from api.v1.views import generate as generate_view
+
+    generate_view.DOWNLOAD_MODE = "redirect" if scenario == "redirect" else "local"
+    etags = {}
+    if scenario == "cold":
+        generate_view.generated_cache.clear()
+        requests = min(requests, len(names))  # a second request would be a hit
+    elif scenario == "not-modified":
+        client = app.test_client()
+        etags = {name: client.get(f"/api/v1/download/{name}").headers["ETag"] for name in names}
+
+    samples, errors = [], []
+    counter = iter(range(requests))
+    lock = threading.Lock()
+
+    def worker():
+        client = app.test_client()
+        while True:
+            with lock:
+                i = next(counter, None)
+            if i is None:
+                return
+            name = names[i % len(names)]
+            try:
+                sample = download(client, backend, scenario, name, etags, range_bytes)
+            except Exception as e:
+                with lock:
+                    errors.append(repr(e))
+                continue
+            with lock:
+                samples.append(sample)
+
+    backend.reset_calls()
+    start = time.perf_counter()
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - start
+
+    app_ms = [s[0] * 1000 for s in samples] or [0.0]
+    total_ms = [s[1] * 1000 for s in samples] or [0.0]
+    body_bytes = sum(s[2] for s in samples)
+    statuses = {}
+    for s in samples:
+        statuses[str(s[3])] = statuses.get(str(s[3]), 0) + 1
+    result = {
+        "scenario": scenario,
+        "requests": len(samples),
+        "concurrency": concurrency,
+        "wall_s": round(wall, 3),
+        "requests_per_s": round(len(samples) / wall, 1),
+        "mb_per_s": round(body_bytes / wall / 1e6, 1),
+        "app_median_ms": round(statistics.median(app_ms), 3),
+        "app_p95_ms": round(percentile(app_ms, 0.95), 3),
+        "total_median_ms": round(statistics.median(total_ms), 3),
+        "total_p95_ms": round(percentile(total_ms, 0.95), 3),
+        "statuses": statuses,
+        "blob_calls": dict(sorted(backend.calls.items())),
+        "blob_bytes": dict(sorted(backend.bytes.items())),
+    }
+    if errors:
+        result["errors"] = errors[:5]
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--files", type=int, default=100)
+    parser.add_argument("--size", type=int, default=1_000_000, help="bytes per file")
+    parser.add_argument("--requests", type=int, default=400, help="requests per scenario")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--range-bytes", type=int, default=65536)
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS),
+                        help="comma-separated subset of: " + ", ".join(SCENARIOS))
+    parser.add_argument("--latency", type=float, default=0.0,
+                        help="simulated seconds per blob call")
+    parser.add_argument("--bandwidth", type=float, default=None,
+                        help="simulated blob transfer rate in MB/s")
+    parser.add_argument("--output", default=None,
+                        help="JSON results file (default benchmarks/results/download-<time>.json)")
+    args = parser.parse_args()
+
+    names = [s.strip() for s in args.scenarios.split(",") if s.strip()]
+    unknown = [s for s in names if s not in SCENARIOS]
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(unknown)}")
+
+    started = datetime.datetime.now(datetime.timezone.utc)
+    output = os.path.abspath(args.output or os.path.join(
+        REPO_ROOT, "benchmarks", "results", f"download-{started.strftime('%Y%m%dT%H%M%SZ')}.json"
+    ))
+
+    # data/generated is relative to the working directory; keep it out of the tree
+    workdir = tempfile.mkdtemp(prefix="icar-bench-")
+    os.environ.setdefault("ICAR_SNAPSHOT_DIR", os.path.join(workdir, "snapshot"))
+    os.environ.setdefault("ICAR_REQUEST_LOG", "0")
+    os.chdir(workdir)
+
+    backend = fakes.install_fake_blob(
+        latency=args.latency,
+        bandwidth=args.bandwidth * 1e6 if args.bandwidth else None,
+    )
+    from api.v1.app import app
+
+    files = seed_files(backend, args.files, args.size)
+    print(f"== {len(files)} files of {args.size / 1e6:.1f} MB, {args.concurrency} clients")
+    results = []
+    for scenario in names:
+        result = run_scenario(app, backend, scenario, files, args.requests, args.concurrency,
+                              args.range_bytes)
+        results.append(result)
+        failed = f"  ERRORS {len(result['errors'])}" if "errors" in result else ""
+        print(f"   {scenario:<13} {result['requests_per_s']:>8.1f} req/s {result['mb_per_s']:>8.1f} MB/s"
+              f"   app median {result['app_median_ms']:>8.1f} ms p95 {result['app_p95_ms']:>8.1f} ms"
+              f"   total p95 {result['total_p95_ms']:>8.1f} ms{failed}")
+
+    report = {
+        "benchmark": "download",
+        "started_at": started.isoformat(),
+        "commit": git_commit(),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "settings": {
+            "files": args.files,
+            "size": args.size,
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+            "range_bytes": args.range_bytes,
+            "latency_s": args.latency,
+            "bandwidth_mb_s": args.bandwidth,
+        },
+        "results": results,
+    }
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"results written to {output}")
+
+
+if __name__ == "__main__":
+    main()
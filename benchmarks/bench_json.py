@@ -0,0 +1,160 @@
+#!/usr/bin/python3
+"""Benchmark JSON encoding: the json module against the fast serializer
+
+Times, per fixture size (see fixtures.py):
+
+    response.submissions  the admin /submissions list (one entry per
+                          submission, NumPy metric values) through Flask's
+                          default JSON provider and FastJSONProvider
+    storage.dumps         serializing the storage document as FileStorage.save
+    storage.loads         parsing it back as FileStorage.reload
+
+"json" is the json module (what the app used before), "fast" is
+api.v1.utils.serialization, which uses orjson when installed.
+
+    python -m benchmarks.bench_json --sizes 1k,10k
+    python -m benchmarks.bench_json --sizes 33334 --animals 30   # ~100k objects
+"""
+
+import argparse
+import datetime
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+
+import numpy as np
+from flask import Flask
+from flask.json.provider import DefaultJSONProvider
+
+from api.v1.utils import serialization
+from api.v1.utils.metrics import METRIC_KEYS
+from api.v1.utils.serialization import FastJSONProvider
+from benchmarks.bench_api import git_commit, percentile
+from benchmarks.fixtures import ANIMALS, REPO_ROOT, build_document, size_count
+
+
+def submissions_payload(document, seed=0):
+    """What /submissions?admin=yes returns for the document's submissions"""
+    rng = np.random.default_rng(seed)
+    payload = []
+    for v in document.values():
+        if v["__class__"] != "Submission":
+            continue
+        payload.append({
+            "id": v["id"],
+            "generate_id": v["generate_id"],
+            "calculation_method": v["calculation_method"],
+            "notes": v["notes"],
+            "download_url": v["download_url"],
+            "organization": v["organization"],
+            "name": "Bench Admin",
+            "country": v["country"],
+            "test_set_id": v["generate_id"],
+            "date": v["created_at"].replace("T", " "),
+            "metrics": {key: np.float64(rng.random()) for key in METRIC_KEYS},
+        })
+    return payload
+
+
+def workloads(app, document, data):
+    """{(workload, encoder): callable returning the output size in bytes}"""
+    payload = submissions_payload(document)
+    default_provider, fast_provider = DefaultJSONProvider(app), FastJSONProvider(app)
+
+    def respond(provider):
+        def run():
+            with app.app_context():
+                return len(provider.response(payload).get_data())
+        return run
+
+    return {
+        ("response.submissions", "json"): respond(default_provider),
+        ("response.submissions", "fast"): respond(fast_provider),
+        ("storage.dumps", "json"): lambda: len(json.dumps(document).encode("utf-8")),
+        ("storage.dumps", "fast"): lambda: len(serialization.dumps(document)),
+        ("storage.loads", "json"): lambda: len(json.loads(data)),
+        ("storage.loads", "fast"): lambda: len(serialization.loads(data)),
+    }
+
+
+def run_workload(func, runs, warmup):
+    for _ in range(warmup):
+        func()
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        size = func()
+        timings.append((time.perf_counter() - start) * 1000)
+    return {
+        "runs": runs,
+        "timings_ms": [round(t, 3) for t in timings],
+        "min_ms": round(min(timings), 3),
+        "median_ms": round(statistics.median(timings), 3),
+        "p95_ms": round(percentile(timings, 0.95), 3),
+        "output": size,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default="1k,10k",
+                        help="comma-separated fixture sizes (1k, 10k, 100k or a number)")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--warmup", type=int, default=1)
+    parser.add_argument("--animals", type=int, default=ANIMALS)
+    parser.add_argument("--output", default=None,
+                        help="JSON results file (default benchmarks/results/json-<time>.json)")
+    args = parser.parse_args()
+
+    started = datetime.datetime.now(datetime.timezone.utc)
+    output = os.path.abspath(args.output or os.path.join(
+        REPO_ROOT, "benchmarks", "results", f"json-{started.strftime('%Y%m%dT%H%M%SZ')}.json"
+    ))
+    encoder = "orjson" if serialization.orjson is not None else "json (orjson not installed)"
+    print(f"fast serializer: {encoder}")
+
+    app = Flask(__name__)
+    results = []
+    for size in [s.strip() for s in args.sizes.split(",") if s.strip()]:
+        document = build_document(size, args.animals)
+        data = json.dumps(document).encode("utf-8")
+        print(f"== {size}: {len(document)} objects, {len(data) / 1e6:.1f} MB")
+        medians = {}
+        for (name, impl), func in workloads(app, document, data).items():
+            result = run_workload(func, args.runs, args.warmup)
+            result.update(workload=name, encoder=impl, size=size,
+                          objects=len(document), document_bytes=len(data))
+            results.append(result)
+            medians[name, impl] = result["median_ms"]
+            speedup = ""
+            if impl == "fast" and medians[name, impl]:
+                speedup = f"   x{medians[name, 'json'] / medians[name, impl]:.1f}"
+            print(f"   {name:<22} {impl:<5} median {result['median_ms']:>10.1f} ms{speedup}")
+        del document, data
+
+    report = {
+        "benchmark": "json",
+        "started_at": started.isoformat(),
+        "commit": git_commit(),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "settings": {
+            "runs": args.runs,
+            "warmup": args.warmup,
+            "animals": args.animals,
+            "fast_encoder": encoder,
+        },
+        "results": results,
+    }
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"results written to {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,183 @@
+#!/usr/bin/python3
+"""Benchmark the model classes: memory per object and (de)serialization
+
+Builds a storage document of about --objects objects (users, generates and
+submissions in equal parts, see fixtures.py) and, per class, measures
+(throughputs are the best of --runs)
+
+    memory   bytes allocated per object when loading it from its dict
+             (tracemalloc; the dict values themselves are shared, so this
+             is the object, its attribute storage and its datetimes)
+    load     objects per second through from_dict, as storage reload does
+    dump     objects per second through to_dict, as storage save does
+
+"slots" is models/ as it is; "dict" is a copy of the previous __dict__-based
+ParentModel kept below for comparison.
+
+    python -m benchmarks.bench_models --objects 100000
+"""
+
+import argparse
+import datetime
+import gc
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+
+from benchmarks.bench_api import git_commit
+from benchmarks.fixtures import REPO_ROOT, build_document
+from models.generate import Generate
+from models.submission import Submission
+from models.user import User
+
+
+# =======================================
+# PREVIOUS MODELS (__dict__ per object)
+# =======================================
+
+class DictModel:
+    def __init__(self, *arg, **kwargs):
+        if kwargs:
+            for key, value in kwargs.items():
+                if key in ["created_at", "updated_at"]:
+                    try:
+                        value = datetime.datetime.fromisoformat(value)
+                    except Exception:
+                        self.created_at = datetime.datetime.now()
+                        self.updated_at = self.created_at
+                if key not in ["__class__"]:
+                    setattr(self, key, value)
+
+    def to_dict(self):
+        dict_attr = self.__dict__.copy()
+        dict_attr.update({"__class__": str(self.__class__.__name__)})
+        dict_attr["created_at"] = self.created_at.isoformat()
+        dict_attr["updated_at"] = self.updated_at.isoformat()
+        return dict_attr
+
+
+class DictUser(DictModel):
+    def __init__(self, *args, **kwargs):
+        self.organization = ""
+        self.name = ""
+        self.email = ""
+        super().__init__(*args, **kwargs)
+
+
+class DictGenerate(DictModel):
+    user_id = ""
+    download_url = ""
+    parity = []
+    test_obj_ids = []
+    calculated_milk_yields = []
+
+
+class DictSubmission(DictModel):
+    calculation_method = ""
+    organization = ""
+    country = ""
+    generate_id = ""
+    notes = ""
+    download_url = ""
+    test_obj_ids = []
+    calculated_milk_yields = []
+
+
+IMPLEMENTATIONS = {
+    "dict": {"User": lambda v: DictUser(**v), "Generate": lambda v: DictGenerate(**v),
+             "Submission": lambda v: DictSubmission(**v)},
+    "slots": {"User": User.from_dict, "Generate": Generate.from_dict,
+              "Submission": Submission.from_dict},
+}
+
+
+# =======================================
+# MEASUREMENTS
+# =======================================
+
+def measure_memory(load, records):
+    """Bytes allocated per object while loading records"""
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    objects = [load(v) for v in records]
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    list_bytes = sys.getsizeof(objects)
+    del objects
+    return (after - before - list_bytes) / len(records)
+
+
+def time_runs(func, runs):
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    # Best of the runs: the least disturbed by other work on the machine
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--objects", type=int, default=100_000,
+                        help="objects in the document, split evenly over the three classes")
+    parser.add_argument("--animals", type=int, default=30)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--output", default=None,
+                        help="JSON results file (default benchmarks/results/models-<time>.json)")
+    args = parser.parse_args()
+
+    started = datetime.datetime.now(datetime.timezone.utc)
+    output = os.path.abspath(args.output or os.path.join(
+        REPO_ROOT, "benchmarks", "results", f"models-{started.strftime('%Y%m%dT%H%M%SZ')}.json"
+    ))
+
+    document = build_document(max(1, args.objects // 3), args.animals)
+    by_class = {}
+    for v in document.values():
+        by_class.setdefault(v["__class__"], []).append(v)
+    print(f"== {len(document)} objects")
+
+    results = []
+    for cls_name, records in by_class.items():
+        for impl, loaders in IMPLEMENTATIONS.items():
+            load = loaders[cls_name]
+            bytes_per_object = measure_memory(load, records)
+            load_s = time_runs(lambda: [load(v) for v in records], args.runs)
+            objects = [load(v) for v in records]
+            dump_s = time_runs(lambda: [obj.to_dict() for obj in objects], args.runs)
+            del objects
+            result = {
+                "class": cls_name,
+                "impl": impl,
+                "objects": len(records),
+                "bytes_per_object": round(bytes_per_object, 1),
+                "load_per_s": round(len(records) / load_s),
+                "dump_per_s": round(len(records) / dump_s),
+            }
+            results.append(result)
+            print(f"   {cls_name:<11} {impl:<5} {result['bytes_per_object']:>8.0f} B/object"
+                  f"   load {result['load_per_s']:>10,}/s   dump {result['dump_per_s']:>10,}/s")
+
+    report = {
+        "benchmark": "models",
+        "started_at": started.isoformat(),
+        "commit": git_commit(),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "settings": {"objects": len(document), "animals": args.animals, "runs": args.runs},
+        "results": results,
+    }
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"results written to {output}")
+
+
+if __name__ == "__main__":
+    main()
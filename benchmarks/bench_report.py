@@ -0,0 +1,87 @@
+#!/usr/bin/python3
+"""Benchmark end-to-end comparison report rendering
+
+Builds a report for a synthetic 300-animal test set (overall section plus
+parity 1, 2 and 3+) and prints the latency of each run.
+
+    python -m benchmarks.bench_report --runs 10
+"""
+
+import argparse
+import os
+import statistics
+import time
+
+import numpy as np
+import pandas as pd
+
+from api.v1.utils.report import build_comparison_pdf, scatter_spec
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+METRICS = {
+    "pearson_correlation": 0.97,
+    "root_mean_squared_error": 412.5,
+    "mean_absolute_error": 318.2,
+    "mean_absolute_percentage_error": 3.41,
+}
+
+
+def _sections(n_animals=300, seed=1):
+    """Build report sections shaped like a real comparison"""
+    rng = np.random.default_rng(seed)
+    actual_df = pd.read_csv(os.path.join(REPO_ROOT, "ActualMilkYields.csv"))
+    actual = rng.choice(actual_df["TotalActualProduction"].to_numpy(), n_animals)
+    reference = actual * rng.normal(1.0, 0.05, n_animals)
+    submitted = reference * rng.normal(1.0, 0.03, n_animals)
+    parity = rng.integers(1, 6, n_animals)
+
+    def section(title, mask):
+        return {
+            "title": title,
+            "primary": METRICS,
+            "icar": METRICS,
+            "plots": [
+                scatter_spec(reference[mask], submitted[mask], f"{title}: RCALY vs SCALY",
+                             "RCALY (kg milk)", "SCALY (kg milk)", "#1f77b4", add_45_line=True),
+                scatter_spec(actual[mask], submitted[mask], f"{title}: Actual vs SCALY",
+                             "ALY (kg milk)", "SCALY (kg milk)", "#ff7f0e", add_45_line=True),
+            ],
+        }
+
+    overall = section("Calculation Evaluation and Comparison", np.ones(n_animals, dtype=bool))
+    groups = {"1": parity == 1, "2": parity == 2, "3+": parity >= 3}
+    parity_sections = [section(f"Parity {p} Performance", m) for p, m in groups.items()]
+    return overall, parity_sections
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--animals", type=int, default=300)
+    args = parser.parse_args()
+
+    details = {
+        "organization": "Benchmark Dairy",
+        "date_reported": "2025-01-01 00:00:00",
+        "calculation_method": "TIM",
+        "test_set_id": "benchmark",
+        "country": "Netherlands",
+        "dataset_link": "api/v1/download/benchmark.xlsx",
+    }
+    overall, parity_sections = _sections(args.animals)
+
+    timings = []
+    for _ in range(args.runs):
+        start = time.perf_counter()
+        pdf = build_comparison_pdf(details, "benchmark user", overall, parity_sections)
+        timings.append(time.perf_counter() - start)
+
+    print(f"runs:   {', '.join(f'{t:.3f}s' for t in timings)}")
+    print(f"first:  {timings[0]:.3f}s (includes process pool start-up)")
+    print(f"median: {statistics.median(timings):.3f}s")
+    print(f"size:   {len(pdf.getvalue())} bytes")
+
+
+if __name__ == "__main__":
+    main()
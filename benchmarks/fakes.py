@@ -0,0 +1,451 @@
+#!/usr/bin/python3
+"""Local stand-ins for Azure Blob Storage and Auth0 used by the benchmarks
+
+install_fake_blob() replaces BlobServiceClient.from_connection_string with a
+fake that keeps blobs in memory (or, with a directory, in files that several
+processes can share) and sleeps for a configurable latency per call plus
+transfer time. Only the part of the SDK the app uses is implemented:
+
+    service.get_container_client(name)
+    container.create_container() / get_blob_client(name) / upload_blob(...)
+    container.list_blob_names(name_starts_with=...)
+    blob.exists() / get_blob_properties() / download_blob().readall()
+    blob.upload_blob(data, overwrite=..., etag=..., match_condition=...)
+    blob.create_append_blob() / append_block(data, appendpos_condition=...) / seal_append_blob()
+    blob.download_blob(offset=...) / delete_blob()
+
+and the same calls, awaitable, on azure.storage.blob.aio clients.
+
+stub_auth() makes the shared token validator accept any bearer token
+without a signature check or JWKS download.
+"""
+
+import asyncio
+import hashlib
+import os
+import threading
+import time
+import types
+
+from azure.core import MatchConditions
+from azure.core.exceptions import (
+    HttpResponseError, ResourceExistsError, ResourceModifiedError, ResourceNotFoundError,
+)
+
+try:
+    import fcntl
+except ImportError:  # Windows: DirectoryBlobs is then only safe within one process
+    fcntl = None
+
+BENCH_CONNECTION_STRING = (
+    "DefaultEndpointsProtocol=https;AccountName=bench;"
+    "AccountKey=YmVuY2g=;EndpointSuffix=core.windows.net"
+)
+
+
+def _etag(data):
+    return '"0x' + hashlib.md5(data).hexdigest()[:16].upper() + '"'
+
+
+def _http_error(message, status):
+    error = HttpResponseError(message=message)
+    error.status_code = status
+    return error
+
+
+class MemoryBlobs:
+    """Blob contents of one process, keyed by (container, name)"""
+
+    def __init__(self):
+        self._blobs = {}
+        self._sealed = set()
+        self._lock = threading.Lock()
+
+    def get(self, container, name):
+        return self._blobs.get((container, name))
+
+    def put(self, container, name, data, condition=None):
+        """Store data; condition(current data or None) runs under the lock
+        and may raise to refuse the write"""
+        with self._lock:
+            if condition is not None:
+                condition(self._blobs.get((container, name)))
+            self._blobs[(container, name)] = data
+            self._sealed.discard((container, name))
+
+    def append(self, container, name, data, position=None):
+        """Append to an existing blob, only if it is position bytes long when
+        a position is given; returns the offset data landed at"""
+        with self._lock:
+            current = self._blobs.get((container, name))
+            if current is None:
+                raise ResourceNotFoundError(f"The specified blob does not exist: {name}")
+            if (container, name) in self._sealed:
+                raise _http_error("This operation is not permitted on a sealed blob.", 409)
+            if position is not None and position != len(current):
+                raise _http_error("The append position condition specified was not met.", 412)
+            self._blobs[(container, name)] = current + data
+            return len(current)
+
+    def seal(self, container, name):
+        with self._lock:
+            if (container, name) not in self._blobs:
+                raise ResourceNotFoundError(f"The specified blob does not exist: {name}")
+            self._sealed.add((container, name))
+
+    def sealed(self, container, name):
+        return (container, name) in self._sealed
+
+    def delete(self, container, name):
+        with self._lock:
+            self._blobs.pop((container, name), None)
+            self._sealed.discard((container, name))
+
+    def names(self, container):
+        return sorted(n for c, n in self._blobs if c == container)
+
+
+class DirectoryBlobs:
+    """Blob contents kept as files, shared by every process using the directory"""
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, container, name):
+        return os.path.join(self.directory, container, name.replace("/", "__"))
+
+    def get(self, container, name):
+        try:
+            with open(self._path(container, name), "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def _locked(self):
+        """Exclusive lock across the processes sharing the directory"""
+        f = open(os.path.join(self.directory, ".lock"), "a")
+        if fcntl is not None:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        return f  # closing the file releases the lock
+
+    def put(self, container, name, data, condition=None):
+        path = self._path(container, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(data)
+        with self._locked():
+            if condition is not None:
+                try:
+                    condition(self.get(container, name))
+                except Exception:
+                    os.remove(tmp)
+                    raise
+            os.replace(tmp, path)
+            if os.path.exists(path + ".sealed"):
+                os.remove(path + ".sealed")
+
+    def append(self, container, name, data, position=None):
+        path = self._path(container, name)
+        with self._locked():
+            if not os.path.exists(path):
+                raise ResourceNotFoundError(f"The specified blob does not exist: {name}")
+            if os.path.exists(path + ".sealed"):
+                raise _http_error("This operation is not permitted on a sealed blob.", 409)
+            with open(path, "ab") as f:
+                offset = f.tell()
+                if position is not None and position != offset:
+                    raise _http_error("The append position condition specified was not met.", 412)
+                f.write(data)
+            return offset
+
+    def seal(self, container, name):
+        path = self._path(container, name)
+        with self._locked():
+            if not os.path.exists(path):
+                raise ResourceNotFoundError(f"The specified blob does not exist: {name}")
+            with open(path + ".sealed", "w"):
+                pass
+
+    def sealed(self, container, name):
+        return os.path.exists(self._path(container, name) + ".sealed")
+
+    def delete(self, container, name):
+        path = self._path(container, name)
+        with self._locked():
+            for p in (path, path + ".sealed"):
+                if os.path.exists(p):
+                    os.remove(p)
+
+    def names(self, container):
+        try:
+            files = os.listdir(os.path.join(self.directory, container))
+        except FileNotFoundError:
+            return []
+        return sorted(f.replace("__", "/") for f in files
+                      if not f.endswith((".tmp", ".sealed", ".lock")))
+
+
+class FakeBlobBackend:
+    """Blob store plus the simulated network cost of each call.
+
+    Every call sleeps `latency` seconds; transfers additionally sleep
+    len(data) / `bandwidth` seconds when a bandwidth (bytes/s) is given.
+    `calls` counts operations and `bytes` the bytes transferred by name.
+    """
+
+    def __init__(self, latency=0.0, bandwidth=None, directory=None):
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.blobs = DirectoryBlobs(directory) if directory else MemoryBlobs()
+        self.calls = {}
+        self.bytes = {}
+        self._lock = threading.Lock()
+
+    def wait(self, op, size=0):
+        with self._lock:
+            self.calls[op] = self.calls.get(op, 0) + 1
+            if size:
+                self.bytes[op] = self.bytes.get(op, 0) + size
+        delay = self.latency
+        if self.bandwidth and size:
+            delay += size / self.bandwidth
+        if delay > 0:
+            time.sleep(delay)
+
+    def reset_calls(self):
+        with self._lock:
+            self.calls = {}
+            self.bytes = {}
+
+
+class FakeDownload:
+    def __init__(self, data):
+        self._data = data
+        self.properties = types.SimpleNamespace(etag=_etag(data), size=len(data))
+
+    def readall(self):
+        return self._data
+
+
+class FakeBlobClient:
+    def __init__(self, backend, container, name):
+        self.backend = backend
+        self.container_name = container
+        self.blob_name = name
+
+    @property
+    def url(self):
+        return f"https://bench.blob.core.windows.net/{self.container_name}/{self.blob_name}"
+
+    def _data(self):
+        data = self.backend.blobs.get(self.container_name, self.blob_name)
+        if data is None:
+            raise ResourceNotFoundError(f"The specified blob does not exist: {self.blob_name}")
+        return data
+
+    def exists(self, **kwargs):
+        self.backend.wait("exists")
+        return self.backend.blobs.get(self.container_name, self.blob_name) is not None
+
+    def get_blob_properties(self, **kwargs):
+        self.backend.wait("get_blob_properties")
+        data = self._data()
+        return types.SimpleNamespace(
+            etag=_etag(data), size=len(data),
+            is_append_blob_sealed=self.backend.blobs.sealed(self.container_name, self.blob_name),
+        )
+
+    def download_blob(self, offset=None, length=None, **kwargs):
+        data = self._data()
+        if offset is not None:
+            if offset >= len(data):
+                self.backend.wait("download_blob")
+                raise _http_error("The range specified is invalid for the current size of the resource.", 416)
+            data = data[offset:offset + length if length is not None else None]
+        self.backend.wait("download_blob", len(data))
+        return FakeDownload(data)
+
+    def upload_blob(self, data, overwrite=False, etag=None, match_condition=None, **kwargs):
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+        elif not isinstance(data, (bytes, bytearray)):
+            data = data.read()
+        data = bytes(data)
+        self.backend.wait("upload_blob", len(data))
+
+        def condition(current):
+            if current is not None and (not overwrite or match_condition == MatchConditions.IfMissing):
+                raise ResourceExistsError(f"The specified blob already exists: {self.blob_name}")
+            if match_condition == MatchConditions.IfNotModified and \
+                    (current is None or _etag(current) != etag):
+                raise ResourceModifiedError("The condition specified using HTTP conditional header(s) is not met.")
+
+        self.backend.blobs.put(self.container_name, self.blob_name, data, condition)
+        return {"etag": _etag(data)}
+
+    def create_append_blob(self, **kwargs):
+        self.backend.wait("create_append_blob")
+        self.backend.blobs.put(self.container_name, self.blob_name, b"")
+        return {"etag": _etag(b"")}
+
+    def append_block(self, data, appendpos_condition=None, **kwargs):
+        data = bytes(data)
+        self.backend.wait("append_block", len(data))
+        offset = self.backend.blobs.append(self.container_name, self.blob_name, data,
+                                           appendpos_condition)
+        return {"blob_append_offset": str(offset)}
+
+    def seal_append_blob(self, **kwargs):
+        self.backend.wait("seal_append_blob")
+        self.backend.blobs.seal(self.container_name, self.blob_name)
+
+    def delete_blob(self, **kwargs):
+        self.backend.wait("delete_blob")
+        self._data()
+        self.backend.blobs.delete(self.container_name, self.blob_name)
+
+
+class FakeContainerClient:
+    def __init__(self, backend, name):
+        self.backend = backend
+        self.container_name = name
+
+    def create_container(self, **kwargs):
+        self.backend.wait("create_container")
+
+    def get_blob_client(self, blob):
+        return FakeBlobClient(self.backend, self.container_name, blob)
+
+    def upload_blob(self, name, data, overwrite=False, **kwargs):
+        return self.get_blob_client(name).upload_blob(data, overwrite=overwrite, **kwargs)
+
+    def list_blob_names(self, name_starts_with=None, **kwargs):
+        self.backend.wait("list_blobs")
+        names = self.backend.blobs.names(self.container_name)
+        return iter(n for n in names if n.startswith(name_starts_with or ""))
+
+
+class FakeBlobServiceClient:
+    account_name = "bench"
+
+    def __init__(self, backend):
+        self.backend = backend
+
+    def get_container_client(self, container):
+        return FakeContainerClient(self.backend, container)
+
+    def get_blob_client(self, container, blob):
+        return FakeBlobClient(self.backend, container, blob)
+
+
+class FakeAsyncDownload:
+    def __init__(self, download):
+        self._download = download
+        self.properties = download.properties
+
+    async def readall(self):
+        return self._download.readall()
+
+
+class FakeAsyncBlobClient:
+    """azure.storage.blob.aio-style client over FakeBlobClient; the simulated
+    network wait happens in a worker thread so calls overlap"""
+
+    def __init__(self, blob_client):
+        self._blob = blob_client
+
+    async def exists(self, **kwargs):
+        return await asyncio.to_thread(self._blob.exists, **kwargs)
+
+    async def get_blob_properties(self, **kwargs):
+        return await asyncio.to_thread(self._blob.get_blob_properties, **kwargs)
+
+    async def download_blob(self, **kwargs):
+        return FakeAsyncDownload(await asyncio.to_thread(self._blob.download_blob, **kwargs))
+
+    async def upload_blob(self, data, overwrite=False, **kwargs):
+        return await asyncio.to_thread(self._blob.upload_blob, data, overwrite=overwrite, **kwargs)
+
+
+class FakeAsyncContainerClient:
+    def __init__(self, container_client):
+        self._container = container_client
+
+    def get_blob_client(self, blob):
+        return FakeAsyncBlobClient(self._container.get_blob_client(blob))
+
+
+class FakeAsyncBlobServiceClient(FakeBlobServiceClient):
+    def get_container_client(self, container):
+        return FakeAsyncContainerClient(super().get_container_client(container))
+
+    def get_blob_client(self, container, blob):
+        return FakeAsyncBlobClient(super().get_blob_client(container, blob))
+
+    async def close(self):
+        pass
+
+
+def install_fake_blob(latency=0.0, bandwidth=None, directory=None):
+    """Route every BlobServiceClient.from_connection_string(), sync and aio,
+    to a fake backend and return it. Call before the app creates its
+    clients."""
+    from azure.storage.blob import BlobServiceClient, aio
+
+    backend = FakeBlobBackend(latency=latency, bandwidth=bandwidth, directory=directory)
+    BlobServiceClient.from_connection_string = classmethod(
+        lambda cls, conn_str, **kwargs: FakeBlobServiceClient(backend)
+    )
+    aio.BlobServiceClient.from_connection_string = classmethod(
+        lambda cls, conn_str, **kwargs: FakeAsyncBlobServiceClient(backend)
+    )
+    os.environ.setdefault("AZURE_STORAGE_CONNECTION_STRING", BENCH_CONNECTION_STRING)
+    os.environ.setdefault("AZURE_CONTAINER_NAME", "bench")
+    os.environ.setdefault("AZURE_BLOB_NAME", "db.json")
+    os.environ.setdefault("AZURE_DATASET_CONTAINER_NAME", "icarwebsite")
+    return backend
+
+
+def seed_datasets(backend, directory, encoding=None):
+    """Upload TestDataSet.csv and ActualMilkYields.csv from a directory (the
+    repository root, or a herd from benchmarks.herd) where datasets.py looks
+    for them, optionally compressed ("gzip", "zstd")"""
+    from api.v1.utils import compression, datasets
+
+    container = os.getenv("AZURE_DATASET_CONTAINER_NAME", "icarwebsite")
+    for path, filename in ((datasets.TEST_DATASET_BLOB_PATH, "TestDataSet.csv"),
+                           (datasets.ACTUAL_DATASET_BLOB_PATH, "ActualMilkYields.csv")):
+        with open(os.path.join(directory, filename), "rb") as f:
+            backend.blobs.put(container, path, compression.compress(f.read(), encoding))
+
+
+def stub_auth(subject="bench@example.com"):
+    """Accept any bearer token as a valid token for `subject`"""
+    os.environ.setdefault("AUTH0_DOMAIN", "bench.example.com")
+    os.environ.setdefault("AUTH0_AUDIENCE", "bench")
+    from authlib.jose import JsonWebKey
+
+    from api.v1.views.validator import validator
+
+    header = {"alg": "RS256", "kid": "bench"}
+
+    def authenticate_token(token_string):
+        now = int(time.time())
+        payload = {
+            "iss": validator.claims_options["iss"]["value"],
+            "aud": validator.claims_options["aud"]["value"],
+            "sub": subject,
+            "iat": now,
+            "exp": now + 3600,
+        }
+        return validator.token_cls(payload, header, options=validator.claims_options)
+
+    validator.authenticate_token = authenticate_token
+    # Nothing is verified, so an empty key set stands in for the Auth0 JWKS
+    keys = JsonWebKey.import_key_set({"keys": []})
+    validator.jwks.key_set = keys
+    validator.jwks.fetched_at = time.monotonic()
+    validator.jwks.fetch = lambda: keys
+    return validator
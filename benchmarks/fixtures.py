@@ -0,0 +1,127 @@
+#!/usr/bin/python3
+"""Synthetic storage documents for the benchmarks
+
+A fixture of size N holds N users, N generates (one test set per user) and N
+submissions (one per generate), in the JSON layout FileStorage saves. Test
+sets sample real TestIds from TestDataSet.csv so /compare finds actual yields.
+
+    python -m benchmarks.fixtures --size 10k --output db.json
+"""
+
+import argparse
+import datetime
+import json
+import os
+import uuid
+
+import numpy as np
+import pandas as pd
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SIZES = {"1k": 1_000, "10k": 10_000, "100k": 100_000}
+ANIMALS = 300  # animals per generated test set, as in /generate
+
+COUNTRIES = ["Netherlands", "Germany", "France", "Ireland", "United States", "Canada", "Kenya", "India"]
+METHODS = ["TIM", "ICAR", "Wood", "Wilmink", "Best prediction", "Legendre"]
+ORGANIZATIONS = [f"Dairy Organization {i}" for i in range(50)]
+START = datetime.datetime(2025, 1, 1)
+
+
+def size_count(size):
+    """Number of objects per class for a size name ("10k") or number"""
+    return SIZES[size] if size in SIZES else int(size)
+
+
+def bench_email(i):
+    return f"user{i}@bench.example.com"
+
+
+def _uuid(rng):
+    return str(uuid.UUID(bytes=rng.bytes(16), version=4))
+
+
+def _timestamp(rng):
+    return (START + datetime.timedelta(seconds=int(rng.integers(0, 365 * 86400)))).isoformat()
+
+
+def _record(cls, obj_id, created_at, **attrs):
+    attrs.update({"id": obj_id, "created_at": created_at, "updated_at": created_at, "__class__": cls})
+    return attrs
+
+
+def test_animals(dataset_dir=REPO_ROOT):
+    """(TestIds, parity) of every animal in TestDataSet.csv"""
+    df = pd.read_csv(os.path.join(dataset_dir, "TestDataSet.csv"), usecols=["TestId", "Parity"])
+    first = df.groupby("TestId")["Parity"].first()
+    return first.index.to_numpy(), first.to_numpy()
+
+
+def build_document(size, animals=ANIMALS, seed=0, dataset_dir=REPO_ROOT):
+    """Storage document ({"Class.id": attrs}) with `size` objects per class,
+    sampling animals from the TestDataSet.csv in dataset_dir"""
+    n = size_count(size)
+    rng = np.random.default_rng(seed)
+    test_ids, parities = test_animals(dataset_dir)
+    animals = min(animals, len(test_ids))
+
+    document = {}
+    for i in range(n):
+        user_id, generate_id, submission_id = _uuid(rng), _uuid(rng), _uuid(rng)
+        created_at = _timestamp(rng)
+        organization = ORGANIZATIONS[i % len(ORGANIZATIONS)] if i % 5 else ""
+        document[f"User.{user_id}"] = _record(
+            "User", user_id, created_at,
+            organization=organization, name=f"Bench User {i}", email=bench_email(i),
+        )
+
+        picked = rng.choice(len(test_ids), animals, replace=False)
+        reference = rng.normal(9500, 1800, animals).round(1)
+        download_url = f"https://bench.blob.core.windows.net/bench/generated/{generate_id}.xlsx"
+        document[f"Generate.{generate_id}"] = _record(
+            "Generate", generate_id, created_at,
+            user_id=user_id,
+            download_url=download_url,
+            test_obj_ids=test_ids[picked].tolist(),
+            calculated_milk_yields=reference.tolist(),
+            parity=parities[picked].tolist(),
+        )
+
+        submitted = (reference * rng.normal(1.0, 0.04, animals)).round(1)
+        document[f"Submission.{submission_id}"] = _record(
+            "Submission", submission_id, _timestamp(rng),
+            calculation_method=METHODS[i % len(METHODS)],
+            organization=organization,
+            country=COUNTRIES[i % len(COUNTRIES)],
+            generate_id=generate_id,
+            notes="",
+            download_url=download_url,
+            test_obj_ids=test_ids[picked].tolist(),
+            calculated_milk_yields=submitted.tolist(),
+        )
+    return document
+
+
+def document_bytes(size, animals=ANIMALS, seed=0, dataset_dir=REPO_ROOT):
+    """build_document() serialized the way FileStorage.save writes it"""
+    return json.dumps(build_document(size, animals, seed, dataset_dir)).encode("utf-8")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--size", default="1k", help=f"{', '.join(SIZES)} or a number")
+    parser.add_argument("--animals", type=int, default=ANIMALS)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--datasets", default=REPO_ROOT,
+                        help="directory with the TestDataSet.csv to sample animals from")
+    parser.add_argument("--output", required=True)
+    args = parser.parse_args()
+
+    data = document_bytes(args.size, args.animals, args.seed, args.datasets)
+    with open(args.output, "wb") as f:
+        f.write(data)
+    print(f"{args.output}: {size_count(args.size)} objects per class, {len(data) / 1e6:.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,32 @@
+"""Gunicorn settings for load tests: the production settings of
+gunicorn.conf.py, served from a fake blob backend with JWT validation stubbed
+
+    ICAR_BENCH_BLOB_DIR=/tmp/blobs gunicorn -c benchmarks/gunicorn_bench.py
+
+Blobs live as files in ICAR_BENCH_BLOB_DIR so every worker (and the load
+tester that seeded the storage document) sees the same data. Optional:
+ICAR_BENCH_LATENCY (seconds per blob call), ICAR_BENCH_BANDWIDTH (MB/s) and
+ICAR_BENCH_DATASETS (directory with the CSV datasets, default the repository).
+"""
+
+import os
+import sys
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if REPO_ROOT not in sys.path:
+    sys.path.insert(0, REPO_ROOT)
+
+_production = os.path.join(REPO_ROOT, "gunicorn.conf.py")
+with open(_production) as _f:
+    exec(compile(_f.read(), _production, "exec"))
+
+from benchmarks import fakes  # noqa: E402
+
+_bandwidth = os.getenv("ICAR_BENCH_BANDWIDTH")
+_backend = fakes.install_fake_blob(
+    latency=float(os.getenv("ICAR_BENCH_LATENCY", "0")),
+    bandwidth=float(_bandwidth) * 1e6 if _bandwidth else None,
+    directory=os.environ["ICAR_BENCH_BLOB_DIR"],
+)
+fakes.stub_auth()
+fakes.seed_datasets(_backend, os.getenv("ICAR_BENCH_DATASETS", REPO_ROOT))
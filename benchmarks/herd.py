@@ -0,0 +1,209 @@
+#!/usr/bin/python3
+"""Synthetic herds shaped like TestDataSet.csv and ActualMilkYields.csv
+
+Every animal gets one lactation whose daily yield follows Wood's curve
+
+    y(t) = a * t**b * exp(-c * t)
+
+with parameters drawn around per-parity means (first-parity cows peak later
+and lower, and are more persistent) plus per-animal variation. Test days are
+recorded roughly every four weeks from the first month until 305 days in
+milk, with measurement noise; the actual yield is the 305-day sum of the
+animal's own daily curve.
+
+Animals are generated in vectorized chunks and each chunk is appended to the
+output files straight away, so memory depends on --chunk-size (about 0.6 GB
+at the default 50k animals), not on the herd size:
+
+    python -m benchmarks.herd --animals 1000000 --output-dir /tmp/herd
+    python -m benchmarks.herd --animals 50000 --format parquet --output-dir /tmp/herd
+
+CSV files use the app's names (TestDataSet.csv, ActualMilkYields.csv), so the
+directory can be uploaded as the dataset container. Parquet output needs
+pyarrow.
+"""
+
+import argparse
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+TEST_DAY_COLUMNS = [
+    "TestId", "TestDate", "EventType", "CalvingDate", "BirthDate",
+    "Parity", "DaysInMilk", "DailyMilkingYield",
+]
+ACTUAL_COLUMNS = ["TestId", "TotalActualProduction"]
+LACTATION_DAYS = 305
+
+# Share of animals per parity (1..7), as in TestDataSet.csv
+PARITY_SHARES = np.array([0.22, 0.24, 0.18, 0.20, 0.11, 0.03, 0.02])
+# Mean Wood parameters (a, b, c) for parity 1, 2 and 3+
+WOOD_PARAMETERS = np.array([
+    [15.5, 0.20, 0.0021],
+    [20.0, 0.23, 0.0034],
+    [21.0, 0.24, 0.0037],
+])
+ANIMAL_SPREAD = (0.12, 0.03, 0.0004)  # per-animal sd of log(a), b and c
+TEST_DAY_NOISE = 0.08                 # relative sd of a recorded daily yield
+MAX_TEST_DAYS = 14
+
+CALVING_START = np.datetime64("2018-01-01")
+CALVING_DAYS = 6 * 365
+
+
+def wood(t, a, b, c):
+    """Daily yield (kg) at day in milk t"""
+    return a * np.power(t, b) * np.exp(-c * t)
+
+
+def _animals(rng, first_id, n):
+    """Per-animal parity, Wood parameters and dates"""
+    parity = rng.choice(np.arange(1, len(PARITY_SHARES) + 1), n, p=PARITY_SHARES)
+    mean = WOOD_PARAMETERS[np.minimum(parity, 3) - 1]
+    a = mean[:, 0] * np.exp(rng.normal(0, ANIMAL_SPREAD[0], n))
+    b = np.clip(mean[:, 1] + rng.normal(0, ANIMAL_SPREAD[1], n), 0.05, None)
+    c = np.clip(mean[:, 2] + rng.normal(0, ANIMAL_SPREAD[2], n), 0.0005, None)
+
+    calving = CALVING_START + rng.integers(0, CALVING_DAYS, n).astype("timedelta64[D]")
+    # First calving at about two years, then roughly one calving a year
+    age = 730 + (parity - 1) * 395 + rng.integers(-45, 90, n)
+    birth = calving - age.astype("timedelta64[D]")
+    return {
+        "TestId": np.arange(first_id, first_id + n),
+        "Parity": parity,
+        "a": a, "b": b, "c": c,
+        "CalvingDate": calving,
+        "BirthDate": birth,
+    }
+
+
+def _test_days(rng, animals):
+    """Test-day records of a chunk: first test in the first month, then every
+    three to six weeks (mostly four) until 305 days in milk"""
+    n = len(animals["TestId"])
+    first = rng.integers(1, 31, n)
+    gaps = rng.choice([21, 28, 28, 28, 28, 28, 28, 35], (n, MAX_TEST_DAYS - 1))
+    dim = np.concatenate([first[:, None], first[:, None] + np.cumsum(gaps, axis=1)], axis=1)
+    keep = dim <= LACTATION_DAYS
+    rows, _ = np.nonzero(keep)
+    dim = dim[keep]
+
+    expected = wood(dim, animals["a"][rows], animals["b"][rows], animals["c"][rows])
+    recorded = np.maximum(expected * rng.normal(1, TEST_DAY_NOISE, len(dim)), 0.5).round(1)
+    calving = animals["CalvingDate"][rows]
+    return pd.DataFrame({
+        "TestId": animals["TestId"][rows],
+        "TestDate": np.datetime_as_string(calving + dim.astype("timedelta64[D]"), unit="D"),
+        "EventType": "MilkRecording",
+        "CalvingDate": np.datetime_as_string(calving, unit="D"),
+        "BirthDate": np.datetime_as_string(animals["BirthDate"][rows], unit="D"),
+        "Parity": animals["Parity"][rows],
+        "DaysInMilk": dim,
+        "DailyMilkingYield": recorded,
+    }, columns=TEST_DAY_COLUMNS)
+
+
+def _actual_yields(animals, block=20_000):
+    """305-day sum of each animal's daily curve, in blocks of animals to
+    bound the (animals x 305) day matrix"""
+    days = np.arange(1, LACTATION_DAYS + 1, dtype=np.float64)
+    log_days = np.log(days)
+    totals = np.empty(len(animals["TestId"]))
+    for start in range(0, len(totals), block):
+        s = slice(start, start + block)
+        a, b, c = (animals[k][s][:, None] for k in ("a", "b", "c"))
+        totals[s] = (a * np.exp(b * log_days - c * days)).sum(axis=1)
+    return pd.DataFrame({"TestId": animals["TestId"], "TotalActualProduction": totals.round(1)},
+                        columns=ACTUAL_COLUMNS)
+
+
+def generate_herd(animals, chunk_size=50_000, seed=0, first_id=1):
+    """Yield (test_days, actual_yields) DataFrames per chunk of animals"""
+    rng = np.random.default_rng(seed)
+    for start in range(0, animals, chunk_size):
+        n = min(chunk_size, animals - start)
+        chunk = _animals(rng, first_id + start, n)
+        yield _test_days(rng, chunk), _actual_yields(chunk)
+
+
+class _CsvWriter:
+    def __init__(self, path):
+        self.file = open(path, "w", newline="")
+        self.header = True
+
+    def write(self, df):
+        df.to_csv(self.file, header=self.header, index=False)
+        self.header = False
+
+    def close(self):
+        self.file.close()
+
+
+class _ParquetWriter:
+    def __init__(self, path):
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            raise RuntimeError("Parquet output requires pyarrow (pip install pyarrow)")
+        self.pa = pyarrow
+        self.pq = pyarrow.parquet
+        self.path = path
+        self.writer = None
+
+    def write(self, df):
+        table = self.pa.Table.from_pandas(df, preserve_index=False)
+        if self.writer is None:
+            self.writer = self.pq.ParquetWriter(self.path, table.schema)
+        self.writer.write_table(table)
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+
+
+WRITERS = {"csv": _CsvWriter, "parquet": _ParquetWriter}
+
+
+def write_herd(animals, output_dir, fmt="csv", chunk_size=50_000, seed=0, first_id=1):
+    """Stream a synthetic herd to TestDataSet.<fmt> and ActualMilkYields.<fmt>.
+
+    Returns (test-day rows, animals) written.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    writer = WRITERS[fmt]
+    test_writer = writer(os.path.join(output_dir, f"TestDataSet.{fmt}"))
+    actual_writer = writer(os.path.join(output_dir, f"ActualMilkYields.{fmt}"))
+    rows = 0
+    try:
+        for test_days, actual in generate_herd(animals, chunk_size, seed, first_id):
+            test_writer.write(test_days)
+            actual_writer.write(actual)
+            rows += len(test_days)
+    finally:
+        test_writer.close()
+        actual_writer.close()
+    return rows, animals
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--animals", type=int, default=100_000)
+    parser.add_argument("--output-dir", required=True)
+    parser.add_argument("--format", choices=sorted(WRITERS), default="csv")
+    parser.add_argument("--chunk-size", type=int, default=50_000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--first-id", type=int, default=1)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    rows, animals = write_herd(args.animals, args.output_dir, args.format,
+                               args.chunk_size, args.seed, args.first_id)
+    print(f"{animals} animals, {rows} test days written to {args.output_dir} "
+          f"in {time.perf_counter() - start:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
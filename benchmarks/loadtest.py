@@ -0,0 +1,488 @@
+#!/usr/bin/python3
+"""Concurrent load test of the API under gunicorn
+
+Starts `gunicorn -c benchmarks/gunicorn_bench.py` (production settings, fake
+blob backend, JWT validation stubbed) on a seeded storage document, waits for
+/api/v1/ready, then lets many concurrent clients - one per organization, each
+acting as one of the fixture's users - send a weighted mix of requests for a
+fixed time. Reports throughput, latency percentiles and errors per endpoint,
+plus CPU and memory of the gunicorn processes, and writes them to JSON.
+
+    python -m benchmarks.loadtest --clients 50 --duration 60 --workers 4
+    python -m benchmarks.loadtest --mix generate=1,submit=1 --latency 0.02
+    python -m benchmarks.loadtest --url http://127.0.0.1:5000   # running server
+
+The client side needs `requests`; /generate needs `lactationcurve` on the server.
+"""
+
+import argparse
+import datetime
+import json
+import os
+import platform
+import random
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import requests
+
+from benchmarks.bench_api import ADMIN_EMAIL, AUTH_HEADERS, git_commit, percentile, submission_excel
+from benchmarks.fakes import DirectoryBlobs
+from benchmarks.fixtures import ANIMALS, REPO_ROOT, bench_email, build_document, size_count
+
+BENCH_CONFIG = os.path.join(REPO_ROOT, "benchmarks", "gunicorn_bench.py")
+BENCH_ENV = {
+    "AZURE_STORAGE_CONNECTION_STRING": (
+        "DefaultEndpointsProtocol=https;AccountName=bench;"
+        "AccountKey=YmVuY2g=;EndpointSuffix=core.windows.net"
+    ),
+    "AZURE_DATASET_STORAGE_CONNECTION_STRING": "",
+    "AZURE_CONTAINER_NAME": "bench",
+    "AZURE_BLOB_NAME": "db.json",
+    "AZURE_DATASET_CONTAINER_NAME": "icarwebsite",
+    "ICAR_REQUEST_LOG": "0",
+}
+DEFAULT_MIX = "generate=1,submit=2,submissions=3,compare=3,pdf=1,analytics=1"
+
+
+# =======================================
+# CLIENT REQUESTS
+# =======================================
+
+class Organization:
+    """One fixture user and the objects it owns"""
+
+    def __init__(self, index, document, generates_by_user, submissions_by_generate):
+        self.email = bench_email(index)
+        user_id = next(v["id"] for v in document.values()
+                       if v["__class__"] == "User" and v["email"] == self.email)
+        self.generate = generates_by_user[user_id]
+        self.submission_id = submissions_by_generate[self.generate["id"]]
+        self.submit_file = submission_excel(self.generate)
+
+
+def _generate(session, url, org, timeout=None):
+    return session.get(f"{url}/api/v1/generate", params={"email": org.email, "name": "Load Test"},
+                       headers=AUTH_HEADERS, timeout=timeout)
+
+
+def _submit(session, url, org, timeout=None):
+    return session.post(
+        f"{url}/api/v1/submit", params={"email": org.email}, headers=AUTH_HEADERS,
+        timeout=timeout,
+        files={"file": ("submission.xlsx", org.submit_file)},
+        data={
+            "test_set_id": org.generate["id"],
+            "calculation_method": "TIM",
+            "organization": "Load Test Organization",
+            "country": "Netherlands",
+        },
+    )
+
+
+def _submissions(session, url, org, timeout=None):
+    return session.get(f"{url}/api/v1/submissions", params={"email": org.email},
+                       headers=AUTH_HEADERS, timeout=timeout)
+
+
+def _submissions_admin(session, url, org, timeout=None):
+    return session.get(f"{url}/api/v1/submissions", params={"email": ADMIN_EMAIL, "admin": "yes"},
+                       headers=AUTH_HEADERS, timeout=timeout)
+
+
+def _compare(session, url, org, timeout=None):
+    return session.get(f"{url}/api/v1/compare/{org.submission_id}", timeout=timeout)
+
+
+def _pdf(session, url, org, timeout=None):
+    return session.get(f"{url}/api/v1/compare/{org.submission_id}", params={"download": "true"},
+                       timeout=timeout)
+
+
+def _status(session, url, org, timeout=None):
+    return session.get(f"{url}/api/v1/status", timeout=timeout)
+
+
+def _profile(session, url, org, timeout=None):
+    return session.get(f"{url}/api/v1/profile", params={"email": org.email},
+                       headers=AUTH_HEADERS, timeout=timeout)
+
+
+def _analytics(session, url, org, timeout=None):
+    return session.get(f"{url}/api/v1/analytics", params={"email": ADMIN_EMAIL, "admin": "yes"},
+                       headers=AUTH_HEADERS, timeout=timeout)
+
+
+ENDPOINTS = {
+    "generate": _generate,
+    "submit": _submit,
+    "submissions": _submissions,
+    "submissions.admin": _submissions_admin,
+    "compare": _compare,
+    "pdf": _pdf,
+    "analytics": _analytics,
+    "status": _status,
+    "profile": _profile,
+}
+
+
+def parse_mix(text):
+    """"generate=1,submit=2" -> {"generate": 1.0, "submit": 2.0}"""
+    mix = {}
+    for part in text.split(","):
+        if not part.strip():
+            continue
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in ENDPOINTS:
+            raise ValueError(f"unknown endpoint {name!r}; choose from {', '.join(ENDPOINTS)}")
+        mix[name] = float(weight or 1)
+    if not mix or sum(mix.values()) <= 0:
+        raise ValueError("the mix needs at least one endpoint with a positive weight")
+    return mix
+
+
+def run_client(url, org, mix, deadline, think, samples, seed, timeout):
+    """Send requests until the deadline; appends (endpoint, start, seconds, status)"""
+    rng = random.Random(seed)
+    names, weights = list(mix), list(mix.values())
+    session = requests.Session()
+    while time.monotonic() < deadline:
+        name = rng.choices(names, weights)[0]
+        start = time.monotonic()
+        try:
+            response = ENDPOINTS[name](session, url, org, timeout)
+            status = response.status_code
+            response.content  # noqa: B018 - include the body transfer
+        except requests.RequestException as e:
+            status = type(e).__name__
+        samples.append((name, start, time.monotonic() - start, status))
+        if think:
+            time.sleep(rng.expovariate(1 / think))
+
+
+# =======================================
+# SERVER
+# =======================================
+
+class ResourceSampler(threading.Thread):
+    """Samples CPU time and memory of a process tree from /proc"""
+
+    def __init__(self, root_pid, interval=0.5):
+        super().__init__(name="resource-sampler", daemon=True)
+        self.root_pid = root_pid
+        self.interval = interval
+        self.stop_event = threading.Event()
+        self.first_cpu, self.last_cpu = {}, {}
+        self.peak_rss, self.peak_pss = 0, 0
+        self.peak_processes = 0
+        self.ticks = os.sysconf("SC_CLK_TCK")
+        self.page = os.sysconf("SC_PAGE_SIZE")
+        self.started = self.stopped = None
+
+    @staticmethod
+    def available():
+        return os.path.exists("/proc/self/stat")
+
+    def _tree(self):
+        parents = {}
+        for entry in os.listdir("/proc"):
+            if entry.isdigit():
+                try:
+                    with open(f"/proc/{entry}/stat") as f:
+                        fields = f.read().rsplit(")", 1)[1].split()
+                    parents.setdefault(int(fields[1]), []).append(int(entry))
+                except (OSError, IndexError):
+                    continue
+        tree, todo = [], [self.root_pid]
+        while todo:
+            pid = todo.pop()
+            tree.append(pid)
+            todo.extend(parents.get(pid, []))
+        return tree
+
+    def _sample(self, pid):
+        with open(f"/proc/{pid}/stat") as f:
+            fields = f.read().rsplit(")", 1)[1].split()
+        cpu = (int(fields[11]) + int(fields[12])) / self.ticks
+        with open(f"/proc/{pid}/statm") as f:
+            rss = int(f.read().split()[1]) * self.page
+        pss = 0
+        try:
+            with open(f"/proc/{pid}/smaps_rollup") as f:
+                for line in f:
+                    if line.startswith("Pss:"):
+                        pss = int(line.split()[1]) * 1024
+                        break
+        except OSError:
+            pass
+        return cpu, rss, pss
+
+    def sample(self):
+        total_rss = total_pss = 0
+        tree = self._tree()
+        for pid in tree:
+            try:
+                cpu, rss, pss = self._sample(pid)
+            except (OSError, ValueError, IndexError):
+                continue
+            self.first_cpu.setdefault(pid, cpu)
+            self.last_cpu[pid] = cpu
+            total_rss += rss
+            total_pss += pss
+        self.peak_rss = max(self.peak_rss, total_rss)
+        self.peak_pss = max(self.peak_pss, total_pss)
+        self.peak_processes = max(self.peak_processes, len(tree))
+
+    def run(self):
+        self.started = time.monotonic()
+        while not self.stop_event.is_set():
+            self.sample()
+            self.stop_event.wait(self.interval)
+        self.sample()
+        self.stopped = time.monotonic()
+
+    def stop(self):
+        self.stop_event.set()
+        self.join()
+
+    def report(self):
+        cpu = sum(self.last_cpu[pid] - self.first_cpu[pid] for pid in self.last_cpu)
+        elapsed = (self.stopped or time.monotonic()) - self.started
+        return {
+            "cpu_seconds": round(cpu, 2),
+            "cpu_percent": round(100 * cpu / elapsed, 1) if elapsed else None,
+            "peak_rss_mb": round(self.peak_rss / 1e6, 1),
+            "peak_pss_mb": round(self.peak_pss / 1e6, 1) if self.peak_pss else None,
+            "peak_processes": self.peak_processes,
+        }
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(args, workdir, blob_dir, datasets):
+    """Start gunicorn with the bench config; returns (process, url, log path)"""
+    port = args.port or _free_port()
+    env = dict(os.environ, **BENCH_ENV)
+    env.update({
+        "ICAR_BENCH_BLOB_DIR": blob_dir,
+        "ICAR_BENCH_DATASETS": datasets,
+        "ICAR_BENCH_LATENCY": str(args.latency),
+        "ICAR_SNAPSHOT_DIR": os.path.join(workdir, "snapshot"),
+        "PYTHONPATH": os.pathsep.join(filter(None, [REPO_ROOT, os.getenv("PYTHONPATH")])),
+    })
+    if args.bandwidth:
+        env["ICAR_BENCH_BANDWIDTH"] = str(args.bandwidth)
+    command = [sys.executable, "-m", "gunicorn", "-c", BENCH_CONFIG,
+               "--bind", f"127.0.0.1:{port}", "--workers", str(args.workers)]
+    if args.threads > 1:
+        command += ["--threads", str(args.threads)]
+    log_path = os.path.join(workdir, "gunicorn.log")
+    with open(log_path, "wb") as log:
+        process = subprocess.Popen(command, cwd=workdir, env=env, stdout=log,
+                                   stderr=subprocess.STDOUT)
+    return process, f"http://127.0.0.1:{port}", log_path
+
+
+def wait_until_ready(url, process, timeout):
+    """Wait for the warm-up to finish; a failed warm-up is reported, not fatal"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process is not None and process.poll() is not None:
+            raise RuntimeError(f"gunicorn exited with status {process.returncode}")
+        try:
+            response = requests.get(f"{url}/api/v1/ready", timeout=5)
+            if response.status_code == 200:
+                return
+            state = response.json()
+            if state.get("status") == "failed":
+                failed = [name for name, step in state.get("steps", {}).items() if not step.get("ok")]
+                print(f"warning: warm-up failed ({', '.join(failed)}); loading lazily instead")
+                return
+        except (requests.RequestException, ValueError):
+            pass
+        time.sleep(0.5)
+    raise RuntimeError(f"{url} was not ready within {timeout}s")
+
+
+def stop_server(process):
+    process.terminate()
+    try:
+        process.wait(timeout=30)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+
+
+# =======================================
+# REPORT
+# =======================================
+
+def summarize(samples, duration):
+    by_endpoint = {}
+    for name, _, seconds, status in samples:
+        by_endpoint.setdefault(name, []).append((seconds, status))
+    by_endpoint["all"] = [(seconds, status) for _, _, seconds, status in samples]
+
+    summary = {}
+    for name, results in by_endpoint.items():
+        ms = [seconds * 1000 for seconds, _ in results]
+        errors = sum(1 for _, status in results if not (isinstance(status, int) and status < 400))
+        statuses = {}
+        for _, status in results:
+            statuses[str(status)] = statuses.get(str(status), 0) + 1
+        summary[name] = {
+            "requests": len(results),
+            "errors": errors,
+            "error_rate": round(errors / len(results), 4),
+            "throughput_rps": round(len(results) / duration, 2),
+            "mean_ms": round(statistics.fmean(ms), 1),
+            "p50_ms": round(percentile(ms, 0.50), 1),
+            "p95_ms": round(percentile(ms, 0.95), 1),
+            "p99_ms": round(percentile(ms, 0.99), 1),
+            "max_ms": round(max(ms), 1),
+            "statuses": dict(sorted(statuses.items())),
+        }
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", help="load an already running server instead of starting one")
+    parser.add_argument("--clients", type=int, default=50, help="concurrent clients (organizations)")
+    parser.add_argument("--duration", type=float, default=60, help="seconds of load")
+    parser.add_argument("--mix", default=DEFAULT_MIX,
+                        help=f"endpoint weights (default {DEFAULT_MIX}); "
+                             f"endpoints: {', '.join(ENDPOINTS)}")
+    parser.add_argument("--think", type=float, default=0.0,
+                        help="mean pause in seconds between a client's requests")
+    parser.add_argument("--timeout", type=float, default=None, help="per-request timeout (s)")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--threads", type=int, default=1, help="threads per worker (gthread)")
+    parser.add_argument("--port", type=int, default=None)
+    parser.add_argument("--size", default="1k", help="fixture size (see benchmarks.fixtures)")
+    parser.add_argument("--animals", type=int, default=ANIMALS)
+    parser.add_argument("--datasets", default=REPO_ROOT)
+    parser.add_argument("--latency", type=float, default=0.0, help="simulated seconds per blob call")
+    parser.add_argument("--bandwidth", type=float, default=None, help="simulated blob MB/s")
+    parser.add_argument("--startup-timeout", type=float, default=300)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default=None,
+                        help="JSON results file (default benchmarks/results/loadtest-<time>.json)")
+    args = parser.parse_args()
+
+    try:
+        mix = parse_mix(args.mix)
+    except ValueError as e:
+        parser.error(str(e))
+    if args.clients > size_count(args.size):
+        parser.error("--clients cannot exceed the number of fixture users (--size)")
+
+    started = datetime.datetime.now(datetime.timezone.utc)
+    output = os.path.abspath(args.output or os.path.join(
+        REPO_ROOT, "benchmarks", "results", f"loadtest-{started.strftime('%Y%m%dT%H%M%SZ')}.json"
+    ))
+    datasets = os.path.abspath(args.datasets)
+
+    document = build_document(args.size, args.animals, dataset_dir=datasets)
+    generates_by_user, submissions_by_generate = {}, {}
+    for value in document.values():
+        if value["__class__"] == "Generate":
+            generates_by_user[value["user_id"]] = value
+        elif value["__class__"] == "Submission":
+            submissions_by_generate[value["generate_id"]] = value["id"]
+    organizations = [Organization(i, document, generates_by_user, submissions_by_generate)
+                     for i in range(args.clients)]
+
+    process = log_path = None
+    sampler = None
+    url = args.url.rstrip("/") if args.url else None
+    try:
+        if url is None:
+            workdir = tempfile.mkdtemp(prefix="icar-loadtest-")
+            blob_dir = os.path.join(workdir, "blobs")
+            DirectoryBlobs(blob_dir).put(BENCH_ENV["AZURE_CONTAINER_NAME"], BENCH_ENV["AZURE_BLOB_NAME"],
+                                         json.dumps(document).encode("utf-8"))
+            process, url, log_path = start_server(args, workdir, blob_dir, datasets)
+            print(f"gunicorn: {args.workers} workers x {args.threads} threads at {url} (log {log_path})")
+        del document
+        wait_until_ready(url, process, args.startup_timeout)
+
+        if process is not None and ResourceSampler.available():
+            sampler = ResourceSampler(process.pid)
+            sampler.start()
+
+        samples = []
+        deadline = time.monotonic() + args.duration
+        load_started = time.monotonic()
+        clients = [
+            threading.Thread(target=run_client, name=f"client-{i}", daemon=True,
+                             args=(url, org, mix, deadline, args.think, samples,
+                                   args.seed * 1_000_003 + i, args.timeout))
+            for i, org in enumerate(organizations)
+        ]
+        for client in clients:
+            client.start()
+        for client in clients:
+            client.join()
+        duration = time.monotonic() - load_started
+        if sampler is not None:
+            sampler.stop()
+    finally:
+        if process is not None:
+            stop_server(process)
+
+    if not samples:
+        sys.exit("no requests completed")
+    summary = summarize(samples, duration)
+    print(f"{'endpoint':<18}{'requests':>9}{'errors':>8}{'req/s':>8}"
+          f"{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for name, row in summary.items():
+        print(f"{name:<18}{row['requests']:>9}{row['errors']:>8}{row['throughput_rps']:>8.2f}"
+              f"{row['p50_ms']:>10.1f}{row['p95_ms']:>10.1f}{row['p99_ms']:>10.1f}")
+    resources = sampler.report() if sampler is not None else None
+    if resources:
+        print(f"server: {resources['cpu_seconds']} CPU s ({resources['cpu_percent']}%), "
+              f"peak RSS {resources['peak_rss_mb']} MB, peak PSS {resources['peak_pss_mb']} MB, "
+              f"{resources['peak_processes']} processes")
+
+    report = {
+        "benchmark": "loadtest",
+        "started_at": started.isoformat(),
+        "commit": git_commit(),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "settings": {
+            "url": args.url,
+            "clients": args.clients,
+            "duration_s": round(duration, 2),
+            "mix": mix,
+            "think_s": args.think,
+            "workers": args.workers,
+            "threads": args.threads,
+            "size": args.size,
+            "animals": args.animals,
+            "latency_s": args.latency,
+            "bandwidth_mb_s": args.bandwidth,
+        },
+        "endpoints": summary,
+        "server": resources,
+    }
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"results written to {output}")
+
+
+if __name__ == "__main__":
+    main()
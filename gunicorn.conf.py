@@ -0,0 +1,54 @@
+"""Gunicorn settings for the ICAR API
+
+Run from the repository root:
+
+    gunicorn -c gunicorn.conf.py
+
+The app is imported and warmed up once in the master process (reference
+datasets, precomputed reference yields, logos, JWKS, storage snapshot), then
+forked, so workers share that read-only state copy-on-write. Each worker
+re-creates its blob clients and process pool after the fork, and closes its
+async blob clients and event loop when it exits.
+"""
+
+import os
+
+wsgi_app = "api.v1.app:app"
+bind = f"0.0.0.0:{os.getenv('PORT', '5000')}"
+workers = int(os.getenv("WEB_CONCURRENCY", "4"))
+# Threads per worker (gthread when above 1)
+threads = int(os.getenv("GUNICORN_THREADS", "1"))
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "600"))
+preload_app = True
+# Set ICAR_WARMUP=0 to skip the warm-up (workers then load everything lazily)
+warm_up_on_start = os.getenv("ICAR_WARMUP", "1") != "0"
+
+
+def on_starting(server):
+    """Load shared read-only state in the master, before any worker forks"""
+    # Requests the host serves at once; admission lanes are sized from it
+    os.environ.setdefault("ICAR_ADMISSION_CAPACITY", str(server.cfg.workers * server.cfg.threads))
+    if not warm_up_on_start:
+        return
+    from api.v1.utils import warmup
+
+    ok = warmup.warm_up(freeze=True)
+    server.log.info(
+        "Warm-up %s: %s", "finished" if ok else "incomplete",
+        ", ".join(f"{name} {step['ms']} ms" + ("" if step["ok"] else " (failed)")
+                  for name, step in warmup.state["steps"].items())
+    )
+
+
+def post_fork(server, worker):
+    """Drop connections and pools inherited from the master"""
+    from api.v1.utils import warmup
+
+    warmup.after_fork()
+
+
+def worker_exit(server, worker):
+    """Close the worker's async blob clients and event loop"""
+    from api.v1.utils import aio
+
+    aio.shutdown()
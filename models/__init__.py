@@ -1,9 +1,42 @@
 #!/usr/bin/python3
-"""This module instantiates an object of class FileStorage"""
+"""This module instantiates an object of class FileStorage
 
-# from models.engine.file_storage import FileStorage
-from models.engine.blob_storage import FileStorage
+The blob engine (and the Azure SDK behind it) is only imported, connected
+and reloaded on first use, so importing models stays cheap. Set
+ICAR_LAZY_IMPORTS=0 to connect at import time instead.
+"""
 
-storage = FileStorage()
-# storage = BlobStorage()
-storage.reload()
\ No newline at end of file
+import os
+import threading
+
+
+class LazyStorage:
+    """Creates and reloads the storage engine on first attribute access"""
+
+    def __init__(self):
+        self._engine = None
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        with self._lock:
+            if self._engine is None:
+                # from models.engine.file_storage import FileStorage
+                from models.engine.blob_storage import FileStorage
+
+                engine = FileStorage()
+                # engine = BlobStorage()
+                engine.reload()
+                self._engine = engine
+        return self._engine
+
+    @property
+    def connected(self):
+        return self._engine is not None
+
+    def __getattr__(self, attr):
+        return getattr(self._engine or self._connect(), attr)
+
+
+storage = LazyStorage()
+if os.getenv("ICAR_LAZY_IMPORTS", "1") == "0":
+    storage._connect()
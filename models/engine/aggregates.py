@@ -0,0 +1,109 @@
+#!/usr/bin/python3
+"""Incrementally maintained counters over the objects held in storage"""
+
+from collections import Counter
+
+
+class AggregateStore:
+    """Keeps analytics counters up to date as objects are added or removed
+
+    Every stored key remembers what it contributed, so re-saving a modified
+    object (e.g. a user who set an organization) first retracts the old
+    contribution. Each update is O(1), and snapshot() is proportional to the
+    number of distinct buckets, not to the number of objects.
+    """
+
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        """Reset every counter"""
+        self.class_counts = Counter()
+        self.users_with_organization = 0
+        self.submissions_by_country = Counter()
+        self.submissions_by_method = Counter()
+        self.submissions_by_organization = Counter()
+        self.submissions_by_day = Counter()
+        self.submissions_by_week = Counter()
+        self._contributions = {}
+
+    def _contribution(self, obj):
+        """Describe what obj adds to the counters as a hashable tuple"""
+        cls_name = obj.__class__.__name__
+        if cls_name == "User":
+            organization = getattr(obj, "organization", "") or ""
+            return (cls_name, bool(organization.strip()))
+        if cls_name == "Submission":
+            created_at = getattr(obj, "created_at", None)
+            day = week = None
+            if hasattr(created_at, "isocalendar"):
+                day = created_at.strftime("%Y-%m-%d")
+                year, week_no, _ = created_at.isocalendar()
+                week = f"{year}-W{week_no:02d}"
+            return (
+                cls_name,
+                getattr(obj, "country", "") or "Unknown",
+                getattr(obj, "calculation_method", "") or "Unknown",
+                getattr(obj, "organization", "") or "Unknown",
+                day,
+                week,
+            )
+        return (cls_name,)
+
+    def _apply(self, contribution, sign):
+        cls_name = contribution[0]
+        _bump(self.class_counts, cls_name, sign)
+        if cls_name == "User":
+            if contribution[1]:
+                self.users_with_organization += sign
+        elif cls_name == "Submission":
+            _, country, method, organization, day, week = contribution
+            _bump(self.submissions_by_country, country, sign)
+            _bump(self.submissions_by_method, method, sign)
+            _bump(self.submissions_by_organization, organization, sign)
+            if day is not None:
+                _bump(self.submissions_by_day, day, sign)
+                _bump(self.submissions_by_week, week, sign)
+
+    def add(self, key, obj):
+        """Count obj under key, replacing whatever key counted before"""
+        self.remove(key)
+        contribution = self._contribution(obj)
+        self._contributions[key] = contribution
+        self._apply(contribution, 1)
+
+    def remove(self, key):
+        """Retract whatever key contributed"""
+        contribution = self._contributions.pop(key, None)
+        if contribution is not None:
+            self._apply(contribution, -1)
+
+    def rebuild(self, objects):
+        """Recount from a {key: obj} mapping"""
+        self.clear()
+        for key, obj in objects.items():
+            self.add(key, obj)
+
+    def count(self, cls_name):
+        return self.class_counts.get(cls_name, 0)
+
+    def snapshot(self):
+        """Plain-dict copy of every counter"""
+        return {
+            "counts": dict(self.class_counts),
+            "users_with_organization": self.users_with_organization,
+            "submissions_by_country": dict(self.submissions_by_country),
+            "submissions_by_method": dict(self.submissions_by_method),
+            "submissions_by_organization": dict(self.submissions_by_organization),
+            "submissions_by_day": dict(sorted(self.submissions_by_day.items())),
+            "submissions_by_week": dict(sorted(self.submissions_by_week.items())),
+        }
+
+
+def _bump(counter, key, sign):
+    """Add sign to counter[key], dropping keys that fall to zero"""
+    value = counter[key] + sign
+    if value:
+        counter[key] = value
+    else:
+        del counter[key]
@@ -1,9 +1,41 @@
 #!/usr/bin/python3
-"""Blob-based storage engine for ICAR project"""
+"""Blob-based storage engine for ICAR project
 
-import json
+Storage is split into partitions, each one document with its own journal
+and host snapshot (see Partition):
+
+    db.json                        the directory: every User, whose
+                                   `partition` names the document holding
+                                   its Generates and Submissions
+    db.json.partition.<name>       Generates and Submissions of one
+                                   organization, or of one user without one
+
+A user's requests load the directory and their own partition
+(reload_for(email)); admin routes load every partition in parallel
+(reload()). Users stored before partitioning have an empty `partition` and
+keep their data in db.json until move_to_partitions() is run.
+"""
+
+import hashlib
+import logging
 import os
-from azure.storage.blob import BlobServiceClient
+import random
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from azure.core import MatchConditions
+from azure.core.exceptions import (
+    ResourceExistsError, ResourceModifiedError, ResourceNotFoundError
+)
+from azure.storage.blob import BlobServiceClient, ContentSettings
+from models.engine import journal
+from models.engine.aggregates import AggregateStore
+from models.engine.indexes import IndexStore
+from models.engine.query import Query
+from models.engine.snapshot import SharedSnapshot, default_directory
+from api.v1.utils import compression, serialization
+from api.v1.utils.telemetry import registry, timed
 from models.parent_model import ParentModel
 from models.user import User
 from models.submission import Submission
@@ -12,6 +44,8 @@ from dotenv import load_dotenv
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 # Map class names to class objects
 classes = {
     'ParentModel': ParentModel,
@@ -22,11 +56,67 @@ classes = {
 
 validClasses = list(classes.values())
 
+# Workers on one host share the last known document through a local snapshot
+# (see snapshot.py); ICAR_SHARED_SNAPSHOT=0 downloads the blob on every reload
+SHARED_SNAPSHOT = os.getenv("ICAR_SHARED_SNAPSHOT", "1") != "0"
+SNAPSHOT_DIR = os.getenv("ICAR_SNAPSHOT_DIR")
+# Seconds a snapshot is trusted before the blob's ETag is checked again;
+# bounds how long writes made by other hosts can go unnoticed
+REVALIDATE_SECONDS = float(os.getenv("ICAR_STORAGE_REVALIDATE_SECONDS", "10"))
+# Saves append a record to a journal blob instead of rewriting the document,
+# which is compacted once the journal passes ICAR_JOURNAL_COMPACT_BYTES (see
+# journal.py); ICAR_STORAGE_JOURNAL=0 rewrites the whole document every save
+JOURNAL = os.getenv("ICAR_STORAGE_JOURNAL", "1") != "0"
+COMPACT_BYTES = int(os.getenv("ICAR_JOURNAL_COMPACT_BYTES", str(8 * 1024 * 1024)))
+# Times a save catches up and retries after losing a race with another writer
+WRITE_ATTEMPTS = 5
+# New users get a partition of their own organization (ICAR_STORAGE_PARTITIONS=0
+# keeps everything in the directory document, as before partitioning)
+PARTITIONS = os.getenv("ICAR_STORAGE_PARTITIONS", "1") != "0"
+# Partitions reloaded at once by reload()
+FANOUT = int(os.getenv("ICAR_STORAGE_FANOUT", "8"))
+
+WRITE_CONFLICTS = registry.counter(
+    "icar_storage_write_conflicts_total",
+    "Storage writes that lost a race with another writer and were retried", ("write",),
+)
+WRITE_FAILURES = registry.counter(
+    "icar_storage_write_failures_total",
+    "Saves abandoned after WRITE_ATTEMPTS conflicting writes",
+)
+
+
+def partition_name(user):
+    """Partition for a new user: their organization's, or their own"""
+    organization = (user.organization or "").strip()
+    if not organization:
+        return f"user-{user.id}"
+    slug = re.sub(r"[^a-z0-9]+", "-", organization.lower()).strip("-")[:40]
+    digest = hashlib.sha1(organization.encode("utf-8")).hexdigest()[:8]
+    return f"org-{slug}-{digest}"
+
+
+_fanout = None
+_fanout_pid = None
+
+
+def _fanout_pool():
+    """Per-process threads for reloading partitions in parallel (keyed on
+    the pid like the process pool, so forked workers start their own)"""
+    global _fanout, _fanout_pid
+    if _fanout is None or _fanout_pid != os.getpid():
+        _fanout = ThreadPoolExecutor(max_workers=FANOUT, thread_name_prefix="icar-storage")
+        _fanout_pid = os.getpid()
+    return _fanout
+
 
 class FileStorage:
     """Stores ICAR models as JSON file inside Azure Blob Storage"""
 
     __objects = {}  # in-memory cache of all objects
+    __aggregates = AggregateStore()  # analytics counters kept in step with __objects
+    __indexes = IndexStore()  # objects by class and indexed attribute, likewise
+    __owners = {}  # key -> Partition the object is stored in
 
     def __init__(self):
         # Load details from environment variables
@@ -38,18 +128,47 @@ class FileStorage:
             raise ValueError("AZURE_STORAGE_CONNECTION_STRING is not set.")
 
         # Initialize Azure Client
+        self.reset_clients()
+
+        # Guards the shared object maps while partitions load in parallel
+        self.lock = threading.RLock()
+        self.partitions = {}
+        self.directory = self.partition("")
+        # When find() last searched every partition for an unknown id
+        self.searched_at = float("-inf")
+        # Partition documents found in the container, and when it was listed
+        self.stored_partitions = set()
+        self.listed_at = float("-inf")
+
+        # Create the container if it doesn't exist
+        try:
+            self.container_client.create_container()
+        except Exception:
+            pass  # ignore if exists
+
+    def reset_clients(self):
+        """(Re)create the Azure clients, e.g. in a freshly forked worker
+        whose inherited HTTP connections belong to the parent process"""
         self.blob_service_client = BlobServiceClient.from_connection_string(
             self.blob_conn_str
         )
         self.container_client = self.blob_service_client.get_container_client(
             self.container_name
         )
+        for partition in getattr(self, "partitions", {}).values():
+            if partition.journal is not None:
+                partition.journal.container_client = self.container_client
 
-        # Create the container if it doesn't exist
-        try:
-            self.container_client.create_container()
-        except Exception:
-            pass  # ignore if exists
+    def partition(self, name):
+        """The Partition called name ("" is the directory document)"""
+        partition = self.partitions.get(name)
+        if partition is None:
+            with self.lock:
+                partition = self.partitions.get(name)
+                if partition is None:
+                    blob_name = f"{self.blob_name}.partition.{name}" if name else self.blob_name
+                    partition = self.partitions[name] = Partition(self, name, blob_name)
+        return partition
 
     # =======================================
     # CORE STORAGE METHODS (Same API as original)
@@ -58,6 +177,8 @@ class FileStorage:
     def all(self, cls=None):
         """Return all stored objects, or filtered by class"""
         if cls and cls in validClasses:
+            if cls is not ParentModel:
+                return dict(FileStorage.__indexes.objects(cls.__name__))
             return {
                 key: obj for key, obj in FileStorage.__objects.items()
                 if isinstance(obj, cls)
@@ -67,45 +188,159 @@ class FileStorage:
     def new(self, obj):
         """Add new object to memory"""
         key = f"{obj.__class__.__name__}.{obj.id}"
+        if isinstance(obj, Submission) and obj.generate_id:
+            # A test set may be another user's, in a partition not loaded
+            # here; load them all first, outside the lock loading takes
+            if f"Generate.{obj.generate_id}" not in FileStorage.__owners:
+                self.reload()
+        with self.lock:
+            partition = self._route(key, obj)
+            owner = FileStorage.__owners.get(key)
+            if owner is not None and owner is not partition:
+                # Moved, e.g. by move_to_partitions(): delete the old copy
+                owner.keys.pop(key, None)
+                owner.dirty[key] = None
+            self._put(key, obj, partition)
+            partition.keys[key] = None
+            partition.dirty[key] = obj
+
+    def _route(self, key, obj):
+        """Partition obj belongs in; a new user is assigned one here"""
+        if isinstance(obj, User):
+            if PARTITIONS and not obj.partition and key not in FileStorage.__objects:
+                obj.partition = partition_name(obj)
+            return self.directory
+        if isinstance(obj, Generate):
+            user = FileStorage.__objects.get(f"User.{obj.user_id}")
+            return self.partition(user.partition if user is not None else "")
+        if isinstance(obj, Submission):
+            owner = FileStorage.__owners.get(f"Generate.{obj.generate_id}")
+            return owner if owner is not None else self.directory
+        return self.directory
+
+    def _put(self, key, obj, partition):
         FileStorage.__objects[key] = obj
+        FileStorage.__aggregates.add(key, obj)
+        FileStorage.__indexes.add(key, obj)
+        FileStorage.__owners[key] = partition
+
+    def _drop(self, key, partition):
+        """Forget key unless another partition holds it now"""
+        if FileStorage.__owners.get(key, partition) is not partition:
+            return
+        FileStorage.__objects.pop(key, None)
+        FileStorage.__aggregates.remove(key)
+        FileStorage.__indexes.remove(key)
+        FileStorage.__owners.pop(key, None)
 
+    @timed("storage.save")
     def save(self):
-        """Save memory objects into Azure Blob as JSON"""
-        temp = {key: obj.to_dict() for key, obj in FileStorage.__objects.items()}
-        json_data = json.dumps(temp)
-
-        self.container_client.upload_blob(
-            name=self.blob_name,
-            data=json_data,
-            overwrite=True
-        )
+        """Write the objects saved or deleted since the last write, one
+        conditional write per partition that has any (see Partition.save).
+        The directory goes last: an object moved out of it is stored in its
+        partition before it is deleted here, so a failed save can duplicate
+        it but not lose it (reload() lets the partition's copy win). A new
+        user's partition can likewise be written without the user: reload()
+        also loads partitions no user names, found by listing the container."""
+        for partition in sorted(self.partitions.values(), key=lambda p: (not p.name, p.name)):
+            if partition.dirty:
+                partition.save()
 
+    @timed("storage.reload")
     def reload(self):
-        """Load objects from blob into memory"""
-        try:
-            blob_client = self.container_client.get_blob_client(self.blob_name)
+        """Load objects from blob into memory: the directory, then every
+        partition a user names or the container holds, in parallel
 
-            if not blob_client.exists():
-                print("Blob does not exist yet. Starting empty storage.")
-                return
+        With a shared snapshot this is usually a memory read per partition
+        (see Partition.reload).
+        """
+        self.directory.reload()
+        names = {user.partition for user in self.all(User).values() if user.partition}
+        names.update(name for name in list(self.partitions) if name)
+        names.update(self._stored_partitions())
+        partitions = [self.partition(name) for name in sorted(names)]
+        list(_fanout_pool().map(Partition.reload, partitions))
 
-            data = blob_client.download_blob().readall().decode("utf-8")
-            temp = json.loads(data)
+    def _stored_partitions(self):
+        """Names of the partition documents in the container, including any
+        whose user was never stored (a save that failed between the two);
+        listed at most once per REVALIDATE_SECONDS"""
+        now = time.monotonic()
+        if now - self.listed_at >= REVALIDATE_SECONDS:
+            self.listed_at = now
+            prefix = f"{self.blob_name}.partition."
+            try:
+                blob_names = list(self.container_client.list_blob_names(name_starts_with=prefix))
+            except Exception as e:
+                logger.warning("Could not list storage partitions: %s", e)
+            else:
+                # Journals are "<partition document>.journal.<generation>"
+                self.stored_partitions = {
+                    name[len(prefix):] for name in blob_names
+                    if name.startswith(prefix) and "." not in name[len(prefix):]
+                }
+        return self.stored_partitions
 
-            FileStorage.__objects = {}
-            for key, val in temp.items():
-                cls = classes.get(val["__class__"])
-                if cls:
-                    FileStorage.__objects[key] = cls(**val)
+    @timed("storage.reload")
+    def reload_for(self, email):
+        """Load what a user's requests need: the directory and the user's
+        own partition"""
+        self.directory.reload()
+        user = self.query(User).where(email=email).first()
+        if user is not None and user.partition:
+            self.partition(user.partition).reload()
 
-        except Exception as e:
-            print("Blob reload failed:", e)
+    def find(self, cls, id):
+        """Retrieve an object by class + id, freshly reloaded: its partition
+        if it is in memory.
+
+        An id that is not is searched for in every partition, but at most
+        once per REVALIDATE_SECONDS per worker: public routes look ids up
+        here, and requests for unknown ids must not each reload everything.
+        Between searches only partitions whose shared snapshot is fresh are
+        re-read, from memory, which still picks up what other workers of
+        the host wrote.
+        """
+        obj = self.get(cls, id)
+        owner = FileStorage.__owners.get(f"{cls.__name__}.{id}") if obj is not None else None
+        if owner is not None:
+            owner.reload()
+            return self.get(cls, id)
+        now = time.monotonic()
+        if now - self.searched_at < REVALIDATE_SECONDS:
+            for partition in list(self.partitions.values()):
+                if partition.snapshot_fresh():
+                    partition.reload()
+            return self.get(cls, id)
+        self.searched_at = now
+        self.reload()
+        return self.get(cls, id)
+
+    def move_to_partitions(self):
+        """Give users stored before partitioning a partition, and move their
+        Generates and Submissions out of the directory document"""
+        self.reload()
+        for user in list(self.all(User).values()):
+            if user.partition:
+                continue
+            user.partition = partition_name(user)
+            self.new(user)
+            for generate in user.generate:
+                submissions = generate.submission
+                self.new(generate)
+                for submission in submissions:
+                    self.new(submission)
+        self.save()
 
     def delete(self, obj=None):
         """Delete object from memory"""
         if obj:
             key = f"{obj.__class__.__name__}.{obj.id}"
-            FileStorage.__objects.pop(key, None)
+            with self.lock:
+                partition = FileStorage.__owners.get(key) or self._route(key, obj)
+                self._drop(key, partition)
+                partition.keys.pop(key, None)
+                partition.dirty[key] = None
 
     def get(self, cls, id):
         """Retrieve a single object by class + id"""
@@ -116,8 +351,23 @@ class FileStorage:
 
     def count(self, cls=None):
         """Count objects, optionally filtered by class"""
+        if cls and cls in validClasses and cls is not ParentModel:
+            return FileStorage.__aggregates.count(cls.__name__)
         return len(self.all(cls))
 
+    def aggregates(self):
+        """Analytics counters (per class, country, method, organization, day
+        and week), maintained incrementally by new/delete/reload"""
+        return FileStorage.__aggregates.snapshot()
+
+    def query(self, cls):
+        """Query builder over the objects of cls (see query.py)"""
+        return Query(self, cls)
+
+    def run_query(self, query):
+        """Iterator over a query's matches, narrowed by the indexes"""
+        return query.evaluate(FileStorage.__indexes)
+
     def check_attr_val(self, cls, attr, val):
         """Check if a class contains an object where attr == value"""
         if cls in classes.values():
@@ -130,3 +380,367 @@ class FileStorage:
         """Reload from Azure blob (for compatibility)"""
         self.reload()
 
+
+class Partition:
+    """One storage document with its journal and host snapshot
+
+    Holds the objects of `keys` for the engine, whose maps it updates under
+    engine.lock, and writes the changes made to them (`dirty`: key -> object
+    saved since the last write, or None if deleted).
+    """
+
+    def __init__(self, engine, name, blob_name):
+        self.engine = engine
+        self.name = name
+        self.blob_name = blob_name
+        self.keys = {}  # keys stored in this document, in document order
+        self.dirty = {}
+        self.snapshot = None
+        self.loaded_version = None
+        self.base_etag = None  # ETag of the document the objects were loaded from
+        self.journal = None  # BlobJournal named by that document
+        self.journal_offset = 0  # journal bytes already replayed
+        # One reload or save of the partition at a time per process
+        self.lock = threading.RLock()
+        if SHARED_SNAPSHOT and SharedSnapshot.available():
+            if SNAPSHOT_DIR:
+                directory = os.path.join(SNAPSHOT_DIR, "partitions", name) if name else SNAPSHOT_DIR
+            else:
+                directory = default_directory(
+                    engine.blob_service_client.account_name, engine.container_name, blob_name
+                )
+            try:
+                self.snapshot = SharedSnapshot(directory)
+            except OSError as e:
+                logger.warning("Shared snapshot unavailable: %s", e)
+
+    @property
+    def container_client(self):
+        return self.engine.container_client
+
+    def save(self):
+        """Write the objects saved or deleted since the last write.
+
+        With the journal that is one appended record, and the document is
+        only rewritten when the journal is compacted; without it the whole
+        document is uploaded. Either way the write only lands on top of what
+        was loaded: the record is appended only if the journal is still the
+        length read (append position), and the document is only replaced if
+        it is still the one loaded (If-Match on its ETag). A save that loses a
+        race with another worker reloads and tries again; the unwritten
+        changes are kept and re-applied over what it reloads.
+        """
+        with self.lock:
+            for attempt in range(WRITE_ATTEMPTS):
+                record = self._dirty_record()
+                if record is None:
+                    return
+                if not JOURNAL:
+                    write, written = "document", self._write_document()
+                elif self.journal is None or len(record) > journal.MAX_RECORD_BYTES:
+                    write, written = "compact", self.compact()
+                else:
+                    write, written = "append", self._append(record)
+                if written:
+                    return
+                WRITE_CONFLICTS.inc(write=write)
+                time.sleep(random.uniform(0, 0.05 * (attempt + 1)))
+                try:
+                    self._revalidate()
+                    self._catch_up()
+                except ResourceNotFoundError:
+                    # The journal was compacted away after the document was
+                    # checked; the next attempt conflicts and sees the new one
+                    pass
+            WRITE_FAILURES.inc()
+            raise RuntimeError("Storage write kept conflicting with other writers")
+
+    def _dirty_record(self):
+        """Journal record of the unwritten changes, or None if there are none"""
+        dirty = self.dirty
+        if not dirty:
+            return None
+        puts = {key: obj.to_dict() for key, obj in dirty.items() if obj is not None}
+        deletes = [key for key, obj in dirty.items() if obj is None]
+        return journal.encode(puts, deletes)
+
+    def _append(self, record):
+        """Append a record to the journal where this partition has read it
+        up to; False if another writer appended or compacted first"""
+        try:
+            offset = self.journal.append(record, self.journal_offset)
+        except Exception:
+            try:
+                sealed = self.journal.sealed()
+            except ResourceNotFoundError:
+                return False  # compacted and removed already
+            if not sealed:
+                raise
+            # Sealed by a compaction that is running or died half way;
+            # finishing it here is safe since only one document can win
+            return self.compact()
+        if offset is None:
+            return False
+        self.dirty = {}
+        self.journal_offset += len(record)
+        if self.snapshot is not None and \
+                not self.snapshot.append_journal(self.loaded_version, offset, record):
+            # Lines from other hosts came first; copy them along with ours
+            self._fetch_journal()
+        if offset + len(record) >= COMPACT_BYTES:
+            try:
+                self.compact()
+            except Exception as e:
+                # The record is stored; the next save tries again
+                logger.warning("Storage compaction failed: %s", e)
+        return True
+
+    @timed("storage.compact")
+    def compact(self):
+        """Fold the journal into a new document that names a fresh journal.
+
+        The old journal is sealed first, so no record can land after it was
+        read. The document is uploaded only if it is still the one loaded
+        (If-Match); returns False, leaving everything as it was, if another
+        writer replaced it meanwhile.
+        """
+        with self.lock:
+            old = self.journal
+            if old is not None:
+                try:
+                    old.seal()
+                except ResourceNotFoundError:
+                    return False  # another worker compacted it already
+                except Exception:
+                    pass  # already sealed
+                try:
+                    self._replay(old.read(self.journal_offset))
+                except ResourceNotFoundError:
+                    return False
+
+            fresh = journal.BlobJournal(self.container_client, journal.new_name(self.blob_name))
+            fresh.create()
+            temp = self._document()
+            temp[journal.JOURNAL_KEY] = {"name": fresh.name}
+            json_data = serialization.dumps(temp)
+            result = self._upload_if_unchanged(json_data)
+            if result is None:
+                fresh.delete()
+                return False
+
+            self.dirty = {}
+            self.journal, self.journal_offset = fresh, 0
+            self.base_etag = result.get("etag")
+            if self.snapshot is not None:
+                self.loaded_version = self.snapshot.publish(json_data, self.base_etag)
+            if old is not None:
+                try:
+                    old.delete()
+                except Exception as e:
+                    logger.warning("Could not delete compacted journal: %s", e)
+            return True
+
+    def _document(self):
+        """{key: to_dict()} of the objects stored in this document"""
+        objects = self.engine.all()
+        return {key: objects[key].to_dict() for key in list(self.keys) if key in objects}
+
+    def _write_document(self):
+        """Upload every object as the whole document (no journal); False if
+        another writer replaced the document since it was loaded"""
+        json_data = serialization.dumps(self._document())
+        result = self._upload_if_unchanged(json_data)
+        if result is None:
+            return False
+        self.dirty = {}
+        self.journal, self.journal_offset = None, 0
+        self.base_etag = result.get("etag")
+        if self.snapshot is not None:
+            # Tell the other workers; they re-read the snapshot, not the blob
+            self.loaded_version = self.snapshot.publish(json_data, self.base_etag)
+        return True
+
+    def _upload_if_unchanged(self, json_data):
+        """Upload the document only if the blob is still the one loaded, or
+        still absent if none was; None if another writer got there first"""
+        if self.base_etag:
+            conditions = {"etag": self.base_etag, "match_condition": MatchConditions.IfNotModified}
+        else:
+            conditions = {"overwrite": False}
+        try:
+            return self._upload_document(json_data, **conditions)
+        except (ResourceModifiedError, ResourceExistsError):
+            return None
+
+    def _upload_document(self, json_data, **kwargs):
+        kwargs.setdefault("overwrite", True)
+        encoding = compression.storage_encoding()
+        blob_client = self.container_client.get_blob_client(self.blob_name)
+        return blob_client.upload_blob(
+            compression.compress(json_data, encoding),
+            content_settings=ContentSettings(
+                content_type="application/json",
+                content_encoding=None if encoding == compression.IDENTITY else encoding,
+            ),
+            **kwargs,
+        )
+
+    def _load(self, data):
+        """Replace this partition's objects with those of a JSON document"""
+        temp = serialization.loads(data)
+        pointer = temp.pop(journal.JOURNAL_KEY, None)
+        objects = {}
+        for key, val in temp.items():
+            cls = classes.get(val["__class__"])
+            if cls:
+                objects[key] = cls.from_dict(val)
+
+        engine = self.engine
+        with engine.lock:
+            for key in self.keys:
+                if key not in objects:
+                    engine._drop(key, self)
+            for key, obj in objects.items():
+                engine._put(key, obj, self)
+            self.keys = dict.fromkeys(objects)
+            self._apply_dirty()
+        self.journal = journal.BlobJournal(self.container_client, pointer["name"]) if pointer else None
+        self.journal_offset = 0
+
+    def _replay(self, data):
+        """Apply the complete journal lines in data, which starts at
+        journal_offset"""
+        records, consumed = journal.decode(data)
+        engine = self.engine
+        with engine.lock:
+            for record in records:
+                for key, val in record.get("put", {}).items():
+                    cls = classes.get(val["__class__"])
+                    if cls:
+                        engine._put(key, cls.from_dict(val), self)
+                        self.keys[key] = None
+                for key in record.get("delete", []):
+                    engine._drop(key, self)
+                    self.keys.pop(key, None)
+            if records:
+                self._apply_dirty()
+        self.journal_offset += consumed
+
+    def _apply_dirty(self):
+        """Put unwritten changes back over freshly loaded objects"""
+        for key, obj in self.dirty.items():
+            if obj is None:
+                self.engine._drop(key, self)
+                self.keys.pop(key, None)
+            else:
+                self.engine._put(key, obj, self)
+                self.keys[key] = None
+
+    def _load_snapshot(self):
+        """Load the shared snapshot unless it is the version already in memory"""
+        if self.snapshot.version() == self.loaded_version:
+            return
+        version, data, meta = self.snapshot.read()
+        if data is not None:
+            self._load(data)
+            self.loaded_version = version
+            self.base_etag = meta.get("etag")
+
+    def _fetch_journal(self):
+        """Copy journal lines this host has not seen from the blob into the
+        shared snapshot"""
+        if self.journal is None:
+            return
+        size = self.snapshot.journal_size(self.loaded_version)
+        if size is None:
+            return
+        data = self.journal.read(size)
+        data = data[:data.rfind(b"\n") + 1]
+        if data:
+            self.snapshot.append_journal(self.loaded_version, size, data)
+
+    def _catch_up(self):
+        """Replay the journal lines not applied yet"""
+        if self.journal is None:
+            return
+        if self.snapshot is None:
+            self._replay(self.journal.read(self.journal_offset))
+            return
+        data = self.snapshot.read_journal(self.loaded_version, self.journal_offset)
+        if data is None:
+            # Another worker replaced the document meanwhile
+            self._load_snapshot()
+            data = self.snapshot.read_journal(self.loaded_version, self.journal_offset) or b""
+        if self.journal is not None:
+            self._replay(data)
+
+    def snapshot_fresh(self):
+        """Whether reload() only reads the shared snapshot, without a blob call"""
+        snapshot = self.snapshot
+        return bool(snapshot is not None and snapshot.version() and
+                    snapshot.checked_within(REVALIDATE_SECONDS))
+
+    def reload(self):
+        """Bring this partition's objects up to date
+
+        With a shared snapshot this is usually a memory read: the objects are
+        only re-parsed when another worker published a new document, journal
+        lines are replayed from the host's copy, and the blob is only
+        contacted (an ETag check and a read of new journal lines, or a
+        download when the document changed) once every REVALIDATE_SECONDS per
+        host.
+        """
+        try:
+            with self.lock:
+                if self.snapshot_fresh():
+                    self._load_snapshot()
+                else:
+                    self._revalidate()
+                self._catch_up()
+
+        except Exception as e:
+            logger.warning("Blob reload failed: %s", e)
+
+    def _revalidate(self):
+        """Compare the loaded document with the blob, downloading it if it
+        changed, and bring the host's journal copy up to date"""
+        snapshot = self.snapshot
+        blob_client = self.container_client.get_blob_client(self.blob_name)
+
+        if snapshot is not None and snapshot.version():
+            etag = snapshot.meta().get("etag")
+        else:
+            etag = self.base_etag
+        if etag and blob_client.get_blob_properties().etag == etag:
+            if snapshot is not None:
+                snapshot.mark_checked()
+                self._load_snapshot()
+                self._fetch_journal()
+            return
+
+        seen_version = snapshot.version() if snapshot is not None else None
+        if not blob_client.exists():
+            if not self.name:
+                logger.info("Blob does not exist yet. Starting empty storage.")
+            elif snapshot is not None and not etag:
+                # Nothing stored in this partition yet; record that for the
+                # host so its workers only look again after REVALIDATE_SECONDS
+                version = snapshot.publish(b"{}", None, seen_version)
+                if version is not None:
+                    self.loaded_version = version
+            return
+
+        # Decoded here rather than by the SDK, which would decompress
+        # each ranged chunk of a large blob on its own
+        download = blob_client.download_blob(decompress=False)
+        data = compression.decode(download.readall())
+        self._load(data)
+        self.base_etag = download.properties.etag
+        if snapshot is not None:
+            version = snapshot.publish(data, self.base_etag, seen_version)
+            if version is None:
+                # A newer write was published meanwhile
+                self._load_snapshot()
+            else:
+                self.loaded_version = version
+            self._fetch_journal()
@@ -1,6 +1,9 @@
 #!/usr/bin/python3
 """This module defines a class to manage file storage for hbnb clone"""
 import json
+from models.engine.aggregates import AggregateStore
+from models.engine.indexes import IndexStore
+from models.engine.query import Query
 from models.parent_model import ParentModel
 from models.user import User
 from models.submission import Submission
@@ -16,6 +19,8 @@ class FileStorage:
     """This class manages storage of hbnb models in JSON format"""
     __file_path = 'file.json'
     __objects = {}
+    __aggregates = AggregateStore()
+    __indexes = IndexStore()
 
     def all(self, cls=None):
         """Returns a dictionary of models of either one type or
@@ -31,7 +36,10 @@ class FileStorage:
 
     def new(self, obj):
         """Adds new object to storage dictionary"""
-        self.all().update({obj.to_dict()['__class__'] + '.' + obj.id: obj})
+        key = obj.to_dict()['__class__'] + '.' + obj.id
+        self.all().update({key: obj})
+        FileStorage.__aggregates.add(key, obj)
+        FileStorage.__indexes.add(key, obj)
 
     def save(self):
         """Saves storage dictionary to file"""
@@ -54,7 +62,9 @@ class FileStorage:
             with open(FileStorage.__file_path, 'r') as f:
                 temp = json.load(f)
                 for key, val in temp.items():
-                    self.all()[key] = classes[val['__class__']](**val)
+                    self.all()[key] = classes[val["__class__"]].from_dict(val)
+            FileStorage.__aggregates.rebuild(FileStorage.__objects)
+            FileStorage.__indexes.rebuild(FileStorage.__objects)
         except Exception:
             pass
 
@@ -64,6 +74,8 @@ class FileStorage:
             key = "{}.{}".format(obj.__class__.__name__, obj.id)
             if FileStorage.__objects.get(key):
                 del FileStorage.__objects[key]
+            FileStorage.__aggregates.remove(key)
+            FileStorage.__indexes.remove(key)
 
     def get(self, cls, id):
         """retrieve an object with the specified cls and id"""
@@ -91,6 +103,30 @@ class FileStorage:
             count += 1
         return count
 
+    def aggregates(self):
+        """return the incrementally maintained analytics counters"""
+        return FileStorage.__aggregates.snapshot()
+
+    def query(self, cls):
+        """query builder over the objects of cls (see query.py)"""
+        return Query(self, cls)
+
+    def run_query(self, query):
+        """iterate over a query's matches, narrowed by the indexes"""
+        return query.evaluate(FileStorage.__indexes)
+
+    def reset_clients(self):
+        """nothing to reconnect for a local file"""
+
+    def reload_for(self, email):
+        """one file holds every user's objects: reload all of it"""
+        self.reload()
+
+    def find(self, cls, id):
+        """retrieve an object by cls and id after reloading the file"""
+        self.reload()
+        return self.get(cls, id)
+
     def check_attr_val(self, cls, attr, val):
         """check if the attribute value is in the database"""
         if cls in classes.values():
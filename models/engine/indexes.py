@@ -0,0 +1,94 @@
+#!/usr/bin/python3
+"""Secondary indexes over the objects held in storage"""
+
+# Attributes looked up by equality often enough to keep an index on
+INDEXED = {
+    "User": ("email",),
+    "Generate": ("user_id",),
+    "Submission": ("generate_id", "country", "calculation_method", "organization"),
+}
+
+
+class IndexStore:
+    """Objects by class, and by value of each INDEXED attribute
+
+    Kept in step with storage like AggregateStore: every key remembers the
+    buckets it was filed under, so re-saving a modified object moves it to
+    its new ones. Buckets map key -> object in insertion order, the order
+    of the storage dict itself.
+    """
+
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        self.by_class = {}  # cls_name -> {key: obj}
+        self.by_value = {}  # (cls_name, attr) -> {value: {key: obj}}
+        self._entries = {}  # key -> (cls_name, ((attr, value), ...))
+
+    def add(self, key, obj):
+        """File obj under key, moving it out of buckets it no longer
+        belongs to; a re-saved object keeps its place in the others"""
+        cls_name = obj.__class__.__name__
+        values = []
+        for attr in INDEXED.get(cls_name, ()):
+            value = getattr(obj, attr, None)
+            try:
+                hash(value)
+            except TypeError:
+                continue  # unhashable, e.g. a list; found by scanning instead
+            values.append((attr, value))
+
+        old = self._entries.get(key)
+        if old is not None:
+            old_cls_name, old_values = old
+            if old_cls_name != cls_name:
+                _discard(self.by_class, old_cls_name, key)
+            for attr, value in old_values:
+                if old_cls_name != cls_name or (attr, value) not in values:
+                    _discard(self.by_value.get((old_cls_name, attr), {}), value, key)
+
+        self.by_class.setdefault(cls_name, {})[key] = obj
+        for attr, value in values:
+            self.by_value.setdefault((cls_name, attr), {}).setdefault(value, {})[key] = obj
+        self._entries[key] = (cls_name, tuple(values))
+
+    def remove(self, key):
+        """Drop key from every bucket it was filed under"""
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        cls_name, values = entry
+        _discard(self.by_class, cls_name, key)
+        for attr, value in values:
+            _discard(self.by_value.get((cls_name, attr), {}), value, key)
+
+    def rebuild(self, objects):
+        """Refile everything from a {key: obj} mapping"""
+        self.clear()
+        for key, obj in objects.items():
+            self.add(key, obj)
+
+    def indexed(self, cls_name, attr):
+        return attr in INDEXED.get(cls_name, ())
+
+    def objects(self, cls_name):
+        """{key: obj} of one class"""
+        return self.by_class.get(cls_name, {})
+
+    def lookup(self, cls_name, attr, value):
+        """{key: obj} of one class whose indexed attr equals value, or None
+        if value cannot be looked up (unhashable)"""
+        try:
+            return self.by_value.get((cls_name, attr), {}).get(value, {})
+        except TypeError:
+            return None
+
+
+def _discard(buckets, bucket_key, key):
+    """Remove key from buckets[bucket_key], dropping the bucket once empty"""
+    bucket = buckets.get(bucket_key)
+    if bucket is not None:
+        bucket.pop(key, None)
+        if not bucket:
+            del buckets[bucket_key]
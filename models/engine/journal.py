@@ -0,0 +1,97 @@
+#!/usr/bin/python3
+"""Append-only journal of storage mutations
+
+With journaling on, the storage blob holds a compacted document and every
+save appends one record to an append blob that the document names:
+
+    db.json                 {"User.<id>": {...}, ..., "__journal__": {"name": "db.json.journal.<gen>"}}
+    db.json.journal.<gen>   one JSON line per save: {"put": {key: attrs}, "delete": [key, ...]}
+
+A record is a single append block, so it lands whole or not at all. Loading
+the document and replaying the lines after it in order gives the same
+objects in every worker and after a crash at any point; a save either
+happened completely or not at all.
+
+Appends are conditional on the journal's length (append position), so a
+record is only added by a writer that has applied every record before it;
+one that lost the race catches up and re-applies its changes first.
+
+Compaction seals the journal so nothing more can be appended, folds it into
+a new document naming a fresh journal, and uploads that document only if
+the old one is unchanged (If-Match). Writers that find the journal sealed
+reload and append to the new one.
+"""
+
+import time
+import uuid
+
+from azure.core.exceptions import HttpResponseError
+
+from api.v1.utils import serialization
+
+JOURNAL_KEY = "__journal__"
+# Largest append block the service accepts
+MAX_RECORD_BYTES = 4 * 1024 * 1024
+
+
+def encode(puts, deletes):
+    """One journal line: objects written ({key: to_dict()}) and keys deleted"""
+    return serialization.dumps({"put": puts, "delete": deletes}) + b"\n"
+
+
+def decode(data):
+    """(records, bytes consumed) of the complete lines in data; a trailing
+    partial line is left for the next read"""
+    end = data.rfind(b"\n") + 1
+    records = [serialization.loads(line) for line in data[:end].splitlines() if line.strip()]
+    return records, end
+
+
+def new_name(blob_name):
+    """Name for a fresh journal generation of blob_name"""
+    return f"{blob_name}.journal.{time.strftime('%Y%m%dT%H%M%S')}-{uuid.uuid4().hex[:8]}"
+
+
+class BlobJournal:
+    """An append blob holding journal lines"""
+
+    def __init__(self, container_client, name):
+        self.container_client = container_client
+        self.name = name
+
+    @property
+    def client(self):
+        return self.container_client.get_blob_client(self.name)
+
+    def create(self):
+        self.client.create_append_blob()
+
+    def append(self, record, position):
+        """Append one encoded record if the journal is still position bytes
+        long, i.e. the writer has applied every record before it; returns the
+        offset it was written at, or None if another record landed first"""
+        try:
+            result = self.client.append_block(record, appendpos_condition=position)
+        except HttpResponseError as e:
+            if e.status_code == 412:  # AppendPositionConditionNotMet
+                return None
+            raise
+        return int(result["blob_append_offset"])
+
+    def read(self, offset=0):
+        """Bytes from offset to the end of the journal"""
+        try:
+            return self.client.download_blob(offset=offset, decompress=False).readall()
+        except HttpResponseError as e:
+            if e.status_code == 416:  # offset is already the end
+                return b""
+            raise
+
+    def sealed(self):
+        return bool(getattr(self.client.get_blob_properties(), "is_append_blob_sealed", False))
+
+    def seal(self):
+        self.client.seal_append_blob()
+
+    def delete(self):
+        self.client.delete_blob()
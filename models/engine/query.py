@@ -0,0 +1,98 @@
+#!/usr/bin/python3
+"""Query builder over the storage engine
+
+    storage.query(Submission).where(country="NL").order_by("created_at").limit(50)
+
+Nothing runs until the query is iterated. Each builder call returns a new
+query, so a partial one can be reused. The engine decides how to run it
+(run_query()): the blob and file engines narrow the candidates with their
+indexes (see indexes.py) and yield matches one at a time. An engine backed
+by a database would translate cls, filters, ordering and limit_count into
+its own query instead.
+"""
+
+import heapq
+from itertools import islice
+
+
+class Query:
+    """Objects of exactly one class that match every condition"""
+
+    def __init__(self, engine, cls):
+        self.engine = engine
+        self.cls = cls
+        self.filters = {}  # attr -> value the attribute must equal
+        self.predicates = []  # callables obj -> bool
+        self.ordering = None  # (attr, reverse)
+        self.limit_count = None
+
+    def _derive(self, **changes):
+        query = Query(self.engine, self.cls)
+        query.filters = dict(self.filters)
+        query.predicates = list(self.predicates)
+        query.ordering, query.limit_count = self.ordering, self.limit_count
+        for attr, value in changes.items():
+            setattr(query, attr, value)
+        return query
+
+    def where(self, *predicates, **equals):
+        """Keep objects whose attributes equal the keyword values and for
+        which every predicate returns true"""
+        return self._derive(filters={**self.filters, **equals},
+                            predicates=self.predicates + list(predicates))
+
+    def order_by(self, attr, reverse=False):
+        """Sort by an attribute; objects without it (None) come last"""
+        return self._derive(ordering=(attr, reverse))
+
+    def limit(self, count):
+        return self._derive(limit_count=count)
+
+    def __iter__(self):
+        return iter(self.engine.run_query(self))
+
+    def first(self):
+        """The first match, or None"""
+        return next(iter(self.limit(1)), None)
+
+    def count(self):
+        return sum(1 for _ in self)
+
+    # =======================================
+    # EVALUATION (engines without pushdown)
+    # =======================================
+
+    def evaluate(self, indexes):
+        """Iterator over the matches, using an IndexStore for candidates"""
+        matches = filter(self._matches, self._candidates(indexes))
+        if self.ordering is None:
+            return islice(matches, self.limit_count)
+        attr, reverse = self.ordering
+
+        def key(obj):
+            value = getattr(obj, attr, None)
+            return (value is None) != reverse, value
+
+        if self.limit_count is None:
+            return iter(sorted(matches, key=key, reverse=reverse))
+        # Keeps only limit_count objects while scanning; same order as sorted()
+        select = heapq.nlargest if reverse else heapq.nsmallest
+        return iter(select(self.limit_count, matches, key=key))
+
+    def _candidates(self, indexes):
+        """The smallest index bucket among the indexed filters, or every
+        object of the class. A snapshot of references, so saving while
+        iterating is safe."""
+        cls_name = self.cls.__name__
+        buckets = [indexes.lookup(cls_name, attr, value)
+                   for attr, value in self.filters.items() if indexes.indexed(cls_name, attr)]
+        buckets = [bucket for bucket in buckets if bucket is not None]
+        if buckets:
+            return tuple(min(buckets, key=len).values())
+        return tuple(indexes.objects(cls_name).values())
+
+    def _matches(self, obj):
+        for attr, value in self.filters.items():
+            if getattr(obj, attr, None) != value:
+                return False
+        return all(predicate(obj) for predicate in self.predicates)
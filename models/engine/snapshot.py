@@ -0,0 +1,175 @@
+#!/usr/bin/python3
+"""Host-local copy of the storage document shared by all worker processes
+
+The snapshot lives in a directory on /dev/shm (tmpfs) and consists of:
+    header    version counter and time of the last blob check, mmap'd by
+              every process
+    data      the JSON document as last read from or written to the blob
+    meta      JSON with the blob ETag of `data`
+    journal   journal lines appended since `data` (see journal.py), a
+              byte-for-byte prefix of the document's journal blob
+
+A worker that writes the blob (or downloads a newer one) replaces `data`
+and `meta` and bumps `version` under an exclusive flock. Other workers
+compare the mmap'd counter with the version they loaded - a memory read -
+and only re-parse `data` when it moved, instead of downloading the blob.
+The shared check time lets one worker revalidate the blob for all of them.
+Journal lines written by any worker of the host are appended locally too,
+so the others replay them from here without contacting the blob.
+"""
+
+import hashlib
+import json
+import mmap
+import os
+import struct
+import tempfile
+import time
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows: no shared snapshot
+    fcntl = None
+
+# version (uint64), checked_at (float64 unix time)
+_HEADER = struct.Struct("<Qd")
+
+
+def default_directory(*parts):
+    """Per-blob directory on /dev/shm (or the temp dir when there is none)"""
+    base = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+    key = hashlib.sha1("|".join(str(p) for p in parts).encode()).hexdigest()[:16]
+    return os.path.join(base, f"icar-storage-{key}")
+
+
+class SharedSnapshot:
+    """Versioned document shared by the processes of one host"""
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self._data_path = os.path.join(directory, "data")
+        self._meta_path = os.path.join(directory, "meta")
+        self._lock_path = os.path.join(directory, "lock")
+        self._journal_path = os.path.join(directory, "journal")
+        header_path = os.path.join(directory, "header")
+        with self.locked():
+            if not os.path.exists(header_path) or os.path.getsize(header_path) < _HEADER.size:
+                with open(header_path, "wb") as f:
+                    f.write(_HEADER.pack(0, 0.0))
+        with open(header_path, "r+b") as f:
+            self._header = mmap.mmap(f.fileno(), _HEADER.size)
+
+    @classmethod
+    def available(cls):
+        return fcntl is not None
+
+    @contextmanager
+    def locked(self):
+        """Exclusive lock across processes"""
+        with open(self._lock_path, "a") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def version(self):
+        """Current version; 0 means nothing has been published yet"""
+        return _HEADER.unpack_from(self._header)[0]
+
+    def meta(self):
+        try:
+            with open(self._meta_path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def read(self):
+        """Return (version, data bytes, meta) of a consistent snapshot"""
+        with self.locked():
+            version = self.version()
+            if not version:
+                return 0, None, {}
+            with open(self._data_path, "rb") as f:
+                data = f.read()
+            return version, data, self.meta()
+
+    def _write(self, path, data):
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+
+    def publish(self, data, etag=None, expected_version=None):
+        """Replace the document and bump the version; returns the new version.
+
+        With expected_version, nothing is written (and None is returned) if
+        another process published since that version was read - e.g. a write
+        that landed while `data` was being downloaded.
+        """
+        with self.locked():
+            if expected_version is not None and self.version() != expected_version:
+                return None
+            self._write(self._data_path, data)
+            self._write(self._meta_path, json.dumps({"etag": etag}).encode())
+            self._write(self._journal_path, b"")
+            version = self.version() + 1
+            _HEADER.pack_into(self._header, 0, version, time.time())
+        return version
+
+    def mark_checked(self):
+        """Record that the blob was revalidated and still matches"""
+        with self.locked():
+            _HEADER.pack_into(self._header, 0, self.version(), time.time())
+
+    def checked_within(self, seconds):
+        """True if some process compared the snapshot with the blob recently"""
+        return time.time() - _HEADER.unpack_from(self._header)[1] < seconds
+
+    # Journal lines of the current version. Every call names the version the
+    # caller loaded, and gets None if `data` was replaced since.
+
+    def _journal_size(self):
+        """Size of the journal, dropping a line torn by a crashed writer"""
+        try:
+            size = os.path.getsize(self._journal_path)
+        except OSError:
+            return 0
+        if size:
+            with open(self._journal_path, "r+b") as f:
+                f.seek(size - 1)
+                if f.read(1) != b"\n":
+                    f.seek(0)
+                    size = f.read().rfind(b"\n") + 1
+                    f.truncate(size)
+        return size
+
+    def journal_size(self, version):
+        with self.locked():
+            if self.version() != version:
+                return None
+            return self._journal_size()
+
+    def read_journal(self, version, offset=0):
+        """Journal bytes from offset on"""
+        with self.locked():
+            if self.version() != version:
+                return None
+            try:
+                with open(self._journal_path, "rb") as f:
+                    f.seek(offset)
+                    return f.read()
+            except OSError:
+                return b""
+
+    def append_journal(self, version, offset, data):
+        """Append lines that start at `offset` of the journal blob; False if
+        the local copy does not end exactly there"""
+        with self.locked():
+            if self.version() != version or self._journal_size() != offset:
+                return False
+            with open(self._journal_path, "ab") as f:
+                f.write(data)
+            return True
@@ -7,11 +7,14 @@ import os
 class Generate(ParentModel):
     """Submission class for ICAR project"""
 
-    user_id = ""
-    download_url = ""
-    parity = []
-    test_obj_ids = []
-    calculated_milk_yields = []
+    FIELDS = {
+        "user_id": str,
+        "download_url": str,
+        "parity": list,
+        "test_obj_ids": list,
+        "calculated_milk_yields": list,
+    }
+    __slots__ = tuple(FIELDS)
 
     @property
     def submission(self):
@@ -19,9 +22,4 @@ class Generate(ParentModel):
         from models.submission import Submission
         """returns a list of Submission objects"""
         
-        submission_objs = storage.all(Submission)
-        list_submission = []
-        for obj in submission_objs.values():
-            if obj.generate_id == self.id:
-                list_submission.append(obj)
-        return list_submission
\ No newline at end of file
+        return list(storage.query(Submission).where(generate_id=self.id))
\ No newline at end of file
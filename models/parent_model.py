@@ -5,6 +5,7 @@
 
 import datetime
 import uuid
+from operator import attrgetter
 import models
 
 
@@ -16,44 +17,86 @@ class ParentModel():
             created_at: the time when the object was created
             update_at: the time when the object was updated
 
+        Fields are declared per class in FIELDS ({name: type}) and stored in
+        slots; an object starts with each type's empty value ("" or a fresh
+        []). Keys a stored document has beyond the schema are kept aside
+        and written back by to_dict().
+
         Instance methods:
             to_dict(): convert an object to a dictionary
+            from_dict(): build an object from to_dict() output
             save(): save the object to the storage engine
             __str__: string implementation of an object
             save: save an object to a file
     """
 
+    FIELDS = {"id": str, "created_at": datetime.datetime, "updated_at": datetime.datetime}
+    __slots__ = ("id", "created_at", "updated_at", "_extra")
+
+    _field_names = tuple(FIELDS)
+    _known_keys = frozenset(FIELDS) | {"__class__"}
+    _defaults = ()
+    _get_fields = attrgetter(*_field_names)
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        schema = {}
+        for klass in reversed(cls.__mro__):
+            schema.update(klass.__dict__.get("FIELDS", {}))
+        cls._field_names = tuple(schema)
+        cls._known_keys = frozenset(schema) | {"__class__"}
+        cls._defaults = tuple((name, kind) for name, kind in schema.items()
+                              if name not in ParentModel.FIELDS)
+        cls._get_fields = attrgetter(*cls._field_names)
+
     def __init__(self, *arg, **kwargs):
         """init constructor of an object"""
         if kwargs:
-            for key, value in kwargs.items():
-                if key in ["created_at", "updated_at"]:
-                    try:
-                        value = datetime.datetime.fromisoformat(value)
-                    except Exception:
-                        self.created_at = datetime.datetime.now()
-                        self.updated_at = self.created_at
-                if key not in ["__class__"]:
-                    setattr(self, key, value)
+            self._load(kwargs)
         else:
             # if no kwargs, set default values
+            for name, kind in self._defaults:
+                setattr(self, name, kind())
             self.id = str(uuid.uuid4())
             self.created_at = datetime.datetime.now()
             self.updated_at = self.created_at
+            self._extra = None
+
+    @classmethod
+    def from_dict(cls, data):
+        """Object of cls from a to_dict() mapping, without going through
+        __init__"""
+        obj = cls.__new__(cls)
+        obj._load(data)
+        return obj
+
+    def _load(self, data):
+        for name, kind in self._defaults:
+            setattr(self, name, data[name] if name in data else kind())
+        self.id = data["id"] if "id" in data else str(uuid.uuid4())
+        self.created_at = _timestamp(data.get("created_at"))
+        self.updated_at = _timestamp(data.get("updated_at"), self.created_at)
+        extra_keys = data.keys() - self._known_keys
+        self._extra = {key: data[key] for key in extra_keys} if extra_keys else None
+
+    def _attributes(self):
+        """{name: value} of the fields, then of any keys beyond the schema"""
+        attributes = dict(zip(self._field_names, self._get_fields(self)))
+        if self._extra:
+            attributes.update(self._extra)
+        return attributes
 
     def __str__(self):
         """return the string implementation of an instance"""
         cls_name = self.__class__.__name__
-        dict_copy = self.__dict__.copy()
-        return '[{}] ({}) {}'.format(cls_name, self.id, dict_copy)
+        return '[{}] ({}) {}'.format(cls_name, self.id, self._attributes())
 
     def to_dict(self):
         """convert an instance of ParentModel to a dictionary
             object
         """
-        dict_attr = self.__dict__.copy()
-        obj_class_name = str(self.__class__.__name__)
-        dict_attr.update({"__class__": obj_class_name})
+        dict_attr = self._attributes()
+        dict_attr["__class__"] = self.__class__.__name__
         dict_attr["created_at"] = self.created_at.isoformat()
         dict_attr["updated_at"] = self.updated_at.isoformat()
         return dict_attr
@@ -63,3 +106,17 @@ class ParentModel():
         self.updated_at = datetime.datetime.now()
         models.storage.new(self)
         models.storage.save()
+
+
+def _timestamp(value, default=None):
+    """datetime of a stored ISO timestamp; now (or default) if missing, and
+    the value unchanged if it does not parse"""
+    if value is None:
+        return default or datetime.datetime.now()
+    if isinstance(value, str):
+        try:
+            return datetime.datetime.fromisoformat(value)
+        except ValueError:
+            pass
+    return value
+
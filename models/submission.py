@@ -7,11 +7,14 @@ import os
 class Submission(ParentModel):
     """Submission class for ICAR project"""
 
-    calculation_method = ""
-    organization = ""
-    country = ""
-    generate_id = ""
-    notes = ""
-    download_url = ""
-    test_obj_ids = []
-    calculated_milk_yields = []
+    FIELDS = {
+        "calculation_method": str,
+        "organization": str,
+        "country": str,
+        "generate_id": str,
+        "notes": str,
+        "download_url": str,
+        "test_obj_ids": list,
+        "calculated_milk_yields": list,
+    }
+    __slots__ = tuple(FIELDS)
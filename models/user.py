@@ -7,11 +7,13 @@ import os
 class User(ParentModel):
     """ 
     """
-    def __init__(self, *args, **kwargs):
-        self.organization = ""
-        self.name = ""
-        self.email = ""
-        super().__init__(*args, **kwargs)
+    FIELDS = {
+        "organization": str,
+        "name": str,
+        "email": str,
+        "partition": str,  # storage partition of the user's data
+    }
+    __slots__ = tuple(FIELDS)
 
     @property
     def generate(self):
@@ -19,9 +21,4 @@ class User(ParentModel):
         from models.generate import Generate
         """returns a list of Generate objects"""
 
-        generate_objs = storage.all(Generate)
-        list_generate = []
-        for obj in generate_objs.values():
-            if obj.user_id == self.id:
-                list_generate.append(obj)
-        return list_generate
\ No newline at end of file
+        return list(storage.query(Generate).where(user_id=self.id))
\ No newline at end of file